@@ -2,12 +2,22 @@
 
 import os
 import json
+import time
+import base64
+import hashlib
+import threading
 import requests
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from datetime import datetime, timedelta
 from github import Github
-import re
 import sys
 
+# ボットと同じエントリの解析処理を使う
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..')))
+from src.utils.diary_entry import parse_entry
+
 # 環境変数から情報を取得
 GITHUB_TOKEN = os.environ.get("GITHUB_TOKEN")
 CLAUDE_API_KEY = os.environ.get("CLAUDE_API_KEY")
@@ -34,9 +44,36 @@ if not DISCORD_WEBHOOK_URL.startswith(('http://', 'https://')):
     print(f"エラー: DISCORD_WEBHOOK_URL の形式が正しくありません: {DISCORD_WEBHOOK_URL}")
     sys.exit(1)
 
-# GitHubクライアントの初期化
+# HTTPのタイムアウト（秒）と再試行回数
+HTTP_TIMEOUT = 30
+HTTP_RETRIES = 3
+
+# Claude API・Discordへの送信はキープアライブの接続を使い回す
+http = requests.Session()
+
+# Claude APIへの同時リクエスト数
+REVIEW_CONCURRENCY = int(os.environ.get("REVIEW_CONCURRENCY", "4"))
+# Discordウェブフックの送信間隔（秒）と429時の再試行回数
+WEBHOOK_INTERVAL = float(os.environ.get("WEBHOOK_INTERVAL", "1.0"))
+WEBHOOK_RETRIES = 5
+
+# 処理段階ごとの所要時間（秒）
+stage_times = defaultdict(float)
+stage_lock = threading.Lock()
+
+@contextmanager
+def timed(stage):
+    """処理段階の所要時間を記録する"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        with stage_lock:
+            stage_times[stage] += time.perf_counter() - started
+
+# GitHubクライアントの初期化（リポジトリはここで一度だけ取得して使い回す）
 try:
-    g = Github(GITHUB_TOKEN)
+    g = Github(GITHUB_TOKEN, timeout=HTTP_TIMEOUT, retry=HTTP_RETRIES)
     repo = g.get_repo(REPO_NAME)
     print(f"リポジトリの情報: {repo.full_name}")
 except Exception as e:
@@ -48,60 +85,153 @@ today = datetime.now()
 yesterday = today - timedelta(days=1)
 yesterday_str = yesterday.strftime('%Y-%m-%d')
 
+# レビューの進捗（最後にレビューしたコミットSHA）の保存先。GitHub Actionsのキャッシュで引き継ぐ
+REVIEW_STATE_DIR = os.environ.get("REVIEW_STATE_DIR", ".review_state")
+WATERMARK_PATH = os.path.join(REVIEW_STATE_DIR, "watermark.json")
+
+# compare APIが返すファイル数の上限（これ以上の差分はツリーから探す）
+COMPARE_FILE_LIMIT = 300
+
+def load_watermark():
+    """前回レビューしたコミットSHAを読み込む"""
+    try:
+        with open(WATERMARK_PATH, encoding='utf-8') as f:
+            return json.load(f).get("commit_sha")
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"ウォーターマークの読み込みエラー: {e}")
+        return None
+
+def save_watermark(commit_sha):
+    """レビューを終えたコミットSHAを保存する"""
+    os.makedirs(REVIEW_STATE_DIR, exist_ok=True)
+    with open(WATERMARK_PATH, 'w', encoding='utf-8') as f:
+        json.dump({"commit_sha": commit_sha, "updated_at": datetime.now().isoformat()}, f)
+
+def is_entry_path(path):
+    """diary/日付/ファイル名.md 形式のパスか判定する"""
+    parts = path.split('/')
+    return len(parts) == 3 and parts[0] == "diary" and parts[2].endswith('.md')
+
+def list_entries_since(date_str):
+    """ツリーを1回で取得し、指定した日付以降のエントリのパスとblob SHAを返す"""
+    tree = repo.get_git_tree(repo.default_branch, recursive=True)
+    return {
+        element.path: element.sha
+        for element in tree.tree
+        if element.type == "blob" and is_entry_path(element.path) and element.path.split('/')[1] >= date_str
+    }
+
 def get_new_entries():
-    """昨日追加された新しい日記エントリを取得"""
-    new_entries = []
-    
+    """前回レビューしたコミット以降に追加・更新された日記エントリを取得
+
+    戻り値は (エントリのリスト, 今回のレビュー対象の先頭コミットSHA)。
+    """
     try:
-        # リポジトリ情報を出力
-        print(f"リポジトリ名: {REPO_NAME}")
-        print(f"昨日の日付: {yesterday_str}")
-        
-        # リポジトリ内の全ファイルを出力して構造を確認
-        try:
-            root_contents = repo.get_contents("")
-            print("リポジトリルートの内容:")
-            for item in root_contents:
-                print(f" - {item.type}: {item.path}")
-                
-                # diaryフォルダを見つけたら中身も確認
-                if item.name == "diary" and item.type == "dir":
-                    diary_contents = repo.get_contents(item.path)
-                    print(f"   diaryフォルダの内容:")
-                    for diary_item in diary_contents:
-                        print(f"    - {diary_item.type}: {diary_item.path}")
-                        
-                        # 昨日の日付フォルダがあればその中身も確認
-                        if yesterday_str in diary_item.path and diary_item.type == "dir":
-                            day_contents = repo.get_contents(diary_item.path)
-                            print(f"     {yesterday_str}フォルダの内容:")
-                            for day_item in day_contents:
-                                print(f"      - {day_item.type}: {day_item.path}")
-                                
-                                # マークダウンファイルを見つけたら追加
-                                if day_item.path.endswith('.md'):
-                                    file_content = day_item.decoded_content.decode('utf-8')
-                                    new_entries.append({
-                                        "path": day_item.path,
-                                        "content": file_content
-                                    })
-        except Exception as e:
-            print(f"リポジトリ構造探索エラー: {e}")
-        
-        return new_entries
+        head_sha = repo.get_git_ref(f"heads/{repo.default_branch}").object.sha
+        watermark = load_watermark()
+        print(f"前回レビューしたコミット: {watermark or 'なし'} / 最新のコミット: {head_sha}")
+        
+        if watermark == head_sha:
+            return [], head_sha
+        
+        changed = None
+        if watermark:
+            try:
+                # 前回からの差分に含まれるエントリだけを対象にする
+                comparison = repo.compare(watermark, head_sha)
+                if len(comparison.files) < COMPARE_FILE_LIMIT:
+                    changed = {
+                        file.filename: file.sha
+                        for file in comparison.files
+                        if file.status != 'removed' and is_entry_path(file.filename)
+                    }
+                else:
+                    # 差分が大きすぎる場合は前回のコミット日以降のエントリをツリーから探す
+                    since = repo.get_git_commit(watermark).committer.date.strftime('%Y-%m-%d')
+                    changed = list_entries_since(since)
+            except Exception as e:
+                print(f"差分の取得エラー: {e}")
+        
+        if changed is None:
+            # 初回（またはウォーターマークが使えない場合）は昨日以降のエントリを対象にする
+            changed = list_entries_since(yesterday_str)
+        
+        print(f"変更のあったエントリ: {len(changed)}件")
+        
+        # 変更のあったファイルの内容だけ取得
+        new_entries = []
+        for path, blob_sha in sorted(changed.items()):
+            blob = repo.get_git_blob(blob_sha)
+            new_entries.append({
+                "path": path,
+                "sha": blob_sha,
+                "content": base64.b64decode(blob.content).decode('utf-8')
+            })
+        
+        return new_entries, head_sha
     except Exception as e:
         print(f"エントリ取得エラー: {e}")
-        return []
+        return [], None
+
+# レビューに使うモデルとプロンプト（変更したらPROMPT_VERSIONを上げると再レビューされる）
+REVIEW_MODEL = "claude-3-opus-20240229"
+PROMPT_VERSION = "1"
+REVIEW_PROMPT = """以下は日記の内容です。この日記に対して、以下の観点からポジティブなレビューとアドバイスを短く（100〜200文字程度）提供してください：
+
+1. 良かった点を1つ挙げる
+2. もっと詳しく知りたい点を1つ挙げる
+3. 文章の流れについてのアドバイス
+
+日記の内容：
+{diary_text}"""
+
+# レビュー済みの内容とレビュー結果の保存先
+REVIEW_STORE_PATH = os.path.join(REVIEW_STATE_DIR, "reviews.json")
+
+def extract_diary_text(entry_content, sha=None):
+    """不要なマークダウン記法を取り除いて、純粋な内容部分を抽出する（記録した会話も含める）"""
+    entry = parse_entry(entry_content, sha)
+    diary_text = entry.section('内容')
+    conversation = entry.section('会話')
+    if conversation:
+        return f"{diary_text}\n\n{conversation}" if diary_text else conversation
+    if diary_text is not None:
+        return diary_text
+    return entry_content
 
-def review_with_claude(entry_content):
-    """Claude APIを使用して日記エントリをレビューする"""
+def review_key(entry_content, sha=None):
+    """レビュー対象の内容とプロンプトのバージョンからキャッシュのキーを作る"""
+    source = f"{PROMPT_VERSION}\n{REVIEW_MODEL}\n{extract_diary_text(entry_content, sha)}"
+    return hashlib.sha256(source.encode('utf-8')).hexdigest()
+
+def load_review_store():
+    """レビュー済みの一覧を読み込む"""
     try:
-        # 不要なマークダウン記法を取り除いて、純粋な内容部分を抽出
-        content_section = re.search(r'## 内容\n([\s\S]*?)(?=\n##|\Z)', entry_content)
-        if content_section:
-            diary_text = content_section.group(1).strip()
-        else:
-            diary_text = entry_content
+        with open(REVIEW_STORE_PATH, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        print(f"レビュー済み一覧の読み込みエラー: {e}")
+        return {}
+
+def save_review_store(store):
+    """レビュー済みの一覧を保存する"""
+    os.makedirs(REVIEW_STATE_DIR, exist_ok=True)
+    tmp_path = REVIEW_STORE_PATH + ".tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(store, f, ensure_ascii=False)
+    os.replace(tmp_path, REVIEW_STORE_PATH)
+
+def review_with_claude(entry_content, sha=None):
+    """Claude APIを使用して日記エントリをレビューする
+
+    戻り値は (レビュー文, 成功したか)。失敗時はエラーメッセージを返す。
+    """
+    try:
+        diary_text = extract_diary_text(entry_content, sha)
         
         # Claude API エンドポイント
         url = "https://api.anthropic.com/v1/messages"
@@ -115,19 +245,12 @@ def review_with_claude(entry_content):
         
         # リクエストボディ
         payload = {
-            "model": "claude-3-opus-20240229",
+            "model": REVIEW_MODEL,
             "max_tokens": 500,
             "messages": [
                 {
                     "role": "user",
-                    "content": f"""以下は日記の内容です。この日記に対して、以下の観点からポジティブなレビューとアドバイスを短く（100〜200文字程度）提供してください：
-
-1. 良かった点を1つ挙げる
-2. もっと詳しく知りたい点を1つ挙げる
-3. 文章の流れについてのアドバイス
-
-日記の内容：
-{diary_text}"""
+                    "content": REVIEW_PROMPT.format(diary_text=diary_text)
                 }
             ]
         }
@@ -135,32 +258,68 @@ def review_with_claude(entry_content):
         print("Claude APIにリクエスト送信中...")
         
         # APIリクエスト
-        response = requests.post(url, headers=headers, json=payload)
+        with timed("Claude API（合計）"):
+            response = http.post(url, headers=headers, json=payload, timeout=HTTP_TIMEOUT)
         
         if response.status_code == 200:
             result = response.json()
             # Claude APIはcontent配列を返すため、テキスト部分を抽出
             review_text = result["content"][0]["text"]
-            return review_text
+            return review_text, True
         else:
             print(f"Claude APIエラー ({response.status_code}): {response.text}")
-            return "レビューの取得中にエラーが発生しました。"
+            return "レビューの取得中にエラーが発生しました。", False
     except Exception as e:
         print(f"レビュー中のエラー: {e}")
-        return "レビュー処理中にエラーが発生しました。"
+        return "レビュー処理中にエラーが発生しました。", False
+
+# 送信間隔を守るための最終送信時刻
+webhook_lock = threading.Lock()
+last_webhook_at = 0.0
+
+def post_webhook(payload):
+    """Discordウェブフックに送信する（送信間隔を空け、429ならretry_afterだけ待って再送）"""
+    global last_webhook_at
+    
+    with webhook_lock:
+        for attempt in range(WEBHOOK_RETRIES):
+            wait = last_webhook_at + WEBHOOK_INTERVAL - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            
+            with timed("Discord通知"):
+                response = http.post(
+                    DISCORD_WEBHOOK_URL,
+                    json=payload,
+                    timeout=HTTP_TIMEOUT
+                )
+            last_webhook_at = time.monotonic()
+            
+            if response.status_code != 429:
+                return response
+            
+            # レート制限に達した場合は指定された時間だけ待つ
+            try:
+                retry_after = float(response.json().get("retry_after", 1))
+            except ValueError:
+                retry_after = float(response.headers.get("Retry-After", 1))
+            print(f"Discordのレート制限に達しました。{retry_after}秒後に再送します")
+            with timed("Discord通知（レート制限待ち）"):
+                time.sleep(retry_after)
+        
+        return response
 
 def send_to_discord(entry, review):
     """レビュー結果をDiscordに送信"""
     try:
         # 日記のタイトルと書いた人を抽出
-        author_match = re.search(r'# (.+?)の日記エントリ', entry["content"])
-        author = author_match.group(1) if author_match else "不明"
+        author = parse_entry(entry["content"], entry.get("sha")).author or "不明"
         
         # メッセージの構成
         message = {
             "embeds": [{
                 "title": f"📝 {author}さんの日記レビュー",
-                "description": f"{yesterday_str}の日記へのAIレビューです",
+                "description": f"{entry['path'].split('/')[1]}の日記へのAIレビューです",
                 "color": 0x3498db,
                 "fields": [
                     {
@@ -180,10 +339,7 @@ def send_to_discord(entry, review):
         print(f"Discordに通知を送信中: {DISCORD_WEBHOOK_URL[:30]}...")
         
         # Discordウェブフックに送信
-        response = requests.post(
-            DISCORD_WEBHOOK_URL,
-            json=message
-        )
+        response = post_webhook(message)
         
         if response.status_code == 204:
             print(f"Discord通知成功: {entry['path']}")
@@ -206,10 +362,7 @@ def send_empty_notification():
         print(f"エントリなしの通知を送信中: {DISCORD_WEBHOOK_URL[:30]}...")
         
         # Discordウェブフックに送信
-        response = requests.post(
-            DISCORD_WEBHOOK_URL,
-            json=empty_message
-        )
+        response = post_webhook(empty_message)
         
         if response.status_code == 204:
             print("Discord通知成功: エントリなし")
@@ -221,30 +374,81 @@ def send_empty_notification():
         print(f"Discord送信エラー: {e}")
         return False
 
+def review_entry(entry):
+    """1件のエントリをレビューする（ワーカースレッドで実行）"""
+    print(f"レビュー中: {entry['path']}")
+    return review_with_claude(entry["content"], entry.get("sha"))
+
+def print_stage_times(total):
+    """処理段階ごとの所要時間を表示する"""
+    print("== 処理時間 ==")
+    for stage, seconds in stage_times.items():
+        print(f"  {stage}: {seconds:.2f}秒")
+    print(f"  全体: {total:.2f}秒")
+
 def main():
     """メイン処理"""
-    print(f"== {yesterday_str}の日記エントリをチェックしています ==")
+    started = time.perf_counter()
+    print(f"== 前回のレビュー以降の日記エントリをチェックしています ==")
     
     # 新しいエントリを取得
-    new_entries = get_new_entries()
+    with timed("エントリ取得"):
+        new_entries, head_sha = get_new_entries()
     
     if not new_entries:
         print(f"新しい日記エントリは見つかりませんでした")
         
         # エントリがない場合もDiscordに通知
         send_empty_notification()
+        if head_sha:
+            save_watermark(head_sha)
+        print_stage_times(time.perf_counter() - started)
         return
     
     print(f"{len(new_entries)}件の新しい日記エントリを見つけました")
     
-    # 各エントリをレビュー
+    # 同じ内容をレビュー済みのエントリはAPI呼び出しも通知もしない
+    review_store = load_review_store()
+    pending_entries = []
     for entry in new_entries:
-        print(f"レビュー中: {entry['path']}")
-        review = review_with_claude(entry["content"])
-        
-        # Discordに送信
-        send_to_discord(entry, review)
+        key = review_key(entry["content"], entry.get("sha"))
+        if key in review_store:
+            print(f"レビュー済みのためスキップ: {entry['path']}")
+        else:
+            pending_entries.append((entry, key))
+    
+    # レビューは並列に実行し、終わったものから順番にDiscordへ送信する
+    failed_paths = []
+    with timed("レビューと通知（実時間）"):
+        with ThreadPoolExecutor(max_workers=REVIEW_CONCURRENCY) as executor:
+            futures = [executor.submit(review_entry, entry) for entry, _ in pending_entries]
+            
+            for (entry, key), future in zip(pending_entries, futures):
+                review, success = future.result()
+                
+                # Discordに送信（レビューと通知の両方が成功したものだけ記録する）
+                if send_to_discord(entry, review) and success:
+                    review_store[key] = {
+                        "path": entry["path"],
+                        "review": review,
+                        "reviewed_at": datetime.now().isoformat()
+                    }
+                else:
+                    failed_paths.append(entry["path"])
+    
+    save_review_store(review_store)
+    
+    if failed_paths:
+        # 失敗したエントリを次回もう一度対象にするため、ウォーターマークは進めない
+        # （成功したものはレビュー済みとして記録したので次回はスキップされる）
+        print(f"レビューまたは通知に失敗したエントリ: {len(failed_paths)}件（次回再試行します）")
+        for path in failed_paths:
+            print(f"  {path}")
+    else:
+        # 次回はこのコミット以降の変更だけを対象にする
+        save_watermark(head_sha)
     
+    print_stage_times(time.perf_counter() - started)
     print("== 処理完了 ==")
 
 if __name__ == "__main__":
@@ -0,0 +1,440 @@
+"""ベンチマーク用のGitHub APIの偽サーバー
+
+ボットが使うエンドポイント（contents / git trees・blobs・commits・refs / compare）だけを
+メモリ上のGitオブジェクトで実装する。応答の遅延を指定でき、呼び出し数を操作ごとに数える。
+"""
+import json
+import time
+import base64
+import random
+import asyncio
+import hashlib
+import threading
+import urllib.parse
+from collections import Counter
+from aiohttp import web
+
+# contents APIが内容を返すファイルの大きさの上限（これを超えると内容は空、encodingは"none"）
+CONTENTS_SIZE_LIMIT = 1024 * 1024
+
+def git_blob_sha(data):
+    """gitのblob SHAを計算する"""
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+def _object_sha(kind, payload):
+    # ツリーとコミットのSHAは本物のgitと同じである必要はないので、内容のハッシュで代用する
+    return hashlib.sha1(kind.encode() + json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+class FakeRepository:
+    """リポジトリのGitオブジェクト
+
+    ツリーはディレクトリ構造を持たず、「相対パス -> blob SHA」の辞書で表す。
+    サブツリーは要求されたときにディレクトリごとに切り出して登録する。
+    """
+
+    def __init__(self, branch="main"):
+        self.branch = branch
+        self.blobs = {}    # SHA -> 内容（bytes）
+        self.trees = {}    # SHA -> {相対パス: blob SHA}
+        self.commits = {}  # SHA -> {"tree", "parents", "message"}
+        self._directory_cache = {}
+        self.head = self.put_commit(self.put_tree({}), [], "Initial commit")
+
+    def put_blob(self, data):
+        sha = git_blob_sha(data)
+        self.blobs[sha] = data
+        return sha
+
+    def put_tree(self, files):
+        sha = _object_sha("tree", files)
+        self.trees[sha] = dict(files)
+        return sha
+
+    def put_commit(self, tree, parents, message):
+        sha = _object_sha("commit", {"tree": tree, "parents": parents, "message": message, "time": time.time()})
+        self.commits[sha] = {"tree": tree, "parents": list(parents), "message": message}
+        return sha
+
+    def files_at(self, commit_sha=None):
+        """コミット時点のファイル一覧（パス -> blob SHA）"""
+        return self.trees[self.commits[commit_sha or self.head]["tree"]]
+
+    def commit_files(self, changes, message):
+        """変更（パス -> 内容、Noneなら削除）をブランチにコミットする（データの投入用）"""
+        files = dict(self.files_at())
+        for path, content in changes.items():
+            if content is None:
+                files.pop(path, None)
+            else:
+                files[path] = self.put_blob(content.encode('utf-8'))
+        self.head = self.put_commit(self.put_tree(files), [self.head], message)
+        return self.head
+
+    def resolve_tree(self, tree_ish):
+        """ブランチ名・コミットSHA・ツリーSHAからツリーSHAを返す（見つからなければNone）"""
+        if tree_ish == self.branch:
+            tree_ish = self.head
+        if tree_ish in self.commits:
+            return self.commits[tree_ish]["tree"]
+        if tree_ish in self.trees:
+            return tree_ish
+        return None
+
+    def directories(self, tree_sha):
+        """ツリー内のディレクトリ -> サブツリーのSHA（ツリーは変更されないので結果を覚えておく）"""
+        result = self._directory_cache.get(tree_sha)
+        if result is None:
+            grouped = {}
+            for path, sha in self.trees[tree_sha].items():
+                parts = path.split('/')
+                for depth in range(1, len(parts)):
+                    grouped.setdefault('/'.join(parts[:depth]), {})['/'.join(parts[depth:])] = sha
+            result = {directory: self.put_tree(files) for directory, files in grouped.items()}
+            self._directory_cache[tree_sha] = result
+        return result
+
+    def list_tree(self, tree_sha, recursive):
+        """ツリーの要素を (パス, 種類, SHA) のパス順で返す"""
+        elements = [
+            (path, "blob", sha) for path, sha in self.trees[tree_sha].items()
+            if recursive or '/' not in path
+        ]
+        elements.extend(
+            (directory, "tree", sha) for directory, sha in self.directories(tree_sha).items()
+            if recursive or '/' not in directory
+        )
+        elements.sort()
+        return elements
+
+    def is_ancestor(self, ancestor, commit):
+        pending = [commit]
+        seen = set()
+        while pending:
+            sha = pending.pop()
+            if sha == ancestor:
+                return True
+            if sha in seen or sha not in self.commits:
+                continue
+            seen.add(sha)
+            pending.extend(self.commits[sha]["parents"])
+        return False
+
+class FakeGitHub:
+    """偽のGitHub APIサーバー（別スレッドのイベントループで動く）
+
+    latency / jitter は各応答を返すまでの遅延（秒）、quota は1時間あたりの利用枠。GETにはETagを付け、
+    If-None-Matchが一致すれば304を返す（本物と同じく利用枠を消費しない）。
+    """
+
+    def __init__(self, repository, latency=0.0, jitter=0.0, truncate_limit=100000, host="127.0.0.1", quota=5000):
+        self.repository = repository
+        self.latency = latency
+        self.jitter = jitter
+        self.truncate_limit = truncate_limit
+        self.host = host
+        self.port = None
+        self.rate_limit = quota
+        self.rate_remaining = quota
+        self._calls = Counter()
+        self._not_modified = Counter()
+        self._stats_lock = threading.Lock()
+        self._loop = None
+        self._runner = None
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    # --- 起動と停止 ---
+
+    def start(self):
+        ready = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._loop.run_until_complete(self._start_site())
+            ready.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name="fake-github", daemon=True)
+        self._thread.start()
+        ready.wait()
+        return self
+
+    async def _start_site(self):
+        app = web.Application(middlewares=[self._middleware], client_max_size=64 * 1024 * 1024)
+        repo = "/repos/{owner}/{repo}"
+        app.router.add_get(repo, self._get_repo, name="get_repo")
+        app.router.add_get(repo + "/git/refs/heads/{branch}", self._get_ref, name="get_ref")
+        app.router.add_patch(repo + "/git/refs/heads/{branch}", self._update_ref, name="update_ref")
+        app.router.add_get(repo + "/git/commits/{sha}", self._get_commit, name="get_commit")
+        app.router.add_post(repo + "/git/commits", self._create_commit, name="create_commit")
+        app.router.add_get(repo + "/git/trees/{sha}", self._get_tree, name="get_tree")
+        app.router.add_post(repo + "/git/trees", self._create_tree, name="create_tree")
+        app.router.add_get(repo + "/git/blobs/{sha}", self._get_blob, name="get_blob")
+        app.router.add_get(repo + "/contents/{path:.+}", self._get_contents, name="get_contents")
+        app.router.add_get(repo + "/compare/{spec}", self._compare, name="compare")
+
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, 0)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+
+    def stop(self):
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop = None
+
+    # --- 統計 ---
+
+    def stats(self):
+        """操作ごとの呼び出し数（304で返した数を含む）"""
+        with self._stats_lock:
+            return {
+                "calls": dict(self._calls),
+                "not_modified": dict(self._not_modified),
+                "total": sum(self._calls.values()),
+                "quota_used": sum(self._calls.values()) - sum(self._not_modified.values())
+            }
+
+    def reset_stats(self):
+        with self._stats_lock:
+            self._calls.clear()
+            self._not_modified.clear()
+
+    # --- 共通処理 ---
+
+    @web.middleware
+    async def _middleware(self, request, handler):
+        route = request.match_info.route.name or "unknown"
+        delay = self.latency + (random.uniform(0, self.jitter) if self.jitter else 0)
+        if delay:
+            await asyncio.sleep(delay)
+
+        response = await handler(request)
+
+        not_modified = False
+        if request.method == "GET" and response.status == 200 and response.body is not None:
+            etag = '"' + hashlib.sha1(response.body).hexdigest() + '"'
+            response.headers["ETag"] = etag
+            if request.headers.get("If-None-Match") == etag:
+                response = web.Response(status=304, headers={"ETag": etag})
+                not_modified = True
+
+        if not not_modified:
+            self.rate_remaining = max(0, self.rate_remaining - 1)
+        response.headers["X-RateLimit-Limit"] = str(self.rate_limit)
+        response.headers["X-RateLimit-Remaining"] = str(self.rate_remaining)
+        response.headers["X-RateLimit-Reset"] = str(int(time.time()) + 3600)
+
+        with self._stats_lock:
+            self._calls[route] += 1
+            if not_modified:
+                self._not_modified[route] += 1
+        return response
+
+    def _base(self, request):
+        return f"http://{request.host}{'/repos/' + request.match_info['owner'] + '/' + request.match_info['repo']}"
+
+    def _not_found(self):
+        return web.json_response({"message": "Not Found"}, status=404)
+
+    def _commit_json(self, request, sha):
+        commit = self.repository.commits[sha]
+        base = self._base(request)
+        return {
+            "sha": sha,
+            "url": f"{base}/git/commits/{sha}",
+            "message": commit["message"],
+            "tree": {"sha": commit["tree"], "url": f"{base}/git/trees/{commit['tree']}"},
+            "parents": [{"sha": parent, "url": f"{base}/git/commits/{parent}"} for parent in commit["parents"]]
+        }
+
+    # --- エンドポイント ---
+
+    async def _get_repo(self, request):
+        owner, name = request.match_info["owner"], request.match_info["repo"]
+        return web.json_response({
+            "name": name,
+            "full_name": f"{owner}/{name}",
+            "url": self._base(request),
+            "default_branch": self.repository.branch,
+            "private": True
+        })
+
+    async def _get_ref(self, request):
+        if request.match_info["branch"] != self.repository.branch:
+            return self._not_found()
+        return web.json_response(self._ref_json(request))
+
+    def _ref_json(self, request):
+        base = self._base(request)
+        head = self.repository.head
+        return {
+            "ref": f"refs/heads/{self.repository.branch}",
+            "url": f"{base}/git/refs/heads/{self.repository.branch}",
+            "object": {"type": "commit", "sha": head, "url": f"{base}/git/commits/{head}"}
+        }
+
+    async def _update_ref(self, request):
+        body = await request.json()
+        sha = body["sha"]
+        if sha not in self.repository.commits:
+            return web.json_response({"message": "Object does not exist"}, status=422)
+        if not body.get("force") and not self.repository.is_ancestor(self.repository.head, sha):
+            return web.json_response({"message": "Update is not a fast forward"}, status=422)
+        self.repository.head = sha
+        return web.json_response(self._ref_json(request))
+
+    async def _get_commit(self, request):
+        sha = request.match_info["sha"]
+        if sha not in self.repository.commits:
+            return self._not_found()
+        return web.json_response(self._commit_json(request, sha))
+
+    async def _create_commit(self, request):
+        body = await request.json()
+        if body["tree"] not in self.repository.trees:
+            return web.json_response({"message": "Tree SHA does not exist"}, status=422)
+        sha = self.repository.put_commit(body["tree"], body.get("parents", []), body["message"])
+        return web.json_response(self._commit_json(request, sha), status=201)
+
+    async def _get_tree(self, request):
+        tree_sha = self.repository.resolve_tree(request.match_info["sha"])
+        if tree_sha is None:
+            return self._not_found()
+        recursive = request.query.get("recursive") not in (None, "", "0", "false")
+        elements = self.repository.list_tree(tree_sha, recursive)
+        truncated = len(elements) > self.truncate_limit
+        base = self._base(request)
+        return web.json_response({
+            "sha": tree_sha,
+            "url": f"{base}/git/trees/{tree_sha}",
+            "truncated": truncated,
+            "tree": [
+                {
+                    "path": path,
+                    "mode": "040000" if kind == "tree" else "100644",
+                    "type": kind,
+                    "sha": sha,
+                    "url": f"{base}/git/{kind}s/{sha}"
+                }
+                for path, kind, sha in elements[:self.truncate_limit]
+            ]
+        })
+
+    async def _create_tree(self, request):
+        body = await request.json()
+        files = {}
+        if body.get("base_tree"):
+            if body["base_tree"] not in self.repository.trees:
+                return web.json_response({"message": "Invalid base_tree"}, status=422)
+            files = dict(self.repository.trees[body["base_tree"]])
+
+        for element in body["tree"]:
+            path = element["path"]
+            if "content" in element:
+                files[path] = self.repository.put_blob(element["content"].encode('utf-8'))
+            elif element.get("sha") is None:
+                if path not in files:
+                    # 本物のAPIも存在しないパスの削除は失敗する
+                    return web.json_response({"message": f"Path not found: {path}"}, status=422)
+                del files[path]
+            else:
+                files[path] = element["sha"]
+
+        sha = self.repository.put_tree(files)
+        return web.json_response({"sha": sha, "url": f"{self._base(request)}/git/trees/{sha}", "tree": []}, status=201)
+
+    async def _get_blob(self, request):
+        sha = request.match_info["sha"]
+        data = self.repository.blobs.get(sha)
+        if data is None:
+            return self._not_found()
+        return web.json_response({
+            "sha": sha,
+            "size": len(data),
+            "encoding": "base64",
+            "content": base64.b64encode(data).decode()
+        })
+
+    async def _get_contents(self, request):
+        path = request.match_info["path"].strip('/')
+        ref = request.query.get("ref")
+        tree_sha = self.repository.resolve_tree(ref or self.repository.branch)
+        if tree_sha is None:
+            return self._not_found()
+        files = self.repository.trees[tree_sha]
+        base = self._base(request)
+        suffix = f"?ref={urllib.parse.quote(ref)}" if ref else ""
+
+        def item(item_path, kind, sha, data=None):
+            result = {
+                "type": kind,
+                "name": item_path.rsplit('/', 1)[-1],
+                "path": item_path,
+                "sha": sha,
+                "size": len(data) if data is not None else 0,
+                "url": f"{base}/contents/{urllib.parse.quote(item_path)}{suffix}"
+            }
+            if data is not None and len(data) > CONTENTS_SIZE_LIMIT:
+                # 本物と同じく、大きなファイルは内容を返さない（blob APIで取得する必要がある）
+                result["encoding"] = "none"
+                result["content"] = ""
+            elif data is not None:
+                result["encoding"] = "base64"
+                result["content"] = base64.b64encode(data).decode()
+            return result
+
+        if path in files:
+            sha = files[path]
+            return web.json_response(item(path, "file", sha, self.repository.blobs[sha]))
+
+        # ディレクトリの場合は直下の要素だけを本文なしで返す
+        directories = self.repository.directories(tree_sha)
+        if path not in directories:
+            return self._not_found()
+        prefix = path + '/'
+        children = {}
+        for name, sha in self.repository.trees[directories[path]].items():
+            if '/' in name:
+                name = name.split('/', 1)[0]
+                children[name] = item(prefix + name, "dir", directories[prefix + name])
+            else:
+                children[name] = item(prefix + name, "file", sha)
+                children[name]["size"] = len(self.repository.blobs[sha])
+        if not children:
+            return self._not_found()
+        return web.json_response([children[name] for name in sorted(children)])
+
+    async def _compare(self, request):
+        base_sha, _, head_sha = request.match_info["spec"].partition("...")
+        if base_sha not in self.repository.commits or head_sha not in self.repository.commits:
+            return self._not_found()
+        before = self.repository.files_at(base_sha)
+        after = self.repository.files_at(head_sha)
+        files = []
+        for path in sorted(set(before) | set(after)):
+            if before.get(path) == after.get(path):
+                continue
+            if path not in before:
+                status = "added"
+            elif path not in after:
+                status = "removed"
+            else:
+                status = "modified"
+            files.append({"filename": path, "status": status, "sha": after.get(path) or before.get(path)})
+        return web.json_response({
+            "status": "ahead",
+            "ahead_by": 1,
+            "behind_by": 0,
+            "total_commits": 1,
+            "commits": [],
+            "files": files
+        })
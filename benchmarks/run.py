@@ -0,0 +1,578 @@
+"""日記ボットのベンチマーク・負荷試験
+
+ローカルに起動したGitHub APIの偽サーバーに、N人×M年分の日記を用意してから
+github_utils とコマンドのハンドラを同時に呼び出し、操作ごとのスループット・
+p50/p99レイテンシ・GitHub APIの呼び出し数をJSONに書き出す。
+
+    python benchmarks/run.py --users 10 --years 3 --latency 0.05 --output bench.json
+    python benchmarks/run.py --compare bench.json  # 前回の結果と比べる
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import datetime
+import platform
+import tempfile
+import contextlib
+import subprocess
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+from benchmarks.fake_github import FakeGitHub, FakeRepository
+
+# 合成する日記の文章の材料
+PHRASES = [
+    "朝から雨が降っていた", "駅まで散歩した", "昼はカレーを食べた", "図書館で本を借りた",
+    "友達と電話で話した", "新しいプログラミング言語を勉強した", "部屋の掃除をした",
+    "夕方に少し昼寝をした", "コーヒーを二杯飲んだ", "仕事の締め切りに追われた",
+    "公園で桜を見た", "映画を観て泣いた", "ギターの練習をした", "家族と夕食を食べた",
+    "ジョギングで五キロ走った", "買い物に出かけた", "日記を書くのが習慣になってきた",
+    "猫が膝の上で寝ていた", "会議が長引いて疲れた", "久しぶりにケーキを焼いた"
+]
+CLOSINGS = ["。", "。楽しかった。", "。明日も頑張ろう。", "。少し疲れた。", "。良い一日だった。"]
+# 合成した投稿者のDiscordユーザーID（user000 から順に割り当てる）
+AUTHOR_ID_BASE = 1000
+# config.pyの既定のレート制限（ほかのシナリオでは外しているが、sync_interactiveではこれを使う）
+DEFAULT_RATE_PER_SECOND = 10
+DEFAULT_RATE_BURST = 20
+
+SEARCH_KEYWORDS = ["カレー", "散歩", "ギター 練習", "映画 OR ケーキ", "プログラミング", "猫"]
+
+def percentile(values, fraction):
+    """最近傍順位法でパーセンタイルを求める"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(fraction * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+def make_content(rng, author, written_at, channel="diary", lines=None, author_id=None):
+    """ボットが保存するのと同じ形式のエントリを作る"""
+    from src.utils.diary_entry import author_id_line
+
+    if lines is None:
+        lines = rng.randint(3, 15)
+    body = "\n".join(rng.choice(PHRASES) + rng.choice(CLOSINGS) for _ in range(lines))
+    header = f"# {author}の日記エントリ\n"
+    if author_id is not None:
+        header += author_id_line(author_id) + "\n"
+    return f"""{header}
+## 日時
+{written_at.strftime('%Y年%m月%d日 %H:%M:%S')}
+
+## チャンネル
+{channel}
+
+## 内容
+{body}
+
+"""
+
+def seed_repository(repository, users, years, density, seed, with_index=True):
+    """N人×M年分の日記をリポジトリにコミットする（今日の分は全員が書いたことにする）"""
+    from src.utils import manifest as diary_index
+
+    rng = random.Random(seed)
+    today = datetime.datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    authors = [f"user{i:03d}" for i in range(users)]
+    changes = {}
+    entries = []
+    for days_ago in range(int(years * 365)):
+        day = today - datetime.timedelta(days=days_ago)
+        for author_id, author in enumerate(authors, start=AUTHOR_ID_BASE):
+            if days_ago > 0 and rng.random() > density:
+                continue
+            written_at = day + datetime.timedelta(seconds=rng.randint(0, 86399))
+            if days_ago == 0:
+                written_at = min(written_at, datetime.datetime.now())
+            path = f"diary/{day:%Y-%m-%d}/{author}_{written_at:%Y%m%d%H%M%S}.md"
+            content = make_content(rng, author, written_at, author_id=author_id)
+            changes[path] = content
+            entries.append({'path': path, 'content': content})
+
+    if with_index:
+        changes[diary_index.MANIFEST_PATH] = diary_index.dumps(diary_index.build(entries))
+    repository.commit_files(changes, "Seed benchmark diary")
+    return authors, [entry['path'] for entry in entries]
+
+class FakeAuthor:
+    def __init__(self, user_id, name):
+        self.id = user_id
+        self.name = name
+        self.display_name = name
+        self.bot = False
+
+class FakeChannel:
+    def __init__(self, channel_id=1, name="diary"):
+        self.id = channel_id
+        self.name = name
+
+class FakeMessage:
+    def __init__(self, message_id, content="", author=None, channel=None):
+        self.id = message_id
+        self.content = content
+        self.author = author
+        self.channel = channel
+        self.attachments = []
+        self.reference = None
+
+    async def edit(self, **kwargs):
+        pass
+
+    async def add_reaction(self, emoji):
+        pass
+
+class FakeContext:
+    """コマンドのハンドラに渡すctxの代わり（送信内容を記録するだけ）"""
+
+    _next_id = 1
+
+    def __init__(self, author, channel=None):
+        self.author = author
+        self.channel = channel or FakeChannel()
+        self.sent = []
+
+    async def send(self, content=None, **kwargs):
+        self.sent.append(content or "")
+        FakeContext._next_id += 1
+        return FakeMessage(FakeContext._next_id, content or "", self.author, self.channel)
+
+    @property
+    def failed(self):
+        return any(message.startswith("❌") for message in self.sent)
+
+class LoopLagMonitor:
+    """短い間隔で眠り、予定より遅れて起きた時間を記録する"""
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = []
+        self._task = None
+
+    async def _run(self):
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, time.perf_counter() - started - self.interval))
+
+    def start(self):
+        self.samples = []
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        return {
+            "p99_ms": (percentile(self.samples, 0.99) or 0.0) * 1000,
+            "max_ms": max(self.samples, default=0.0) * 1000
+        }
+
+class Benchmark:
+    def __init__(self, args, server, authors, paths):
+        from src.utils import github_utils
+        self.args = args
+        self.server = server
+        self.github_utils = github_utils
+        self.authors = authors
+        self.paths = paths
+        self.rng = random.Random(args.seed)
+        self.dates = sorted({path.split('/')[1] for path in paths})
+        self.today = datetime.datetime.now().strftime('%Y-%m-%d')
+
+    async def measure(self, name, operation, count=None, concurrency=None, settle=None):
+        """operation(i) を count 回、最大 concurrency 並列で実行して計測する
+
+        operationは成功したかどうかを返す。settleは計測の最後に待つ処理（書き込みのコミットなど）。
+        """
+        count = count or self.args.requests
+        concurrency = concurrency or self.args.concurrency
+        latencies = []
+        errors = 0
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def run_one(i):
+            nonlocal errors
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    ok = await operation(i)
+                except Exception as e:
+                    print(f"[{name}] {type(e).__name__}: {e}")
+                    ok = False
+                latencies.append(time.perf_counter() - started)
+                if not ok:
+                    errors += 1
+
+        self.server.reset_stats()
+        monitor = LoopLagMonitor()
+        monitor.start()
+        started = time.perf_counter()
+        await asyncio.gather(*[run_one(i) for i in range(count)])
+        if settle is not None:
+            await settle()
+        elapsed = time.perf_counter() - started
+        loop_lag = await monitor.stop()
+        api = self.server.stats()
+
+        result = {
+            "count": count,
+            "concurrency": concurrency,
+            "errors": errors,
+            "elapsed_s": elapsed,
+            "throughput_per_s": count / elapsed if elapsed else None,
+            "latency_ms": {
+                "p50": percentile(latencies, 0.50) * 1000,
+                "p99": percentile(latencies, 0.99) * 1000,
+                "mean": sum(latencies) / len(latencies) * 1000,
+                "max": max(latencies) * 1000
+            },
+            "event_loop_lag_ms": loop_lag,
+            "api_calls": api["calls"],
+            "api_not_modified": api["not_modified"],
+            "api_calls_total": api["total"],
+            "api_calls_per_op": api["total"] / count,
+            "quota_used": api["quota_used"]
+        }
+        print(
+            f"{name:<16} n={count:<5} c={concurrency:<3} "
+            f"{result['throughput_per_s']:8.1f}/s  p50={result['latency_ms']['p50']:8.2f}ms  "
+            f"p99={result['latency_ms']['p99']:8.2f}ms  api/op={result['api_calls_per_op']:.2f}  "
+            f"lag_max={loop_lag['max_ms']:.1f}ms  errors={errors}"
+        )
+        return result
+
+    async def wait_for_commits(self):
+        """書き込みキューが空になる（すべてコミットされる）まで待つ"""
+        while self.github_utils.get_write_queue_stats()["depth"]:
+            await asyncio.sleep(0.01)
+
+    def context(self, i):
+        author = self.authors[i % len(self.authors)]
+        return FakeContext(FakeAuthor(AUTHOR_ID_BASE + i % len(self.authors), author))
+
+    # --- シナリオ ---
+
+    async def scenario_today(self):
+        from src.commands.history import today_entry
+
+        async def operation(i):
+            ctx = self.context(i)
+            await today_entry.callback(ctx)
+            return not ctx.failed and bool(ctx.sent)
+
+        # 50件の!todayを同時に処理してもイベントループが止まらないこと
+        return await self.measure("today", operation, concurrency=max(self.args.concurrency, 50))
+
+    async def scenario_history_date(self):
+        from src.commands.history import get_history
+
+        async def operation(i):
+            ctx = self.context(i)
+            await get_history.callback(ctx, self.rng.choice(self.dates))
+            return not ctx.failed
+
+        return await self.measure("history_date", operation)
+
+    async def scenario_history_all(self):
+        from src.commands.history import get_history
+
+        async def operation(i):
+            ctx = self.context(i)
+            await get_history.callback(ctx, 'all')
+            return not ctx.failed
+
+        return await self.measure("history_all", operation)
+
+    async def scenario_date_range(self):
+        async def operation(i):
+            start = datetime.datetime.strptime(self.rng.choice(self.dates), '%Y-%m-%d')
+            end = start + datetime.timedelta(days=6)
+            success, _ = await self.github_utils.get_diary_by_date_range(
+                start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d')
+            )
+            return success
+
+        return await self.measure("date_range", operation)
+
+    async def scenario_all_first(self):
+        # 全エントリを新しい順に流し読みし、先頭の10件で止める
+        async def operation(i):
+            count = 0
+            async with contextlib.aclosing(self.github_utils.iter_all_diary_entries()) as entries:
+                async for _ in entries:
+                    count += 1
+                    if count == 10:
+                        break
+            return count == 10
+
+        return await self.measure("all_first", operation)
+
+    async def _search(self, name, count, concurrency):
+        from src.commands.history import search_entries
+
+        async def operation(i):
+            ctx = self.context(i)
+            await search_entries.callback(ctx, keyword=SEARCH_KEYWORDS[i % len(SEARCH_KEYWORDS)])
+            return not ctx.failed
+
+        return await self.measure(name, operation, count=count, concurrency=concurrency)
+
+    async def scenario_search_cold(self):
+        # ミラーの同期とインデックスの構築を含む最初の1回
+        return await self._search("search_cold", 1, 1)
+
+    async def scenario_search(self):
+        return await self._search("search", None, None)
+
+    async def scenario_sync_interactive(self):
+        # 起動直後のように空のミラーから同期している最中に、対話的な読み込みがどれだけ待たされるか。
+        # 既定のレート制限に戻して計測する
+        from src.utils.mirror import DiaryMirror
+
+        github_utils = self.github_utils
+        scheduler = github_utils._scheduler
+        saved = (scheduler.rate, scheduler.burst, github_utils._mirror)
+        scheduler.rate, scheduler.burst = DEFAULT_RATE_PER_SECOND, DEFAULT_RATE_BURST
+        scheduler._tokens = float(DEFAULT_RATE_BURST)
+        github_utils._mirror = DiaryMirror(tempfile.mkdtemp(prefix="diary-bench-cold-"))
+        sync = asyncio.create_task(github_utils._sync_mirror())
+
+        async def operation(i):
+            path = self.rng.choice(self.paths)
+            github_utils._read_cache.invalidate(("file", path))
+            success, _ = await github_utils.get_file_content(path)
+            return success
+
+        try:
+            # 一括取得が始まってから計測する
+            await asyncio.sleep(1)
+            result = await self.measure("sync_interactive", operation, count=min(self.args.requests, 20), concurrency=1)
+            result["sync_finished"] = sync.done()
+            return result
+        finally:
+            sync.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await sync
+            scheduler.rate, scheduler.burst, github_utils._mirror = saved
+            scheduler._tokens = float(scheduler.burst)
+
+    async def scenario_save(self):
+        # 新しい投稿者として保存する（WALへの追記まで）。最後にコミットを待って往復数を数える
+        async def operation(i):
+            message = FakeMessage(i, f"ベンチマークの書き込み {i}")
+            success, _ = await self.github_utils.save_message_to_github(
+                message, f"writer{i:05d}", "diary", content=message.content, author_id=100000 + i
+            )
+            return success
+
+        result = await self.measure(
+            "save", operation, settle=self.wait_for_commits
+        )
+        result["commits"] = result["api_calls"].get("create_commit", 0)
+        return result
+
+    async def scenario_update(self):
+        today_paths = [path for path in self.paths if path.split('/')[1] == self.today]
+
+        async def operation(i):
+            success, _ = await self.github_utils.update_diary_entry(
+                today_paths[i % len(today_paths)], f"ベンチマークで更新した内容 {i}"
+            )
+            return success
+
+        result = await self.measure(
+            "update", operation, settle=self.wait_for_commits
+        )
+        result["commits"] = result["api_calls"].get("create_commit", 0)
+        return result
+
+    # --- マイクロベンチマーク（GitHubを使わない） ---
+
+    def micro_parse(self):
+        """エントリの解析（10KBと1MB）。キャッシュを通さずに毎回解析する"""
+        from src.utils.diary_entry import parse
+
+        results = {}
+        for label, size in (("10KB", 10 * 1024), ("1MB", 1024 * 1024)):
+            text = self._entry_of_size(size)
+            results[label] = _time_calls(lambda: parse(text), self.args.micro_iterations)
+            print(f"parse {label:<10} mean={results[label]['mean_ms']:.3f}ms p99={results[label]['p99_ms']:.3f}ms")
+        return results
+
+    def micro_splice(self):
+        """数千行のエントリのセクション置き換え（解析から置き換えまで）"""
+        from src.utils.diary_entry import parse
+
+        results = {}
+        for lines in (1000, 5000):
+            text = make_content(self.rng, "user000", datetime.datetime.now(), lines=lines) + "## 感想\nよかった\n"
+            results[f"{lines}_lines"] = _time_calls(
+                lambda: parse(text).replace_section('内容', "置き換えた内容"), self.args.micro_iterations
+            )
+            print(f"splice {lines:>5} lines mean={results[f'{lines}_lines']['mean_ms']:.3f}ms")
+        return results
+
+    def _entry_of_size(self, size):
+        text = make_content(self.rng, "user000", datetime.datetime.now(), lines=1)
+        lines = []
+        length = len(text.encode('utf-8'))
+        while length < size:
+            line = self.rng.choice(PHRASES) + self.rng.choice(CLOSINGS)
+            lines.append(line)
+            length += len(line.encode('utf-8')) + 1
+        return text + "\n".join(lines) + "\n"
+
+def _time_calls(func, iterations):
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return {
+        "iterations": iterations,
+        "mean_ms": sum(timings) / len(timings) * 1000,
+        "p50_ms": percentile(timings, 0.50) * 1000,
+        "p99_ms": percentile(timings, 0.99) * 1000
+    }
+
+# 実行順（書き込みはキャッシュの状態を変えるので読み込みの後に行う）
+SCENARIOS = [
+    "today", "history_date", "history_all", "all_first", "date_range",
+    "search_cold", "search", "sync_interactive", "save", "update"
+]
+
+def _git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+async def run_scenarios(args, server, authors, paths):
+    from src.utils import github_utils
+
+    benchmark = Benchmark(args, server, authors, paths)
+    await github_utils.start_write_queue()
+
+    results = {"scenarios": {}, "micro": {}}
+    if not args.no_read_model:
+        # ボットの起動時と同じく、読み取り用のデータベースを同期してから計測する
+        started = time.perf_counter()
+        await github_utils.sync_read_model()
+        results["read_model_sync_s"] = time.perf_counter() - started
+    for name in args.scenarios:
+        if name in ("parse", "splice"):
+            results["micro"][name] = getattr(benchmark, f"micro_{name}")()
+        else:
+            results["scenarios"][name] = await getattr(benchmark, f"scenario_{name}")()
+
+    results["client"] = {
+        "cache": github_utils.get_cache_stats(),
+        "conditional_requests": github_utils.get_conditional_request_stats(),
+        "rate_limit": github_utils.get_rate_limit_stats(),
+        "connections": github_utils.get_connection_stats(),
+        "write_queue": github_utils.get_write_queue_stats(),
+        "read_model": github_utils.get_read_model_stats(),
+        "coalescing": github_utils.get_coalescing_stats()
+    }
+    return results
+
+def compare(previous, current):
+    """前回の結果と比べてp50/p99/スループットの変化を表示する"""
+    print(f"\n{'scenario':<16} {'p50':>18} {'p99':>18} {'throughput':>20}")
+    for name, result in current["scenarios"].items():
+        before = previous.get("scenarios", {}).get(name)
+        if before is None:
+            continue
+
+        def change(old, new):
+            if not old:
+                return "n/a"
+            return f"{old:.1f}->{new:.1f} ({(new - old) / old * 100:+.0f}%)"
+
+        print(
+            f"{name:<16} "
+            f"{change(before['latency_ms']['p50'], result['latency_ms']['p50']):>18} "
+            f"{change(before['latency_ms']['p99'], result['latency_ms']['p99']):>18} "
+            f"{change(before['throughput_per_s'], result['throughput_per_s']):>20}"
+        )
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="日記ボットのベンチマーク（GitHub APIの偽サーバーを使う）")
+    parser.add_argument("--users", type=int, default=10, help="日記を書く人数")
+    parser.add_argument("--years", type=float, default=3, help="日記の期間（年）")
+    parser.add_argument("--density", type=float, default=0.7, help="各ユーザーがある日に日記を書く確率")
+    parser.add_argument("--latency", type=float, default=0.05, help="APIの応答遅延（秒）")
+    parser.add_argument("--jitter", type=float, default=0.02, help="応答遅延に加えるばらつきの最大値（秒）")
+    parser.add_argument("--concurrency", type=int, default=20, help="同時に実行する操作の数")
+    parser.add_argument("--requests", type=int, default=200, help="シナリオごとの操作の回数")
+    parser.add_argument("--micro-iterations", type=int, default=50, help="マイクロベンチマークの繰り返し回数")
+    parser.add_argument("--scenarios", nargs="+", default=SCENARIOS + ["parse", "splice"],
+                        choices=SCENARIOS + ["parse", "splice"], help="実行するシナリオ")
+    parser.add_argument("--no-index", action="store_true", help="diary/index.jsonを置かずに実行する")
+    parser.add_argument("--no-read-model", action="store_true", help="読み取り用のデータベースを同期せずに実行する")
+    parser.add_argument("--seed", type=int, default=1, help="乱数のシード")
+    parser.add_argument("--output", default="benchmark_results.json", help="結果を書き出すJSONファイル")
+    parser.add_argument("--compare", help="比較する前回の結果のJSONファイル")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    previous = None
+    if args.compare:
+        # 出力先と同じファイルでも比べられるよう先に読んでおく
+        with open(args.compare, encoding='utf-8') as f:
+            previous = json.load(f)
+
+    repository = FakeRepository()
+    # 起動時の同期は全エントリを取得するので、利用枠の制御ではなく処理自体の速さを測れるよう枠を大きくする
+    server = FakeGitHub(repository, latency=args.latency, jitter=args.jitter, quota=10 ** 9).start()
+    mirror_dir = tempfile.mkdtemp(prefix="diary-bench-")
+
+    # src を読み込む前に、偽サーバーと一時ディレクトリを使うよう設定する
+    os.environ.update({
+        "GITHUB_TOKEN": "benchmark",
+        "GITHUB_API_URL": server.url,
+        "ALLOWED_CHANNELS": "1",
+        "DIARY_MIRROR_DIR": mirror_dir,
+        "WRITE_QUEUE_WINDOW_SECONDS": "0.05",
+        # 利用枠の制御ではなく処理自体の速さを測る
+        "GITHUB_RATE_PER_SECOND": "100000",
+        "GITHUB_RATE_BURST": "100000"
+    })
+
+    started = time.perf_counter()
+    authors, paths = seed_repository(repository, args.users, args.years, args.density, args.seed, not args.no_index)
+    print(f"Seeded {len(paths)} entries ({args.users} users x {args.years} years) in {time.perf_counter() - started:.1f}s")
+    print(f"Fake GitHub API at {server.url}, mirror at {mirror_dir}\n")
+
+    try:
+        results = asyncio.run(run_scenarios(args, server, authors, paths))
+    finally:
+        server.stop()
+
+    results["meta"] = {
+        "timestamp": datetime.datetime.now().isoformat(timespec='seconds'),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "entries": len(paths),
+        "args": vars(args)
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(results, f, ensure_ascii=False, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if previous is not None:
+        compare(previous, results)
+
+if __name__ == "__main__":
+    main()
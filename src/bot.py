@@ -1,4 +1,8 @@
 import os
+import time
+import signal
+import asyncio
+import datetime
 import discord
 from discord.ext import commands
 from dotenv import load_dotenv
@@ -6,35 +10,125 @@ from dotenv import load_dotenv
 # モジュールのインポート
 from src.commands import diary, history, help
 from src.config import BOT_CONFIG
+from src.utils.github_utils import (
+    start_write_queue, drain_write_queue, start_capture, capture_message, flush_capture, start_read_model_sync
+)
+from src.utils import metrics
 
 # 環境変数の読み込み
 load_dotenv()
 
+# 終了時に書き出し待ちのデータを保存するのに使う最大時間（秒）
+SHUTDOWN_TIMEOUT = 20
+
+class DiaryBot(commands.Bot):
+    """終了前に書き出し待ちの会話とコミット待ちの書き込みをGitHubに保存するBot"""
+
+    async def setup_hook(self):
+        # デプロイ先は再起動やデプロイのたびにSIGTERMを送り、ローカルのディスクも消えるので、
+        # シグナルを受けたら保存してから終了する
+        try:
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, lambda: asyncio.create_task(self.close()))
+        except NotImplementedError:
+            # Windowsではシグナルハンドラを登録できない
+            pass
+
+    async def close(self):
+        try:
+            await asyncio.wait_for(self._save_pending(), SHUTDOWN_TIMEOUT)
+        except Exception as e:
+            print(f"Error saving pending data on shutdown: {e}")
+        await super().close()
+
+    async def _save_pending(self):
+        # 会話を日記に追記してから、その書き込みも含めてコミットする
+        await flush_capture()
+        await drain_write_queue()
+
 # Botの設定
 intents = discord.Intents.default()
 intents.message_content = True
-bot = commands.Bot(command_prefix='!', intents=intents)
+bot = DiaryBot(command_prefix='!', intents=intents)
 
 @bot.event
 async def on_ready():
     """Botが準備完了したときに呼ばれる"""
     print(f'{bot.user} としてログインしました！')
     print(f'対象チャンネル: {BOT_CONFIG["ALLOWED_CHANNELS"]}')
+    
+    # 前回コミットできなかった書き込みを再送
+    await start_write_queue()
+    await start_capture()
+    await start_read_model_sync()
+    
+    # メトリクスの公開
+    if BOT_CONFIG["METRICS_PORT"]:
+        await metrics.start_server(BOT_CONFIG["METRICS_HOST"], BOT_CONFIG["METRICS_PORT"])
+
+@bot.before_invoke
+async def start_command_timer(ctx):
+    """コマンドの処理時間の計測を始める"""
+    ctx.started_at = time.perf_counter()
+
+@bot.after_invoke
+async def record_command_latency(ctx):
+    """コマンドの処理時間を記録する（エラーで終わった場合も呼ばれる）"""
+    status = "error" if ctx.command_failed else "ok"
+    metrics.command_duration.observe(time.perf_counter() - ctx.started_at, ctx.command.qualified_name, status)
+
+# 対話中のコマンド（!new の返信や削除の確認）で使う言葉は会話として記録しない
+CAPTURE_IGNORED_WORDS = ('削除', 'キャンセル')
+
+def _should_capture(message):
+    """会話として日記に記録するメッセージか判定する"""
+    if not BOT_CONFIG["CAPTURE_ENABLED"] or message.author.bot:
+        return False
+    if message.channel.id not in BOT_CONFIG["ALLOWED_CHANNELS"]:
+        return False
+    content = message.content.strip()
+    if content.startswith(BOT_CONFIG["COMMAND_PREFIX"]) or content in CAPTURE_IGNORED_WORDS:
+        return False
+    # 返信はコマンドへの回答として別に保存される
+    if message.reference is not None:
+        return False
+    return bool(content or message.attachments)
 
 @bot.event
 async def on_message(message):
-    # 基本的なメッセージハンドリング
-    # ...
-    
     # コマンド処理を続行
     await bot.process_commands(message)
+    
+    # 許可されたチャンネルの会話をその日の日記に記録する
+    if not _should_capture(message):
+        return
+    
+    now = datetime.datetime.now()
+    lines = [f"{now.strftime('%H:%M')} {message.content.strip()}".rstrip()]
+    for attachment in message.attachments:
+        lines.append(f"- [{attachment.filename}]({attachment.url})")
+    
+    try:
+        await capture_message(
+            message.author.id,
+            message.author.display_name,
+            message.channel.name,
+            now.strftime('%Y-%m-%d'),
+            "\n".join(lines)
+        )
+        await message.add_reaction("📝")
+    except discord.HTTPException as e:
+        print(f"Error adding reaction: {e}")
+    except Exception as e:
+        print(f"Error capturing message: {e}")
 
 # コマンドの登録
 bot.add_command(diary.new_entry)
 bot.add_command(diary.update_entry)
 bot.add_command(diary.delete_entry)
+bot.add_command(diary.rebuild_index)
 bot.add_command(history.get_history)
 bot.add_command(history.today_entry)
+bot.add_command(history.search_entries)
 bot.remove_command('help')
 bot.add_command(help.custom_help)
 
@@ -2,7 +2,8 @@ import discord
 from discord.ext import commands
 import asyncio
 import datetime
-from src.utils.github_utils import save_message_to_github, update_diary_entry, delete_diary_entry, get_diary_entries
+from src.utils.github_utils import save_message_to_github, update_diary_entry, delete_diary_entry, get_own_entry, rebuild_diary_index
+from src.utils.diary_entry import parse_entry
 from src.config import BOT_CONFIG
 
 @commands.command(name='new', aliases=['n'])
@@ -50,7 +51,8 @@ async def new_entry(ctx):
             reply,
             ctx.author.display_name,
             ctx.channel.name,
-            content=reply.content
+            content=reply.content,
+            author_id=ctx.author.id
         )
         
         if success:
@@ -69,17 +71,17 @@ async def update_entry(ctx, file_path=None, *, new_content=None):
         await ctx.send("❌ このチャンネルでは日記を更新できません。")
         return
     
-    # ファイルパスが指定されていない場合、今日の日記を取得
+    # ファイルパスが指定されていない場合、自分の今日の日記を取得
     if file_path is None:
         today = datetime.datetime.now().strftime('%Y-%m-%d')
-        success, entries = await get_diary_entries(today)
+        success, entry = await get_own_entry(today, ctx.author.id, ctx.author.display_name)
         
-        if not success or not entries:
+        if not success:
             await ctx.send(f"📆 今日の日記エントリはありません。`!new`コマンドで新しく作成してください。")
             return
         
-        # 1日1エントリ想定なので最初のエントリを使用
-        file_path = entries[0]['path']
+        # 1日1エントリなので自分のエントリを使用
+        file_path = entry['path']
     
     # 新しい内容が指定されていない場合、インタラクティブモード
     if new_content is None:
@@ -94,19 +96,7 @@ async def update_entry(ctx, file_path=None, *, new_content=None):
                 return
             
             # 内容セクションを抽出
-            diary_content = ""
-            content_section = False
-            
-            for line in content.split('\n'):
-                if line.startswith('## 内容'):
-                    content_section = True
-                    continue
-                elif content_section and line.startswith('##'):
-                    break
-                elif content_section:
-                    diary_content += line + '\n'
-            
-            diary_content = diary_content.strip()
+            diary_content = parse_entry(content).section('内容') or ""
             
             # 現在の内容を表示
             update_msg = await ctx.send(f"更新対象: `{file_path}`\n\n現在の日記内容：\n```\n{diary_content}\n```\n\n新しい内容を返信してください。キャンセルするには「キャンセル」と入力してください。")
@@ -153,17 +143,17 @@ async def delete_entry(ctx, file_path=None):
         await ctx.send("❌ このチャンネルでは日記を削除できません。")
         return
     
-    # ファイルパスが指定されていない場合、今日の日記を取得
+    # ファイルパスが指定されていない場合、自分の今日の日記を取得
     if file_path is None:
         today = datetime.datetime.now().strftime('%Y-%m-%d')
-        success, entries = await get_diary_entries(today)
+        success, entry = await get_own_entry(today, ctx.author.id, ctx.author.display_name)
         
-        if not success or not entries:
+        if not success:
             await ctx.send(f"📆 今日の日記エントリはありません。")
             return
         
-        # 1日1エントリ想定なので最初のエントリを使用
-        file_path = entries[0]['path']
+        # 1日1エントリなので自分のエントリを使用
+        file_path = entry['path']
     
     # 確認メッセージ
     confirm_msg = await ctx.send(f"⚠️ 以下の日記を削除しますか？\nファイル: `{file_path}`\n\n削除するには「削除」と返信してください。キャンセルするには「キャンセル」と入力してください。")
@@ -189,3 +179,19 @@ async def delete_entry(ctx, file_path=None):
             
     except asyncio.TimeoutError:
         await ctx.send("⏰ タイムアウトしました。削除をキャンセルします。")
+
+@commands.command(name='reindex')
+async def rebuild_index(ctx):
+    """日記の一覧（diary/index.json）と読み取り用のデータベースをリポジトリの内容から作り直すコマンド"""
+    # 許可されたチャンネルかチェック
+    if ctx.channel.id not in BOT_CONFIG["ALLOWED_CHANNELS"]:
+        await ctx.send("❌ このチャンネルでは実行できません。")
+        return
+    
+    await ctx.send("🔄 日記の一覧を作り直しています...")
+    success, result = await rebuild_diary_index()
+    
+    if success:
+        await ctx.send(f"✅ 日記の一覧を作り直しました（{result}件）")
+    else:
+        await ctx.send(f"❌ エラー: {result}")
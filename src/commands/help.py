@@ -26,7 +26,7 @@ async def custom_help(ctx):
         },
         {
             "name": "!search (!s) キーワード",
-            "value": "日記をキーワードで検索します。"
+            "value": "日記をキーワードで検索します。スペース区切りで複数の語を含む日記（AND）、`OR`区切りでいずれかを含む日記を探せます。"
         },
         {
             "name": "!update (!u)",
@@ -35,6 +35,10 @@ async def custom_help(ctx):
         {
             "name": "!delete (!d)",
             "value": "今日の日記を削除します。確認メッセージが表示されます。"
+        },
+        {
+            "name": "!reindex",
+            "value": "日記の一覧（`!history all`などで使う索引）と読み取り用のデータベースをリポジトリの内容から作り直します。"
         }
     ]
     
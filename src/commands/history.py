@@ -2,7 +2,9 @@ import discord
 from discord.ext import commands
 import datetime
 import asyncio
-from src.utils.github_utils import get_diary_entries, get_all_diary_entries, get_diary_by_date_range, search_diary_entries
+import contextlib
+from src.utils.github_utils import get_diary_entries, get_own_entry, get_diary_dates, get_diary_by_date_range, iter_search_diary_entries
+from src.utils.diary_entry import parse_entry
 from src.config import BOT_CONFIG
 
 class DiaryView(discord.ui.View):
@@ -46,19 +48,7 @@ class DiaryView(discord.ui.View):
             return
         
         # 内容セクションを抽出
-        diary_content = ""
-        content_section = False
-        
-        for line in content.split('\n'):
-            if line.startswith('## 内容'):
-                content_section = True
-                continue
-            elif content_section and line.startswith('##'):
-                break
-            elif content_section:
-                diary_content += line + '\n'
-        
-        diary_content = diary_content.strip()
+        diary_content = parse_entry(content).section('内容') or ""
         
         # 現在の内容を表示
         update_msg = await channel.send(f"更新対象: `{self.file_path}`\n\n現在の日記内容：\n```\n{diary_content}\n```\n\n新しい内容を返信してください。キャンセルするには「キャンセル」と入力してください。")
@@ -141,6 +131,127 @@ class DeleteConfirmView(discord.ui.View):
         except:
             pass
 
+# 日記一覧の1ページに表示する日数
+DATES_PER_PAGE = 10
+
+class HistoryPageView(discord.ui.View):
+    """日記一覧のページ送り
+
+    ページごとに必要な日付のメタデータだけを取得し、表示したら前後のページを
+    バックグラウンドで先読みしておく。
+    """
+    def __init__(self):
+        super().__init__(timeout=300)  # 5分のタイムアウト
+        self.page = 0
+        self.months = {}
+        self._pages = {}  # ページ番号 -> 読み込みタスク
+        
+        # 前へボタン
+        self.prev_button = discord.ui.Button(style=discord.ButtonStyle.secondary, label="◀ 前へ")
+        self.prev_button.callback = self.prev_callback
+        
+        # 次へボタン
+        self.next_button = discord.ui.Button(style=discord.ButtonStyle.secondary, label="次へ ▶")
+        self.next_button.callback = self.next_callback
+        
+        # 月の選択
+        self.month_select = discord.ui.Select(placeholder="月を選んで移動")
+        self.month_select.callback = self.month_callback
+        
+        self.add_item(self.prev_button)
+        self.add_item(self.next_button)
+        self.add_item(self.month_select)
+    
+    def _load(self, page):
+        """ページの読み込みタスクを返す（失敗したものは読み直す）"""
+        task = self._pages.get(page)
+        if task is None or (task.done() and (task.cancelled() or task.exception() or not task.result()[0])):
+            task = asyncio.create_task(get_diary_dates(page * DATES_PER_PAGE, DATES_PER_PAGE))
+            self._pages[page] = task
+        return task
+    
+    async def render(self, page):
+        """ページの埋め込みを作る（日記がない場合や取得に失敗した場合はNone）"""
+        success, result = await self._load(page)
+        if not success or not result['dates']:
+            return None
+        
+        self.page = page
+        self.months = result['months']
+        page_count = (result['total_dates'] + DATES_PER_PAGE - 1) // DATES_PER_PAGE
+        
+        embed = discord.Embed(
+            title="📚 日記一覧",
+            description=f"合計 {result['total_entries']} 件の日記があります。詳細は `!h 日付` で表示できます。",
+            color=0x3498db
+        )
+        
+        for date, items in result['dates']:
+            authors = '、'.join(dict.fromkeys(item['author'] for item in items))
+            if len(authors) > 100:
+                authors = authors[:97] + '...'
+            embed.add_field(
+                name=f"{date} ({len(items)}件)",
+                value=f"{authors}\n`!h {date}`",
+                inline=True
+            )
+        
+        embed.set_footer(text=f"ページ {page + 1}/{page_count}（全 {result['total_dates']} 日分）")
+        
+        # ボタンと月の選択肢を更新
+        self.prev_button.disabled = page == 0
+        self.next_button.disabled = page + 1 >= page_count
+        self._update_month_options(result['dates'][0][0][:7])
+        
+        # 前後のページを先読み
+        for neighbor in (page - 1, page + 1):
+            if 0 <= neighbor < page_count:
+                self._load(neighbor)
+        
+        return embed
+    
+    def _update_month_options(self, current_month):
+        """表示中の月の前後から選択肢を作る（選択肢は25個まで）"""
+        months = list(self.months)
+        position = months.index(current_month)
+        start = max(0, min(position - 12, len(months) - 25))
+        self.month_select.options = [
+            discord.SelectOption(label=month, value=month, default=month == current_month)
+            for month in months[start:start + 25]
+        ]
+    
+    async def _show(self, interaction, page):
+        # 読み込みに時間がかかっても失敗しないよう先に応答する
+        await interaction.response.defer()
+        embed = await self.render(page)
+        
+        if embed is None:
+            await interaction.followup.send("❌ 日記一覧の取得に失敗しました。", ephemeral=True)
+            return
+        
+        await interaction.edit_original_response(embed=embed, view=self)
+    
+    async def prev_callback(self, interaction):
+        await self._show(interaction, self.page - 1)
+    
+    async def next_callback(self, interaction):
+        await self._show(interaction, self.page + 1)
+    
+    async def month_callback(self, interaction):
+        month = self.month_select.values[0]
+        await self._show(interaction, self.months[month] // DATES_PER_PAGE)
+    
+    async def on_timeout(self):
+        # タイムアウト時の処理
+        for item in self.children:
+            item.disabled = True
+        
+        try:
+            if hasattr(self, "message"):
+                await self.message.edit(view=self)
+        except:
+            pass
+
 @commands.command(name='history', aliases=['h'])
 async def get_history(ctx, date_arg='0'):
     """日記履歴を表示するコマンド
@@ -185,32 +296,21 @@ async def get_history(ctx, date_arg='0'):
                 color=0x3498db
             )
             
-            # コンテンツから情報を抽出（簡易パース）
-            lines = entry['content'].split('\n')
-            author = "不明"
-            sections = {}
-            current_section = None
-            
-            for line in lines:
-                if line.startswith('# ') and '日記エントリ' in line:
-                    author = line.replace('# ', '').replace('の日記エントリ', '')
-                elif line.startswith('## '):
-                    current_section = line[3:]
-                    sections[current_section] = ""
-                elif current_section:
-                    sections[current_section] += line + '\n'
+            # コンテンツから情報を抽出（同じ内容は一度だけ解析される）
+            parsed = parse_entry(entry['content'], entry.get('sha'))
+            author = parsed.author or "不明"
             
             embed.add_field(name="投稿者", value=author, inline=True)
             embed.add_field(name="ファイル", value=entry['filename'], inline=True)
             
             # 各セクションを埋め込みに追加
-            for section, content in sections.items():
-                if section != "日時" and section != "チャンネル" and content.strip():
+            for section, content in parsed.sections():
+                if section != "日時" and section != "チャンネル" and content:
                     # 内容が長い場合は切り詰める
                     if len(content) > 1024:
                         content = content[:1021] + '...'
                     
-                    embed.add_field(name=section, value=content.strip() or "内容なし", inline=False)
+                    embed.add_field(name=section, value=content, inline=False)
             
             # ここでViewを追加
             view = DiaryView(entry['path'])
@@ -220,57 +320,27 @@ async def get_history(ctx, date_arg='0'):
         await ctx.send(f"❌ エラー: {e}")
 
 async def show_all_entries(ctx):
-    """すべての日記エントリを一覧表示"""
-    # すべての日記エントリを取得
-    success, all_entries = await get_all_diary_entries()
+    """すべての日記エントリを一覧表示（ページ送り）"""
+    view = HistoryPageView()
+    embed = await view.render(0)
     
-    if not success or not all_entries:
+    if embed is None:
         await ctx.send("📆 日記エントリはありません。")
         return
     
-    # 日付ごとにグループ化
-    entries_by_date = {}
-    for entry in all_entries:
-        date = entry['date']
-        if date not in entries_by_date:
-            entries_by_date[date] = []
-        entries_by_date[date].append(entry)
-    
-    # 日付順に並べ替え（新しい順）
-    sorted_dates = sorted(entries_by_date.keys(), reverse=True)
-    
-    # 一覧を表示
-    embed = discord.Embed(
-        title="📚 日記一覧",
-        description=f"合計 {len(all_entries)} 件の日記があります。詳細を見るには日付をクリックしてください。",
-        color=0x3498db
-    )
-    
-    for date in sorted_dates[:25]:  # 最新25日分だけ表示
-        count = len(entries_by_date[date])
-        embed.add_field(
-            name=f"{date} ({count}件)",
-            value=f"`!h {date}` で詳細表示",
-            inline=True
-        )
-    
-    if len(sorted_dates) > 25:
-        embed.set_footer(text=f"他 {len(sorted_dates) - 25} 日分の日記があります")
-    
-    await ctx.send(embed=embed)
+    view.message = await ctx.send(embed=embed, view=view)
 
 @commands.command(name='today', aliases=['t'])
 async def today_entry(ctx):
     """今日の日記を表示するシンプルなコマンド"""
     today = datetime.datetime.now().strftime('%Y-%m-%d')
-    success, entries = await get_diary_entries(today)
+    success, entry = await get_own_entry(today, ctx.author.id, ctx.author.display_name)
     
-    if not success or not entries:
+    if not success:
         await ctx.send(f"📆 今日はまだ日記が書かれていません。`!new`コマンドで日記を書きましょう。")
         return
     
-    # 1人1日1件なので最初のエントリを表示
-    entry = entries[0]
+    # 1人1日1件なので自分のエントリを表示
     
     embed = discord.Embed(
         title=f"📔 今日の日記",
@@ -279,23 +349,15 @@ async def today_entry(ctx):
     )
     
     # 内容のセクションを抽出
-    sections = {}
-    current_section = None
-    
-    for line in entry['content'].split('\n'):
-        if line.startswith('## '):
-            current_section = line[3:]
-            sections[current_section] = ""
-        elif current_section:
-            sections[current_section] += line + '\n'
+    parsed = parse_entry(entry['content'], entry.get('sha'))
     
     # 各セクションを埋め込みに追加
-    for section, content in sections.items():
-        if section != "日時" and section != "チャンネル" and content.strip():  # メタデータは除外
+    for section, content in parsed.sections():
+        if section != "日時" and section != "チャンネル" and content:  # メタデータは除外
             if len(content) > 1024:
                 content = content[:1021] + '...'
             
-            embed.add_field(name=section, value=content.strip(), inline=False)
+            embed.add_field(name=section, value=content, inline=False)
     
     # ここでViewを追加
     view = DiaryView(entry['path'])
@@ -303,6 +365,9 @@ async def today_entry(ctx):
     embed.set_footer(text=f"ファイル: {entry['filename']}")
     await ctx.send(embed=embed, view=view)
 
+# !search で詳細を表示する件数
+SEARCH_RESULTS_SHOWN = 5
+
 @commands.command(name='search', aliases=['s'])
 async def search_entries(ctx, *, keyword):
     """日記エントリをキーワードで検索するコマンド"""
@@ -312,44 +377,58 @@ async def search_entries(ctx, *, keyword):
     
     await ctx.send(f"🔍 「{keyword}」で検索中...")
     
-    # 検索を実行
-    success, results = await search_diary_entries(keyword)
+    # 検索を実行（表示する上位の件数だけ読み込む）
+    total = 0
+    results = []
+    try:
+        async with contextlib.aclosing(iter_search_diary_entries(keyword)) as matches:
+            async for total, entry in matches:
+                results.append(entry)
+                if len(results) >= SEARCH_RESULTS_SHOWN:
+                    break
+    except Exception as e:
+        print(f"Error searching diary entries: {e}")
+        await ctx.send(f"❌ エラー: {e}")
+        return
     
-    if not success or not results:
+    if not results:
         await ctx.send(f"❌ キーワード「{keyword}」を含む日記は見つかりませんでした。")
         return
     
     # 検索結果を表示
     embed = discord.Embed(
         title=f"🔍 検索結果: {keyword}",
-        description=f"{len(results)} 件の日記が見つかりました",
+        description=f"{total} 件の日記が見つかりました",
         color=0x3498db
     )
     
-    # 最新の5件だけ詳細表示
-    for i, entry in enumerate(results[:5]):
+    # スコアの高い上位の件数だけ詳細表示
+    for entry in results:
         date = entry['date']
         
-        # コンテキストを抽出（キーワードを含む部分の前後の文章）
-        content = entry['content'].lower()
-        keyword_pos = content.find(keyword.lower())
+        # コンテキストを抽出（インデックスが返したスニペット範囲を使う）
+        content = entry['content']
+        start, end = entry['snippet']
+        end = min(len(content), end)
         
-        if keyword_pos != -1:
-            start = max(0, keyword_pos - 50)
-            end = min(len(content), keyword_pos + len(keyword) + 50)
-            
-            # コンテキストの整形
-            context = "..." if start > 0 else ""
-            context += content[start:end].replace(keyword.lower(), f"**{keyword.lower()}**")
-            context += "..." if end < len(content) else ""
-            
-            embed.add_field(
-                name=f"{date}",
-                value=context,
-                inline=False
-            )
+        # コンテキストの整形（一致した箇所を太字にする）
+        context = "..." if start > 0 else ""
+        position = start
+        for match_start, match_end in entry['matches']:
+            if match_start < position or match_end > end:
+                continue
+            context += content[position:match_start] + f"**{content[match_start:match_end]}**"
+            position = match_end
+        context += content[position:end]
+        context += "..." if end < len(content) else ""
+        
+        embed.add_field(
+            name=f"{date}",
+            value=context,
+            inline=False
+        )
     
-    if len(results) > 5:
-        embed.set_footer(text=f"他 {len(results) - 5} 件の結果があります")
+    if total > len(results):
+        embed.set_footer(text=f"他 {total - len(results)} 件の結果があります")
     
     await ctx.send(embed=embed)
@@ -9,8 +9,45 @@ BOT_CONFIG = {
     "DISCORD_TOKEN": os.getenv('DISCORD_TOKEN'),
     "GITHUB_TOKEN": os.getenv('GITHUB_TOKEN'),
     "GITHUB_REPO": 'veisz3/diary-repo',
+    # GitHub APIのURL（GitHub Enterpriseやベンチマーク用の偽サーバーを使う場合に変更）
+    "GITHUB_API_URL": os.getenv('GITHUB_API_URL', 'https://api.github.com'),
     "ALLOWED_CHANNELS": list(map(int, os.getenv('ALLOWED_CHANNELS').split(','))),
     "COMMAND_PREFIX": "!",
     # 1日1件の制限（同じ日・同じユーザーの場合は上書き）
-    "ONE_ENTRY_PER_DAY": True
+    "ONE_ENTRY_PER_DAY": True,
+    # GitHub APIを同時に呼び出すワーカースレッド数
+    "GITHUB_MAX_WORKERS": int(os.getenv('GITHUB_MAX_WORKERS', '8')),
+    # GitHub APIのHTTP接続プールの大きさ・再試行回数・タイムアウト（秒）
+    "GITHUB_POOL_SIZE": int(os.getenv('GITHUB_POOL_SIZE', '10')),
+    "GITHUB_RETRIES": int(os.getenv('GITHUB_RETRIES', '3')),
+    "GITHUB_TIMEOUT": int(os.getenv('GITHUB_TIMEOUT', '15')),
+    # 同時に来た同じ読み込みをまとめたとき、待っている全員をあきらめさせるまでの時間（秒）
+    "GITHUB_COALESCE_TIMEOUT": float(os.getenv('GITHUB_COALESCE_TIMEOUT_SECONDS', '60')),
+    # ETagで再検証するために保存しておくGET応答の本文の合計の上限（バイト）
+    "GITHUB_ETAG_CACHE_BYTES": int(os.getenv('GITHUB_ETAG_CACHE_BYTES', '8388608')),
+    # GitHub APIを呼び出す速さ（1秒あたりの回数）と一度に使える回数
+    "GITHUB_RATE_PER_SECOND": float(os.getenv('GITHUB_RATE_PER_SECOND', '10')),
+    "GITHUB_RATE_BURST": int(os.getenv('GITHUB_RATE_BURST', '20')),
+    # APIの残り利用枠がこれを下回ったら一括取得などのバックグラウンド処理を止める
+    "GITHUB_QUOTA_RESERVE": int(os.getenv('GITHUB_QUOTA_RESERVE', '500')),
+    # 日記リポジトリのローカルミラーの保存先（未コミットの書き込みのWALと会話のジャーナルも置くので、
+    # 再起動やデプロイで消えない永続ストレージを指定する）
+    "MIRROR_DIR": os.getenv('DIARY_MIRROR_DIR', '.diary_mirror'),
+    # 読み込みキャッシュの有効期限（秒）と最大件数
+    "CACHE_TTL": int(os.getenv('CACHE_TTL_SECONDS', '60')),
+    "CACHE_MAX_ENTRIES": int(os.getenv('CACHE_MAX_ENTRIES', '256')),
+    # 読み取り用のデータベースをリポジトリと同期する間隔（秒）
+    "READ_MODEL_SYNC_INTERVAL": float(os.getenv('READ_MODEL_SYNC_SECONDS', '60')),
+    # 書き込みをまとめてコミットするまでの待ち時間（秒）
+    "WRITE_QUEUE_WINDOW": float(os.getenv('WRITE_QUEUE_WINDOW_SECONDS', '2')),
+    # 許可されたチャンネルの会話を自動で日記に記録するか
+    "CAPTURE_ENABLED": os.getenv('CAPTURE_ENABLED', 'true').lower() != 'false',
+    # 会話を日記に書き出すまでの待ち時間（秒、この間発言がなければ書き出す）と1人分の最大文字数
+    "CAPTURE_IDLE": float(os.getenv('CAPTURE_IDLE_SECONDS', '600')),
+    "CAPTURE_MAX_CHARS": int(os.getenv('CAPTURE_MAX_CHARS', '4000')),
+    # 書き出し待ちの会話を全体で何文字まで保持するか（超えたら古いものから書き出す）
+    "CAPTURE_MAX_TOTAL_CHARS": int(os.getenv('CAPTURE_MAX_TOTAL_CHARS', '200000')),
+    # /metrics を公開するアドレスとポート（認証がないので、ポートを指定したときだけ公開し、既定ではローカルからのみ受け付ける）
+    "METRICS_HOST": os.getenv('METRICS_HOST', '127.0.0.1'),
+    "METRICS_PORT": int(os.getenv('METRICS_PORT', '0'))
 }
\ No newline at end of file
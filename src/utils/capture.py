@@ -0,0 +1,188 @@
+import os
+import json
+import asyncio
+
+class CaptureBuffer:
+    """チャンネルの会話を投稿者・日付ごとにためて、まとめて日記に追記するバッファ
+
+    メッセージはまずディスク上のジャーナルに追記されるので、プロセスが落ちても次回起動時に復元される。
+    投稿者がしばらく発言しなくなるか、1人分の文字数が上限を超えると、その日のエントリに1回で追記する
+    （追記は書き込みキューでさらに1つのコミットにまとめられる）。
+    全体でためている文字数が上限を超えたら、古いバッファを書き出し終わるまで追加を待たせる。
+    """
+
+    def __init__(self, journal_path, idle_seconds, max_chars, max_total_chars, flush_func, retry_delay=30.0):
+        self.journal_path = journal_path
+        self.idle_seconds = idle_seconds
+        self.max_chars = max_chars
+        self.max_total_chars = max_total_chars
+        self.retry_delay = retry_delay
+        # flush_func(投稿者名, チャンネル名, 日付, 文章, 投稿者ID) はその日のエントリに追記して (成功したか, 結果) を返す
+        self._flush = flush_func
+        self._buffers = {}   # (投稿者ID, 日付) -> {"author", "channel", "lines", "chars"}
+        self._timers = {}    # (投稿者ID, 日付) -> 書き出しを待つタスク
+        self._total_chars = 0
+        self._started = False
+        self._journal_lock = asyncio.Lock()
+        self._flush_lock = asyncio.Lock()
+
+        # 統計
+        self.captured = 0
+        self.flush_count = 0
+        self.failure_count = 0
+
+    async def start(self):
+        """ジャーナルに残っている会話を読み込み、書き出しを再開する"""
+        if self._started:
+            return
+        self._started = True
+
+        records = await asyncio.to_thread(self._read_journal)
+        for record in records:
+            self._apply(record)
+        if self._buffers:
+            print(f"Replaying {len(self._buffers)} buffered conversations")
+            for key in self._buffers:
+                self._schedule_flush(key)
+
+    def _read_journal(self):
+        records = []
+        try:
+            with open(self.journal_path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        # 書き込み途中で落ちた最後の行は捨てる
+                        continue
+        except FileNotFoundError:
+            pass
+        return records
+
+    def _append_journal(self, record):
+        # 会話の1行ごとにfsyncはしない（落ちても失うのは直前の数行だけ）
+        os.makedirs(os.path.dirname(self.journal_path) or '.', exist_ok=True)
+        with open(self.journal_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+
+    def _rewrite_journal(self, records):
+        tmp_path = self.journal_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.journal_path)
+
+    def _records(self):
+        """現在のバッファをジャーナルの形式で返す"""
+        records = []
+        for (author_id, date), buffer in self._buffers.items():
+            for line in buffer["lines"]:
+                records.append({
+                    "author_id": author_id,
+                    "date": date,
+                    "author": buffer["author"],
+                    "channel": buffer["channel"],
+                    "line": line
+                })
+        return records
+
+    def _apply(self, record):
+        key = (record["author_id"], record["date"])
+        buffer = self._buffers.get(key)
+        if buffer is None:
+            buffer = self._buffers[key] = {"author": record["author"], "channel": record["channel"], "lines": [], "chars": 0}
+        buffer["lines"].append(record["line"])
+        buffer["chars"] += len(record["line"])
+        self._total_chars += len(record["line"])
+        return key
+
+    async def add(self, author_id, author_name, channel_name, date, line):
+        """会話の1行をバッファに追加する（ジャーナルに書き込んだ時点で戻る）"""
+        await self.start()
+
+        # 全体の上限を超えている間は古いバッファから書き出して空きを作る
+        while self._buffers and self._total_chars + len(line) > self.max_total_chars:
+            oldest = next(iter(self._buffers))
+            if not await self.flush(oldest):
+                await asyncio.sleep(self.retry_delay)
+
+        async with self._journal_lock:
+            record = {"author_id": author_id, "date": date, "author": author_name, "channel": channel_name, "line": line}
+            await asyncio.to_thread(self._append_journal, record)
+            key = self._apply(record)
+        self.captured += 1
+
+        if self._buffers[key]["chars"] >= self.max_chars:
+            await self.flush(key)
+        else:
+            self._schedule_flush(key)
+
+    def _schedule_flush(self, key, delay=None):
+        """しばらく発言がなければ書き出す（発言のたびに待ち時間をやり直す）"""
+        timer = self._timers.get(key)
+        if timer is not None and timer is not asyncio.current_task():
+            timer.cancel()
+        self._timers[key] = asyncio.create_task(self._flush_later(key, self.idle_seconds if delay is None else delay))
+
+    async def _flush_later(self, key, delay):
+        await asyncio.sleep(delay)
+        if self._timers.get(key) is asyncio.current_task():
+            del self._timers[key]
+        await self.flush(key)
+
+    async def flush(self, key):
+        """1人1日分のバッファをエントリに追記する（成功したかを返す）"""
+        async with self._flush_lock:
+            buffer = self._buffers.pop(key, None)
+            if buffer is None:
+                return True
+            self._total_chars -= buffer["chars"]
+            timer = self._timers.pop(key, None)
+            if timer is not None and timer is not asyncio.current_task():
+                timer.cancel()
+
+            success, result = await self._flush(
+                buffer["author"], buffer["channel"], key[1], "\n".join(buffer["lines"]), key[0]
+            )
+            if not success:
+                self.failure_count += 1
+                print(f"Error flushing captured conversation: {result}")
+                # 書き出している間に来た発言の前に戻す
+                newer = self._buffers.pop(key, None)
+                if newer is not None:
+                    buffer["lines"].extend(newer["lines"])
+                    buffer["chars"] += newer["chars"]
+                self._buffers = {key: buffer, **self._buffers}
+                self._total_chars += buffer["chars"]
+                self._schedule_flush(key, self.retry_delay)
+                return False
+
+            self.flush_count += 1
+            # 書き出した分をジャーナルから取り除く
+            async with self._journal_lock:
+                await asyncio.to_thread(self._rewrite_journal, self._records())
+            return True
+
+    async def flush_all(self):
+        """すべてのバッファを書き出す（終了前に呼ぶ）。書き出せなかったバッファの数を返す"""
+        failed = 0
+        for key in list(self._buffers):
+            if not await self.flush(key):
+                failed += 1
+        return failed
+
+    def depth(self):
+        """書き出し待ちの行数"""
+        return sum(len(buffer["lines"]) for buffer in self._buffers.values())
+
+    def stats(self):
+        return {
+            "buffers": len(self._buffers),
+            "lines": self.depth(),
+            "chars": self._total_chars,
+            "captured": self.captured,
+            "flushes": self.flush_count,
+            "failures": self.failure_count
+        }
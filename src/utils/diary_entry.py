@@ -0,0 +1,172 @@
+import hashlib
+from src.utils.cache import TTLCache
+
+# 解析済みエントリを保持する数（blob SHAは内容が変われば変わるので期限は不要）
+PARSED_CACHE_SIZE = 512
+
+_parsed_cache = TTLCache(PARSED_CACHE_SIZE, float('inf'))
+
+# タイトルの下に埋め込む投稿者のDiscordユーザーID（GitHubでもDiscordでも表示されない）
+AUTHOR_ID_PREFIX = '<!-- author_id:'
+AUTHOR_ID_SUFFIX = '-->'
+
+def author_id_line(author_id):
+    return f"{AUTHOR_ID_PREFIX} {author_id} {AUTHOR_ID_SUFFIX}"
+
+class DiaryEntry:
+    """解析済みの日記エントリ
+
+    セクションは元の文章への位置（見出しの開始, 本文の開始, 本文の終了）として持ち、
+    本文の文字列は必要になったときだけ切り出す。
+    """
+
+    __slots__ = ('text', 'title', 'author_id', '_sections', '_index')
+
+    def __init__(self, text, title, sections, author_id=None):
+        self.text = text
+        self.title = title
+        self.author_id = author_id  # 投稿者のDiscordユーザーID（古いエントリにはない）
+        self._sections = sections  # [(セクション名, 見出しの開始, 本文の開始, 本文の終了), ...]
+        self._index = {}
+        for i, section in enumerate(sections):
+            self._index.setdefault(section[0], i)
+
+    @property
+    def author(self):
+        """「# ○○の日記エントリ」の○○部分（見つからなければNone）"""
+        if self.title is None or '日記エントリ' not in self.title:
+            return None
+        return self.title.replace('の日記エントリ', '')
+
+    def section_names(self):
+        return [section[0] for section in self._sections]
+
+    def section_span(self, name):
+        """セクションの (見出しの開始, 本文の開始, 本文の終了) を返す（ない場合はNone）"""
+        i = self._index.get(name)
+        if i is None:
+            return None
+        return self._sections[i][1:]
+
+    def section(self, name):
+        """セクションの本文を前後の空白を除いて返す（ない場合はNone）"""
+        span = self.section_span(name)
+        if span is None:
+            return None
+        return self.text[span[1]:span[2]].strip()
+
+    def sections(self):
+        """(セクション名, 本文) を出現順に返す"""
+        for name, _, body_start, body_end in self._sections:
+            yield name, self.text[body_start:body_end].strip()
+
+    # 以下の編集用メソッドは元の文章を変更せず、編集後の文章を返す。
+    # どれも位置情報をもとにスライスをつなぐだけなので、文章の長さに対して線形時間で済む。
+
+    def replace_section(self, name, body):
+        """セクションの本文を置き換える（ない場合は末尾に追加する）"""
+        span = self.section_span(name)
+        if span is None:
+            return self.insert_section(name, body)
+        _, body_start, body_end = span
+        return _splice(self.text, body_start, body_end, _format_body(body, body_end == len(self.text)))
+
+    def append_to_section(self, name, body):
+        """セクションの本文の末尾に追記する（ない場合は末尾に追加する）"""
+        current = self.section(name)
+        if current is None:
+            return self.insert_section(name, body)
+        return self.replace_section(name, f"{current}\n{body}" if current else body)
+
+    def insert_section(self, name, body, after=None):
+        """新しいセクションを追加する（afterのセクションの直後、指定がなければ末尾）"""
+        span = self.section_span(after) if after is not None else None
+        position = span[2] if span is not None else len(self.text)
+        last = position == len(self.text)
+
+        before = self.text[:position]
+        if before and not before.endswith('\n\n'):
+            before = before.rstrip('\n') + '\n\n'
+        return before + f"## {name}\n" + _format_body(body, last) + self.text[position:]
+
+    def keep_sections(self, names):
+        """タイトル部分と指定したセクションだけを残した文章を返す"""
+        first_heading = self._sections[0][1] if self._sections else len(self.text)
+        parts = [self.text[:first_heading]]
+        for name, heading_start, _, body_end in self._sections:
+            if name in names:
+                parts.append(self.text[heading_start:body_end])
+        return ''.join(parts)
+
+def _format_body(body, last):
+    """セクションの本文を整形する（次のセクションとの間は空行で区切る）"""
+    body = body.strip('\n')
+    if not body:
+        return '\n' if last else '\n\n'
+    return body + ('\n' if last else '\n\n')
+
+def _splice(text, start, end, replacement):
+    """text[start:end] を置き換える"""
+    before = text[:start]
+    if before and not before.endswith('\n'):
+        # 見出しが改行なしで終わっている場合
+        before += '\n'
+    return before + replacement + text[end:]
+
+def parse(text):
+    """マークダウンを1回の走査で解析する
+
+    「# 」で始まる最初の行（セクションより前のもの）をタイトル、「## 」で始まる行を
+    セクションの見出しとして扱う。セクション内の「# 」や「### 」は本文の一部になる。
+    セクションより前の「<!-- author_id: ... -->」の行は投稿者のIDとして読む。
+    """
+    title = None
+    author_id = None
+    sections = []
+    current = None  # [名前, 見出しの開始, 本文の開始]
+    position = 0
+    length = len(text)
+
+    while position < length:
+        line_end = text.find('\n', position)
+        if line_end == -1:
+            line_end = length
+        next_position = line_end + 1
+
+        if text.startswith('## ', position):
+            if current is not None:
+                sections.append((current[0], current[1], current[2], position))
+            current = [text[position + 3:line_end].strip(), position, min(next_position, length)]
+        elif current is None and title is None and text.startswith('# ', position):
+            title = text[position + 2:line_end].strip()
+        elif current is None and text.startswith(AUTHOR_ID_PREFIX, position):
+            value = text[position + len(AUTHOR_ID_PREFIX):line_end].replace(AUTHOR_ID_SUFFIX, '').strip()
+            if value.isdigit():
+                author_id = int(value)
+
+        position = next_position
+
+    if current is not None:
+        sections.append((current[0], current[1], current[2], length))
+
+    return DiaryEntry(text, title, sections, author_id)
+
+def blob_sha(text):
+    """gitのblob SHAを計算する（GitHubが返すSHAと同じ値になる）"""
+    data = text.encode('utf-8')
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+def parse_entry(text, sha=None):
+    """エントリを解析する（同じblob SHAの内容は一度しか解析しない）"""
+    if sha is None:
+        sha = blob_sha(text)
+
+    entry = _parsed_cache.get(sha)
+    if entry is None:
+        entry = parse(text)
+        _parsed_cache.set(sha, entry)
+    return entry
+
+def get_parse_cache_stats():
+    """解析済みエントリのキャッシュ統計を返す"""
+    return _parsed_cache.stats()
@@ -0,0 +1,245 @@
+import re
+import threading
+from collections import OrderedDict
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.util.retry import Retry
+from github.Requester import Requester, RequestsResponse, HTTPRequestsConnectionClass, HTTPSRequestsConnectionClass
+
+# PyGithubは既定でクライアントごとに1つの接続オブジェクトを使い回すが、
+# その接続オブジェクトはスレッドセーフではない。ここでは接続オブジェクトを
+# リクエストごとに作り、実際のHTTP接続は共有セッションのプールから再利用する。
+# GETはETag/Last-Modifiedで再検証し、変わっていなければ保存した応答を返す。
+# SHAで指定するblob・ツリー・コミットは内容が変わらず、blobはミラーが保存しているので対象にしない。
+
+_session = None
+_session_lock = threading.Lock()
+_conditional_cache = None
+_response_listener = None
+
+def install(pool_size, retries, conditional_cache_bytes=8 * 1024 * 1024, on_response=None):
+    """PyGithubが共有のキープアライブ接続プールと条件付きリクエストを使うように設定する
+
+    on_response(ステータス, ヘッダー) はすべての応答で呼ばれる（レート制限の追跡用）。
+    """
+    global _session, _conditional_cache, _response_listener
+
+    with _session_lock:
+        retry = Retry(
+            total=retries,
+            backoff_factor=0.5,
+            status_forcelist=[500, 502, 503, 504],
+            # 冪等なメソッドだけ再試行する
+            allowed_methods=["GET", "HEAD"],
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=retry
+        )
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _session = session
+        _conditional_cache = ConditionalCache(conditional_cache_bytes)
+        _response_listener = on_response
+
+    Requester.injectConnectionClasses(PooledHTTPConnection, PooledHTTPSConnection)
+
+def _get_session():
+    if _session is None:
+        raise RuntimeError("github_http.install() has not been called")
+    return _session
+
+def connection_stats():
+    """接続プールの統計（リクエスト数・新規接続数・再利用率）を返す"""
+    requests_count = 0
+    connections_count = 0
+    if _session is not None:
+        for adapter in set(_session.adapters.values()):
+            pools = adapter.poolmanager.pools
+            for key in pools.keys():
+                pool = pools.get(key)
+                if pool is None:
+                    continue
+                requests_count += pool.num_requests
+                connections_count += pool.num_connections
+
+    return {
+        "requests": requests_count,
+        "connections": connections_count,
+        "reuse_ratio": 1 - connections_count / requests_count if requests_count else 0.0
+    }
+
+def conditional_stats():
+    """条件付きリクエストの統計（304と200の比率、節約できたAPI呼び出し数）を返す"""
+    if _conditional_cache is None:
+        return ConditionalCache(0).stats()
+    return _conditional_cache.stats()
+
+# SHAで内容が決まるGitオブジェクトのURL（再検証しても変わらないのでキャッシュしない）
+_CONTENT_ADDRESSED = re.compile(r"/git/(?:blobs|trees|commits)/[0-9a-f]{40}(?:\?|$)")
+
+def _is_content_addressed(url):
+    return _CONTENT_ADDRESSED.search(url) is not None
+
+# 304のときにキャッシュした応答へ上書きするヘッダー（残りのAPI呼び出し数などは最新にする）
+_FRESH_HEADERS = (
+    "date",
+    "x-ratelimit-limit",
+    "x-ratelimit-remaining",
+    "x-ratelimit-reset",
+    "x-ratelimit-used",
+    "x-ratelimit-resource"
+)
+
+class ConditionalCache:
+    """GETの応答をETag/Last-Modifiedと一緒に保存し、再検証に使うキャッシュ
+
+    GitHubは304（Not Modified）の応答をAPIの利用上限に数えないので、
+    変わっていないデータの読み込みは上限を消費しない。
+    応答の大きさはまちまちなので、件数ではなく本文の合計バイト数で上限を決める。
+    """
+
+    def __init__(self, maxbytes):
+        self.maxbytes = maxbytes
+        self.not_modified = 0   # 304でキャッシュから返した数
+        self.fetched = 0        # 200で本文を受け取った数
+        self._data = OrderedDict()  # (URL, Accept) -> (ETag, Last-Modified, ヘッダー, 本文, バイト数)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def conditional_headers(self, key):
+        """再検証用のヘッダーを返す（キャッシュがなければ空）"""
+        with self._lock:
+            item = self._data.get(key)
+        if item is None:
+            return {}
+        etag, last_modified = item[0], item[1]
+        headers = {}
+        if etag:
+            headers["If-None-Match"] = etag
+        if last_modified:
+            headers["If-Modified-Since"] = last_modified
+        return headers
+
+    def store(self, key, response):
+        """200の応答を保存する（検証子がない応答や上限より大きい応答は保存しない）"""
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        size = len(response.content)
+        with self._lock:
+            self.fetched += 1
+            self._remove(key)
+            if (not etag and not last_modified) or size > self.maxbytes:
+                return
+            self._data[key] = (etag, last_modified, CaseInsensitiveDict(response.headers), response.text, size)
+            self._bytes += size
+            # 合計が上限を超えたら最も古く使われたものから追い出す
+            while self._bytes > self.maxbytes:
+                _, evicted = self._data.popitem(last=False)
+                self._bytes -= evicted[4]
+
+    def _remove(self, key):
+        item = self._data.pop(key, None)
+        if item is not None:
+            self._bytes -= item[4]
+
+    def revalidated(self, key, response):
+        """304の応答に対してキャッシュした応答を返す（キャッシュが消えていればNone）"""
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            self._data.move_to_end(key)
+            self.not_modified += 1
+
+        headers = CaseInsensitiveDict(item[2])
+        for name in _FRESH_HEADERS:
+            if name in response.headers:
+                headers[name] = response.headers[name]
+        return _CachedResponse(headers, item[3])
+
+    def stats(self):
+        with self._lock:
+            return {
+                "not_modified": self.not_modified,
+                "fetched": self.fetched,
+                "not_modified_ratio": self.not_modified / (self.not_modified + self.fetched)
+                if self.not_modified + self.fetched else 0.0,
+                "quota_saved": self.not_modified,
+                "size": len(self._data),
+                "bytes": self._bytes
+            }
+
+class _CachedResponse:
+    """キャッシュした応答（PyGithubが使うhttplib風のインターフェース）"""
+
+    def __init__(self, headers, text):
+        self.status = 200
+        self.headers = headers
+        self.text = text
+
+    def getheaders(self):
+        return self.headers.items()
+
+    def read(self):
+        return self.text
+
+class _PooledConnectionMixin:
+    """共有セッションでリクエストを送り、GETは条件付きリクエストにする"""
+
+    def getresponse(self):
+        url = f"{self.protocol}://{self.host}:{self.port}{self.url}"
+        headers = dict(self.headers)
+
+        key = None
+        if self.verb == "GET" and _conditional_cache is not None and not _is_content_addressed(url):
+            key = (url, headers.get("Accept"))
+            headers.update(_conditional_cache.conditional_headers(key))
+
+        r = self.session.request(
+            self.verb,
+            url,
+            headers=headers,
+            data=self.input,
+            timeout=self.timeout,
+            verify=self.verify,
+            allow_redirects=False
+        )
+
+        if _response_listener is not None:
+            _response_listener(r.status_code, r.headers)
+
+        if key is not None:
+            if r.status_code == 304:
+                cached = _conditional_cache.revalidated(key, r)
+                if cached is not None:
+                    return cached
+            elif r.status_code == 200:
+                _conditional_cache.store(key, r)
+        return RequestsResponse(r)
+
+class PooledHTTPSConnection(_PooledConnectionMixin, HTTPSRequestsConnectionClass):
+    """共有セッションを使うHTTPS接続（リクエストごとに作られる軽量なオブジェクト）"""
+
+    def __init__(self, host, port=None, strict=False, timeout=None, retry=None, pool_size=None, **kwargs):
+        self.port = port if port else 443
+        self.host = host
+        self.protocol = "https"
+        self.timeout = timeout
+        self.verify = kwargs.get("verify", True)
+        self.session = _get_session()
+
+class PooledHTTPConnection(_PooledConnectionMixin, HTTPRequestsConnectionClass):
+    """共有セッションを使うHTTP接続（GitHub Enterpriseやローカルのテスト用サーバー向け）"""
+
+    def __init__(self, host, port=None, strict=False, timeout=None, retry=None, pool_size=None, **kwargs):
+        self.port = port if port else 80
+        self.host = host
+        self.protocol = "http"
+        self.timeout = timeout
+        self.verify = kwargs.get("verify", True)
+        self.session = _get_session()
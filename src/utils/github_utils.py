@@ -1,28 +1,266 @@
+import asyncio
+import collections
+import contextlib
 import datetime
 import base64
-from github import Github, GithubException
+import functools
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from github import Github, GithubException, InputGitTreeElement
 from src.config import BOT_CONFIG
+from src.utils import github_http
+from src.utils import metrics
+from src.utils import manifest as diary_index
+from src.utils.cache import TTLCache
+from src.utils.capture import CaptureBuffer
+from src.utils.rate_limit import RateLimitScheduler, INTERACTIVE, BACKGROUND
+from src.utils.single_flight import SingleFlight
+from src.utils.diary_entry import blob_sha, parse_entry, get_parse_cache_stats, author_id_line
+from src.utils.mirror import DiaryMirror
+from src.utils.read_model import ReadModel
+from src.utils.write_queue import WriteQueue
 
-# GitHubクライアントの初期化
-github_client = Github(BOT_CONFIG["GITHUB_TOKEN"])
+# PyGithubの呼び出しはブロッキングなので、イベントループを止めないよう専用のスレッドプールで実行する
+_executor = ThreadPoolExecutor(
+    max_workers=BOT_CONFIG["GITHUB_MAX_WORKERS"],
+    thread_name_prefix="github"
+)
 
-async def save_message_to_github(message, author_name, channel_name, content=None, template=False):
-    """メッセージをGitHubのマークダウンファイルとして保存する"""
+# すべてのGitHub API呼び出しはこのスケジューラの許可を得てから実行する
+_scheduler = RateLimitScheduler(
+    BOT_CONFIG["GITHUB_RATE_PER_SECOND"],
+    BOT_CONFIG["GITHUB_RATE_BURST"],
+    BOT_CONFIG["GITHUB_QUOTA_RESERVE"]
+)
+
+# GitHub API呼び出しの計測
+_github_call_duration = metrics.histogram(
+    "diary_github_call_duration_seconds",
+    "Time spent in a GitHub operation run on the worker pool.",
+    ("operation", "status")
+)
+_github_responses = metrics.counter(
+    "diary_github_responses_total",
+    "HTTP responses received from the GitHub API.",
+    ("status",)
+)
+
+def _observe_response(status, headers):
+    """GitHub APIの応答ごとに呼ばれる（ワーカースレッドから）"""
+    _scheduler.observe(status, headers)
+    _github_responses.inc(str(status))
+
+# GitHubクライアントの初期化（HTTP接続はスレッド間で共有するキープアライブのプールから使う）
+github_http.install(
+    BOT_CONFIG["GITHUB_POOL_SIZE"],
+    BOT_CONFIG["GITHUB_RETRIES"],
+    BOT_CONFIG["GITHUB_ETAG_CACHE_BYTES"],
+    on_response=_observe_response
+)
+github_client = Github(
+    BOT_CONFIG["GITHUB_TOKEN"],
+    base_url=BOT_CONFIG["GITHUB_API_URL"],
+    timeout=BOT_CONFIG["GITHUB_TIMEOUT"]
+)
+
+# リポジトリは一度だけ取得して使い回す
+_repo = None
+_repo_lock = threading.Lock()
+
+def _get_repo():
+    """リポジトリを取得する（ワーカースレッド内で呼ぶこと）"""
+    global _repo
+    if _repo is None:
+        with _repo_lock:
+            if _repo is None:
+                _repo = github_client.get_repo(BOT_CONFIG["GITHUB_REPO"])
+    return _repo
+
+def get_connection_stats():
+    """GitHub APIへのHTTP接続の再利用状況を返す"""
+    return github_http.connection_stats()
+
+def get_rate_limit_stats():
+    """APIの残り利用枠とスケジューラの統計を返す"""
+    return _scheduler.stats()
+
+def get_conditional_request_stats():
+    """条件付きリクエストの統計（304の割合と節約できたAPI呼び出し数）を返す"""
+    return github_http.conditional_stats()
+
+async def _run(func, *args, priority=INTERACTIVE, cost=1, **kwargs):
+    """ブロッキングな関数をGitHub用スレッドプールで実行する
+
+    priorityはINTERACTIVE（ユーザーが待っている処理）かBACKGROUND（一括取得など）、
+    costはその関数が行うAPI呼び出し数の見込み。
+    """
+    await _scheduler.acquire(priority, cost)
+    loop = asyncio.get_running_loop()
+    started = time.perf_counter()
+    status = "ok"
     try:
-        # リポジトリの取得
-        repo = github_client.get_repo(BOT_CONFIG["GITHUB_REPO"])
-        
-        # 現在の日付を取得してファイル名を生成
-        today = datetime.datetime.now().strftime('%Y-%m-%d')
-        timestamp = datetime.datetime.now().strftime('%Y%m%d%H%M%S')
-        filename = f"diary/{today}/{author_name}_{timestamp}.md"
-        
-        # マークダウンコンテンツの作成
-        if content is None:
-            content = message.content if hasattr(message, 'content') else ""
-            
-        entry_content = f"""# {author_name}の日記エントリ
+        return await loop.run_in_executor(_executor, functools.partial(func, *args, **kwargs))
+    except Exception:
+        status = "error"
+        raise
+    finally:
+        _github_call_duration.observe(time.perf_counter() - started, func.__name__.lstrip('_'), status)
+
+# 同時に来た同じ読み込みはGitHubへの1回の呼び出しにまとめる
+#   キーは _read_cache と同じ形（("file", パス) など）で、先頭の要素をメトリクスのラベルに使う
+_coalesced_requests = metrics.counter(
+    "diary_github_coalesced_requests_total",
+    "GitHub reads that joined an identical in-flight request instead of making their own.",
+    ("operation",)
+)
+_single_flight = SingleFlight(
+    BOT_CONFIG["GITHUB_COALESCE_TIMEOUT"],
+    on_coalesce=lambda key: _coalesced_requests.inc(key[0])
+)
+
+def get_coalescing_stats():
+    """まとめられた読み込みの数とタイムアウトの数を返す"""
+    return _single_flight.stats()
+
+# 読み込み結果のキャッシュ
+#   ("file", パス) -> (内容, blob SHA)
+#   ("folder", 日付) -> エントリ一覧
+_read_cache = TTLCache(BOT_CONFIG["CACHE_MAX_ENTRIES"], BOT_CONFIG["CACHE_TTL"])
+
+def get_cache_stats():
+    """読み込みキャッシュのヒット・ミス統計を返す"""
+    return _read_cache.stats()
+
+def _update_cached_entry(file_path, content=None, sha=None):
+    """書き込んだ内容をキャッシュに反映する（contentがNoneなら削除）"""
+    if content is None:
+        _read_cache.invalidate(("file", file_path))
+    else:
+        _read_cache.set(("file", file_path), (content, sha))
+    
+    # 日付フォルダの一覧がキャッシュされていればその場で更新する
+    parts = file_path.split('/')
+    if len(parts) != 3:
+        return
+    entries = _read_cache.peek(("folder", parts[1]))
+    if entries is None:
+        return
+    
+    entries = [entry for entry in entries if entry['path'] != file_path]
+    if content is not None:
+        entries.append({
+            'filename': parts[2],
+            'content': content,
+            'path': file_path,
+            'sha': sha
+        })
+        entries.sort(key=lambda entry: entry['filename'])
+    _read_cache.set(("folder", parts[1]), entries)
 
+async def _commit_changes(changes, commit_message):
+    """書き込みキューからまとめて渡された変更をコミットする"""
+    # 参照・コミット・ツリー・コミット作成・参照更新（とマニフェスト）
+    return await _run(_commit_files, changes, commit_message, cost=6)
+
+# 書き込みは短時間まとめて1つのコミットにする（WALはミラーと同じ場所に置く）
+_write_queue = WriteQueue(
+    os.path.join(BOT_CONFIG["MIRROR_DIR"], "write_queue.wal"),
+    BOT_CONFIG["WRITE_QUEUE_WINDOW"],
+    _commit_changes
+)
+
+async def start_write_queue():
+    """前回の実行でコミットされなかった書き込みを再送する"""
+    await _write_queue.start()
+
+async def drain_write_queue():
+    """コミット待ちの書き込みをすべてコミットする（終了前に呼ぶ）"""
+    await _write_queue.drain()
+
+def get_write_queue_stats():
+    """書き込みキューの深さとコミット所要時間を返す"""
+    return _write_queue.stats()
+
+# /metrics で公開する状態（読み出すたびに現在の値を集める）
+metrics.gauge(
+    "diary_cache_hit_ratio",
+    "Hit ratio of in-process caches.",
+    lambda: {
+        ("read",): _read_cache.stats()["hit_ratio"],
+        ("parsed_entry",): get_parse_cache_stats()["hit_ratio"],
+        ("github_etag",): github_http.conditional_stats()["not_modified_ratio"]
+    },
+    ("cache",)
+)
+metrics.gauge(
+    "diary_cache_entries",
+    "Number of entries held by in-process caches.",
+    lambda: {
+        ("read",): _read_cache.stats()["size"],
+        ("parsed_entry",): get_parse_cache_stats()["size"],
+        ("github_etag",): github_http.conditional_stats()["size"]
+    },
+    ("cache",)
+)
+metrics.gauge(
+    "diary_queue_depth",
+    "Work waiting in internal queues.",
+    lambda: {
+        ("write_queue",): _write_queue.depth(),
+        ("capture",): _capture.depth(),
+        ("github_executor",): _executor._work_queue.qsize(),
+        ("rate_limit_interactive",): _scheduler._interactive_waiting
+    },
+    ("queue",)
+)
+metrics.gauge(
+    "diary_write_queue_flush_seconds",
+    "Latency of the most recent write queue flush.",
+    lambda: _write_queue.stats()["last_flush_latency"]
+)
+metrics.gauge(
+    "diary_github_rate_limit_remaining",
+    "Remaining GitHub REST quota reported by the last response.",
+    lambda: _scheduler.stats()["remaining"]
+)
+metrics.gauge(
+    "diary_github_quota_saved",
+    "GitHub requests answered with 304 Not Modified (not counted against the quota).",
+    lambda: github_http.conditional_stats()["quota_saved"]
+)
+metrics.gauge(
+    "diary_github_etag_cache_bytes",
+    "Response body bytes held for ETag revalidation.",
+    lambda: github_http.conditional_stats()["bytes"]
+)
+metrics.gauge(
+    "diary_github_requests_shed",
+    "Background GitHub calls refused because the quota was low.",
+    lambda: _scheduler.stats()["shed"]
+)
+metrics.gauge(
+    "diary_github_connection_reuse_ratio",
+    "Share of GitHub requests served on a reused HTTP connection.",
+    lambda: github_http.connection_stats()["reuse_ratio"]
+)
+
+async def _record_write(file_path, content=None, sha=None):
+    """書き込み結果をキャッシュと読み取り用のデータベースに反映する（contentがNoneなら削除）"""
+    _update_cached_entry(file_path, content, sha)
+    await _apply_read_model({file_path: None if content is None else (sha, content)})
+
+def _entry_header(author_name, author_id=None):
+    """エントリのタイトル部分（投稿者のIDがあればタイトルの下に埋め込む）"""
+    if author_id is None:
+        return f"# {author_name}の日記エントリ\n"
+    return f"# {author_name}の日記エントリ\n{author_id_line(author_id)}\n"
+
+def _new_entry_content(author_name, channel_name, content, author_id=None):
+    """新しいエントリのマークダウンを作る"""
+    return f"""{_entry_header(author_name, author_id)}
 ## 日時
 {datetime.datetime.now().strftime('%Y年%m月%d日 %H:%M:%S')}
 
@@ -33,11 +271,24 @@ async def save_message_to_github(message, author_name, channel_name, content=Non
 {content}
 
 """
+
+async def save_message_to_github(message, author_name, channel_name, content=None, template=False, author_id=None):
+    """メッセージをGitHubのマークダウンファイルとして保存する（author_idは投稿者のDiscordユーザーID）"""
+    try:
+        # 現在の日付を取得してファイル名を生成
+        today = datetime.datetime.now().strftime('%Y-%m-%d')
+        timestamp = datetime.datetime.now().strftime('%Y%m%d%H%M%S')
+        filename = f"diary/{today}/{author_name}_{timestamp}.md"
+        
+        # マークダウンコンテンツの作成
+        if content is None:
+            content = message.content if hasattr(message, 'content') else ""
+            
+        entry_content = _new_entry_content(author_name, channel_name, content, author_id)
         
         # テンプレート機能
         if template:
-            entry_content = f"""# {author_name}の日記エントリ
-
+            entry_content = f"""{_entry_header(author_name, author_id)}
 ## 日時
 {datetime.datetime.now().strftime('%Y年%m月%d日 %H:%M:%S')}
 
@@ -64,47 +315,23 @@ async def save_message_to_github(message, author_name, channel_name, content=Non
             for attachment in message.attachments:
                 entry_content += f"- [{attachment.filename}]({attachment.url})\n"
         
-        # ファイルの作成（フォルダがなければ作成）
+        # ファイルの作成（親フォルダはコミット時にまとめて作られる）
         try:
-            # diaryフォルダが存在するか確認
-            try:
-                repo.get_contents("diary")
-            except GithubException:
-                # diary フォルダが存在しない場合は作成
-                repo.create_file(
-                    "diary/.gitkeep",
-                    "Create diary folder",
-                    ""
-                )
-            
-            # 日付フォルダが存在するか確認
-            try:
-                repo.get_contents(f"diary/{today}")
-            except GithubException:
-                # フォルダが存在しない場合は作成
-                repo.create_file(
-                    f"diary/{today}/.gitkeep",
-                    f"Create diary folder for {today}",
-                    ""
-                )
-                
             # 既存のエントリを確認（1日1件制限の場合）
             if BOT_CONFIG.get("ONE_ENTRY_PER_DAY", True):
-                try:
-                    contents = repo.get_contents(f"diary/{today}")
-                    for content_file in contents:
-                        if content_file.name.endswith('.md') and author_name in content_file.name:
-                            # 既存の日記を上書き
-                            return await update_diary_entry(content_file.path, content)
-                except Exception as e:
-                    print(f"Error checking existing entries: {e}")
+                existing_path = await _find_existing_entry(today, author_name, author_id)
+                if existing_path:
+                    # 既存の日記を上書き
+                    return await update_diary_entry(existing_path, content)
             
-            # ファイルを作成
-            result = repo.create_file(
+            # エントリを書き込みキューに追加（WALに書けた時点で保存完了とする）
+            await _write_queue.enqueue(
                 filename,
+                entry_content,
                 f"Add diary entry from {author_name}",
-                entry_content
+                new_file=True
             )
+            await _record_write(filename, entry_content, blob_sha(entry_content))
             return True, filename
         except GithubException as e:
             print(f"GitHub error: {e}")
@@ -113,15 +340,326 @@ async def save_message_to_github(message, author_name, channel_name, content=Non
         print(f"Error saving to GitHub: {e}")
         return False, str(e)
 
+async def _find_existing_entry(date, author_name, author_id=None):
+    """指定した日付の同じ投稿者のエントリのパスを返す（なければNone）
+
+    一覧（diary/index.json）があれば日付と投稿者のIDで引くだけで、GitHubへの問い合わせは
+    一覧の取得（キャッシュがなければ）だけになる。IDを持たない古いエントリは投稿者名の完全一致で探す。
+    """
+    try:
+        if _read_model.ready:
+            entry = await asyncio.to_thread(_read_model.find_entry, date, author_id, author_name)
+            return entry['path'] if entry else None
+        
+        index = await _get_index()
+        if index is not None:
+            item = diary_index.find_entry(index, date, author_id, author_name)
+            return item['path'] if item else None
+        
+        entries = await _get_folder_entries(date)
+    except GithubException:
+        # 日付フォルダがまだない
+        return None
+    except Exception as e:
+        print(f"Error checking existing entries: {e}")
+        return None
+    
+    legacy_path = None
+    for entry in entries:
+        entry_author_id = parse_entry(entry['content'], entry.get('sha')).author_id
+        if author_id is not None and entry_author_id == author_id:
+            return entry['path']
+        # ファイル名は「投稿者名_タイムスタンプ.md」
+        if entry_author_id is None and entry['filename'].rsplit('_', 1)[0] == author_name and legacy_path is None:
+            legacy_path = entry['path']
+    return legacy_path
+
+async def get_own_entry(date, author_id, author_name):
+    """指定した日付の投稿者自身のエントリを取得する"""
+    try:
+        # 読み取り用のデータベースが同期済みならGitHubに問い合わせずに返せる
+        if _read_model.ready:
+            entry = await asyncio.to_thread(_read_model.find_entry, date, author_id, author_name)
+            if entry is None:
+                return False, f"{date} の日記エントリはありません。"
+            return True, entry
+        
+        file_path = await _find_existing_entry(date, author_name, author_id)
+        if file_path is None:
+            return False, f"{date} の日記エントリはありません。"
+        
+        content = await _load_file(file_path)
+        return True, {
+            'date': date,
+            'filename': file_path.rsplit('/', 1)[-1],
+            'content': content,
+            'path': file_path,
+            'sha': blob_sha(content)
+        }
+    except GithubException as e:
+        print(f"GitHub error when getting own entry: {e}")
+        return False, str(e)
+    except Exception as e:
+        print(f"Error getting own entry: {e}")
+        return False, str(e)
+
+# チャンネルの会話を記録するセクション
+CONVERSATION_SECTION = '会話'
+
+async def append_diary_entry(author_name, channel_name, date, text, author_id=None):
+    """指定した日付の投稿者のエントリの「## 会話」に追記する（なければ新しく作る）
+
+    「## 内容」は !new や !update で置き換えられるので、記録した会話は別のセクションに残す。
+    """
+    try:
+        existing_path = await _find_existing_entry(date, author_name, author_id)
+        if existing_path:
+            old_content = await _load_file(existing_path)
+            updated_content = parse_entry(old_content).append_to_section(CONVERSATION_SECTION, text)
+            await _write_queue.enqueue(existing_path, updated_content, f"Append conversation from {author_name}")
+            await _record_write(existing_path, updated_content, blob_sha(updated_content))
+            return True, existing_path
+        
+        timestamp = datetime.datetime.now().strftime('%Y%m%d%H%M%S')
+        filename = f"diary/{date}/{author_name}_{timestamp}.md"
+        # 「## 内容」は空のまま作り、後から !new で書けるようにする
+        entry_content = parse_entry(_new_entry_content(author_name, channel_name, "", author_id)).append_to_section(
+            CONVERSATION_SECTION, text
+        )
+        await _write_queue.enqueue(filename, entry_content, f"Add diary entry from {author_name}", new_file=True)
+        await _record_write(filename, entry_content, blob_sha(entry_content))
+        return True, filename
+    except GithubException as e:
+        print(f"GitHub error when appending: {e}")
+        return False, str(e)
+    except Exception as e:
+        print(f"Error appending to diary entry: {e}")
+        return False, str(e)
+
+# チャンネルの会話は投稿者・日付ごとにためてから追記する（ジャーナルはミラーと同じ場所に置く）
+_capture = CaptureBuffer(
+    os.path.join(BOT_CONFIG["MIRROR_DIR"], "capture.journal"),
+    BOT_CONFIG["CAPTURE_IDLE"],
+    BOT_CONFIG["CAPTURE_MAX_CHARS"],
+    BOT_CONFIG["CAPTURE_MAX_TOTAL_CHARS"],
+    append_diary_entry
+)
+
+async def start_capture():
+    """前回の実行で書き出されなかった会話を復元する"""
+    await _capture.start()
+
+async def capture_message(author_id, author_name, channel_name, date, text):
+    """会話を日記に記録する（バッファのジャーナルに書けた時点で戻る）"""
+    await _capture.add(author_id, author_name, channel_name, date, text)
+
+async def flush_capture():
+    """書き出し待ちの会話をすべて日記に追記する（終了前に呼ぶ）"""
+    failed = await _capture.flush_all()
+    if failed:
+        print(f"{failed} captured conversations could not be flushed and remain in the journal")
+
+def get_capture_stats():
+    """書き出し待ちの会話の量と書き出し回数を返す"""
+    return _capture.stats()
+
+# ブランチの更新が競合した場合の再試行回数
+COMMIT_RETRIES = 3
+
+# 最後にコミットまたは取得したマニフェスト (コミットのSHA, マニフェスト)
+# コミットの内容は変わらないので期限は設けず、次のコミットの元にする
+_committed_index = None
+
+def _commit_files(changes, commit_message):
+    """Git Data APIで複数ファイルの変更を1つのコミットにまとめる
+
+    changesはパス -> 内容（Noneなら削除）の辞書。ツリーの作成時に内容を直接渡すので
+    blobを個別に作る必要はなく、途中のフォルダもGit側で自動的に作られる。
+    """
+    repo = _get_repo()
+    
+    for attempt in range(COMMIT_RETRIES):
+        ref = repo.get_git_ref(f"heads/{repo.default_branch}")
+        base_commit = repo.get_git_commit(ref.object.sha)
+        
+        elements = []
+        for path, content in changes.items():
+            if path == diary_index.MANIFEST_PATH:
+                continue
+            if content is None:
+                elements.append(InputGitTreeElement(path, '100644', 'blob', sha=None))
+            else:
+                elements.append(InputGitTreeElement(path, '100644', 'blob', content=content))
+        
+        # エントリの一覧（マニフェスト）も同じコミットで更新する
+        index = _index_for_commit(base_commit.sha, changes)
+        if index is not None:
+            elements.append(InputGitTreeElement(
+                diary_index.MANIFEST_PATH, '100644', 'blob', content=diary_index.dumps(index)
+            ))
+        
+        tree = repo.create_git_tree(elements, base_commit.tree)
+        commit = repo.create_git_commit(commit_message, tree, [base_commit])
+        
+        try:
+            # fast-forwardでのみ更新する（他の書き込みと競合したら最新から作り直す）
+            ref.edit(commit.sha)
+            if index is not None:
+                _remember_committed_index(commit.sha, index)
+                _read_cache.set(("index",), (commit.sha, index))
+            return commit.sha
+        except GithubException as e:
+            if e.status != 422 or attempt == COMMIT_RETRIES - 1:
+                raise
+            print(f"Branch moved while committing, retrying: {e}")
+
+def _index_for_commit(base_sha, changes):
+    """コミットに含めるマニフェストを作る（まだマニフェストがなければNone）"""
+    if diary_index.MANIFEST_PATH in changes:
+        # 作り直したマニフェストに、同じコミットのエントリの変更を重ねる
+        base = diary_index.loads(changes[diary_index.MANIFEST_PATH])
+    elif not any(diary_index.is_entry_path(path) for path in changes):
+        return None
+    else:
+        committed = _committed_index
+        if committed is not None and committed[0] == base_sha:
+            base = committed[1]
+        else:
+            base = _fetch_index(base_sha)
+            _remember_committed_index(base_sha, base)
+        if base is None:
+            # マニフェストは !reindex で作るまで更新しない（一部だけの一覧になるため）
+            return None
+    return diary_index.apply_changes(base, changes)
+
+def _remember_committed_index(sha, index):
+    """コミットのマニフェストを次のコミットの元として覚えておく"""
+    global _committed_index
+    _committed_index = (sha, index)
+
+def _fetch_index(ref=None):
+    """マニフェストを取得する（ない場合はNone）"""
+    repo = _get_repo()
+    try:
+        if ref is None:
+            file = repo.get_contents(diary_index.MANIFEST_PATH)
+        else:
+            file = repo.get_contents(diary_index.MANIFEST_PATH, ref=ref)
+    except GithubException as e:
+        if e.status == 404:
+            return None
+        raise
+    
+    try:
+        return diary_index.loads(_decode_content(repo, file))
+    except ValueError as e:
+        # 壊れている場合は !reindex で作り直すまで使わない
+        print(f"Error loading diary index: {e}")
+        return None
+
+async def _get_index():
+    """マニフェストを返す（コミット待ちの書き込みを反映、まだない場合はNone）"""
+    cached = _read_cache.get(("index",))
+    if cached is None:
+        cached = (None, await _single_flight.do(("index",), _run, _fetch_index))
+        _read_cache.set(("index",), cached)
+    index = cached[1]
+    
+    pending = _write_queue.pending_items()
+    if pending.get(diary_index.MANIFEST_PATH) is not None:
+        index = diary_index.loads(pending[diary_index.MANIFEST_PATH])
+    if index is None:
+        return None
+    
+    changes = {path: content for path, content in pending.items() if diary_index.is_entry_path(path)}
+    if changes:
+        index = diary_index.apply_changes(index, changes)
+    return index
+
+async def _read_indexed_entries(items):
+    """マニフェストのエントリの内容を読み込む（同じblobがミラーにあればローカルから読む）"""
+    async def load(item):
+        found, content = _write_queue.lookup(item['path'])
+        if not found:
+            cached = _read_cache.peek(("file", item['path']))
+            if cached is not None and cached[1] == item['sha']:
+                content = cached[0]
+            else:
+                content = await asyncio.to_thread(_mirror.read_blob, item['sha'])
+        if content is None:
+            content = await _load_file(item['path'])
+        return {
+            'filename': item['path'].rsplit('/', 1)[-1],
+            'content': content,
+            'path': item['path'],
+            'sha': item['sha']
+        }
+    
+    return list(await asyncio.gather(*[load(item) for item in items]))
+
+async def get_diary_dates(offset=0, limit=None):
+    """日付ごとのエントリのメタデータを新しい日付順で返す（offset/limitで必要な日付だけ返す）
+
+    戻り値は dates（(日付, メタデータのリスト) のリスト）/ total_dates / total_entries /
+    months（月 -> その月の最新の日付の位置、新しい月順）を持つ辞書。本文は読み込まない。
+    """
+    try:
+        index = await _get_index()
+        if index is not None:
+            dates = diary_index.date_items(index)
+        else:
+            # マニフェストがまだない場合はツリーの一覧から作る（本文は取得しない）
+            listing = await _run(_list_diary_tree, priority=BACKGROUND, cost=2)
+            by_date = {}
+            for entry in listing:
+                by_date.setdefault(entry['date'], []).append({
+                    'author': entry['filename'].rsplit('_', 1)[0],
+                    'path': entry['path']
+                })
+            dates = list(by_date.items())
+        
+        months = {}
+        for position, (date, _) in enumerate(dates):
+            months.setdefault(date[:7], position)
+        
+        end = None if limit is None else offset + limit
+        return True, {
+            'dates': dates[offset:end],
+            'total_dates': len(dates),
+            'total_entries': sum(len(items) for _, items in dates),
+            'months': months
+        }
+    except GithubException:
+        return False, "日記フォルダが見つかりませんでした。"
+    except Exception as e:
+        print(f"Error listing diary dates: {e}")
+        return False, str(e)
+
+async def rebuild_diary_index():
+    """ツリー全体からマニフェストと読み取り用のデータベースを作り直す（戻り値はエントリ数）"""
+    try:
+        # 実行中の同期が消した後のデータベースに同期済みのコミットを記録しないよう、同期と同じロックの中で作り直す
+        async with _read_model_lock:
+            await asyncio.get_running_loop().run_in_executor(_read_model_executor, _read_model.clear)
+            await _sync_read_model_locked()
+        entries = await _read_mirror_entries(_mirror.list_entries())
+        index = await asyncio.to_thread(diary_index.build, entries)
+        
+        await _write_queue.enqueue(diary_index.MANIFEST_PATH, diary_index.dumps(index), "Rebuild diary index")
+        _read_cache.invalidate(("index",))
+        
+        return True, sum(len(items) for items in index["dates"].values())
+    except GithubException as e:
+        print(f"GitHub error when rebuilding index: {e}")
+        return False, str(e)
+    except Exception as e:
+        print(f"Error rebuilding diary index: {e}")
+        return False, str(e)
+
 async def get_file_content(file_path):
     """ファイルの内容を取得する"""
     try:
-        # リポジトリの取得
-        repo = github_client.get_repo(BOT_CONFIG["GITHUB_REPO"])
-        
-        # ファイルの取得
-        file = repo.get_contents(file_path)
-        content = base64.b64decode(file.content).decode('utf-8')
+        content = await _load_file(file_path)
         
         return True, content
     except GithubException as e:
@@ -131,12 +669,41 @@ async def get_file_content(file_path):
         print(f"Error getting file content: {e}")
         return False, str(e)
 
-async def get_diary_entries(date=None):
-    """指定した日付（デフォルトは今日）の日記エントリを取得する"""
+async def _load_file(file_path):
+    """ファイルの内容を返す（コミット待ちの書き込み、キャッシュ、GitHubの順に探す）"""
+    found, content = _write_queue.lookup(file_path)
+    if found:
+        if content is None:
+            raise GithubException(404, {"message": "Not Found"}, None)
+        return content
+    
+    cached = _read_cache.get(("file", file_path))
+    if cached is None:
+        cached = await _single_flight.do(("file", file_path), _run, _fetch_file, file_path)
+        _read_cache.set(("file", file_path), cached)
+    return cached[0]
+
+def _fetch_file(file_path):
+    """ファイルの内容とSHAを取得する"""
+    repo = _get_repo()
+    file = repo.get_contents(file_path)
+    return _decode_content(repo, file), file.sha
+
+def _decode_content(repo, file):
+    """contents APIで取得したファイルの内容を返す
+
+    1MBを超えるファイルはcontents APIが内容を返さない（encodingが"none"になる）ので、
+    同じSHAのblobをGit Data APIで取得する。
+    """
+    if file.encoding == "none" or (not file.content and file.size):
+        file_content = repo.get_git_blob(file.sha).content
+    else:
+        file_content = file.content
+    return base64.b64decode(file_content).decode('utf-8')
+
+async def get_diary_entries(date=None, limit=None):
+    """指定した日付（デフォルトは今日）の日記エントリを取得する（limitで先頭から件数を制限）"""
     try:
-        # リポジトリの取得
-        repo = github_client.get_repo(BOT_CONFIG["GITHUB_REPO"])
-        
         # 日付の処理
         if date is None:
             date = datetime.datetime.now().strftime('%Y-%m-%d')
@@ -145,63 +712,191 @@ async def get_diary_entries(date=None):
             target_date = datetime.datetime.now() - datetime.timedelta(days=date)
             date = target_date.strftime('%Y-%m-%d')
         
+        if _read_model.ready:
+            entries = await asyncio.to_thread(_read_model.entries_for_date, date)
+            if not entries:
+                return False, f"日付 {date} の日記エントリは見つかりませんでした。"
+            return True, entries[:limit]
+        
+        # マニフェストがあれば必要なエントリだけ読み込む
+        index = await _get_index()
+        if index is not None:
+            items = diary_index.items_for_date(index, date)
+            if not items:
+                return False, f"日付 {date} の日記エントリは見つかりませんでした。"
+            return True, await _read_indexed_entries(items[:limit])
+        
         # 指定したフォルダ内のファイルを取得
-        folder_path = f"diary/{date}"
         try:
-            contents = repo.get_contents(folder_path)
+            entries = await _get_folder_entries(date)
             
-            entries = []
-            for content_file in contents:
-                if content_file.name.endswith('.md'):
-                    file_content = base64.b64decode(content_file.content).decode('utf-8')
-                    entries.append({
-                        'filename': content_file.name,
-                        'content': file_content,
-                        'path': content_file.path
-                    })
-            
-            return True, entries
+            return True, [dict(entry) for entry in entries[:limit]]
         except GithubException:
             return False, f"日付 {date} の日記エントリは見つかりませんでした。"
     except Exception as e:
         print(f"Error fetching diary entries: {e}")
         return False, str(e)
 
+async def _get_folder_entries(date):
+    """日付フォルダのエントリ一覧を取得する（キャッシュとコミット待ちの書き込みを反映）"""
+    prefix = f"diary/{date}/"
+    pending = {
+        path: content for path, content in _write_queue.pending_items().items()
+        if path.startswith(prefix) and path.endswith('.md')
+    }
+    
+    entries = _read_cache.get(("folder", date))
+    if entries is None:
+        try:
+            entries = await _single_flight.do(("folder", date), _run, _fetch_folder_entries, prefix.rstrip('/'))
+        except GithubException:
+            # フォルダはまだないが、コミット待ちのエントリがある
+            if not pending:
+                raise
+            entries = []
+        else:
+            _read_cache.set(("folder", date), entries)
+            for entry in entries:
+                _read_cache.set(("file", entry['path']), (entry['content'], entry['sha']))
+    
+    if pending:
+        entries = [entry for entry in entries if entry['path'] not in pending]
+        for path, content in pending.items():
+            if content is not None:
+                entries.append({
+                    'filename': path[len(prefix):],
+                    'content': content,
+                    'path': path,
+                    'sha': blob_sha(content)
+                })
+        entries.sort(key=lambda entry: entry['filename'])
+    return entries
+
+def _fetch_folder_entries(folder_path):
+    """フォルダ内のマークダウンファイルを読み込む"""
+    repo = _get_repo()
+    contents = repo.get_contents(folder_path)
+    
+    entries = []
+    for content_file in contents:
+        if content_file.name.endswith('.md'):
+            file_content = _decode_content(repo, content_file)
+            entries.append({
+                'filename': content_file.name,
+                'content': file_content,
+                'path': content_file.path,
+                'sha': content_file.sha
+            })
+    
+    return entries
+
+# 日付フォルダのツリーSHAごとのファイル一覧（変更のないサブツリーは再取得しない）
+_subtree_listing_cache = {}
+# diaryフォルダ全体のツリーSHAとそのファイル一覧
+_diary_listing_cache = {"sha": None, "entries": []}
+
+# 読み込み用のローカルミラー
+_mirror = DiaryMirror(BOT_CONFIG["MIRROR_DIR"])
+_mirror_lock = asyncio.Lock()
+
+# 読み取り用のデータベース（ミラーと同じ場所に保存する）
+_read_model = ReadModel(os.path.join(BOT_CONFIG["MIRROR_DIR"], "read_model.sqlite3"))
+_read_model_lock = asyncio.Lock()
+_read_model_task = None
+# データベースへの書き込みは1つのスレッドで順に行う（同じエントリへの書き込みの順序を保つ）
+_read_model_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="read-model")
+
+# 同期で一度に反映するエントリ数（反映中は読み込みが待つので、初回の同期でも長く止めない）
+READ_MODEL_CHUNK_SIZE = 200
+
+async def _apply_read_model(changes, head_sha=None):
+    """変更を読み取り用のデータベースに反映する（イベントループは止めない）"""
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(_read_model_executor, _read_model.apply, changes, head_sha)
+
+metrics.gauge(
+    "diary_read_model_entries",
+    "Number of diary entries in the local read model.",
+    lambda: _read_model.count()
+)
+
+# compare APIが返すファイル数の上限（これ以上の差分は全体を取り直す）
+COMPARE_FILE_LIMIT = 300
+
+async def sync_mirror():
+    """ローカルミラーをリモートの最新コミットに同期する（同時に呼ばれた同期は1回にまとめる）"""
+    # 初回の同期はエントリ数に比例して時間がかかるのでタイムアウトしない
+    await _single_flight.do(("mirror",), _sync_mirror, timeout=None)
+
+async def _sync_mirror():
+    async with _mirror_lock:
+        head_sha, full_sync, files = await _run(
+            _collect_mirror_changes, _mirror.head_sha, priority=BACKGROUND, cost=3
+        )
+        if full_sync is None:
+            # 前回から変更なし
+            return
+        
+        # 未取得のblobを並列取得
+        missing = _mirror.missing_blobs(files)
+        if missing:
+            await _fetch_missing_blobs(missing)
+        
+        if full_sync:
+            _mirror.replace_all(head_sha, files)
+        else:
+            _mirror.apply_changes(head_sha, files)
+
+def _collect_mirror_changes(last_sha):
+    """前回同期したコミットから変更のあったエントリのパスとblob SHAを集める"""
+    repo = _get_repo()
+    head_sha = repo.get_git_ref(f"heads/{repo.default_branch}").object.sha
+    
+    if head_sha == last_sha:
+        return head_sha, None, {}
+    
+    # 差分だけ取得する
+    if last_sha is not None:
+        try:
+            comparison = repo.compare(last_sha, head_sha)
+            if len(comparison.files) < COMPARE_FILE_LIMIT:
+                changes = {}
+                for file in comparison.files:
+                    if file.status == 'renamed' and file.previous_filename:
+                        changes[file.previous_filename] = None
+                    if file.filename.startswith('diary/') and file.filename.endswith('.md'):
+                        changes[file.filename] = None if file.status == 'removed' else file.sha
+                return head_sha, False, changes
+        except GithubException as e:
+            # 履歴が書き換えられた場合などは全体を取り直す
+            print(f"Error comparing mirror commits: {e}")
+    
+    # 初回または差分が大きい場合はツリー全体を取得する
+    listing = _list_diary_tree(head_sha)
+    return head_sha, True, {item['path']: item['sha'] for item in listing}
+
+async def _read_mirror_entries(listing):
+    """ミラーからエントリの内容を読み込む"""
+    def read():
+        entries = []
+        for item in listing:
+            entries.append({
+                'date': item['date'],
+                'filename': item['filename'],
+                'content': _mirror.read_blob(item['sha']),
+                'path': item['path'],
+                'sha': item['sha']
+            })
+        return entries
+    
+    return await asyncio.to_thread(read)
+
 async def get_all_diary_entries():
-    """すべての日記エントリの一覧を取得する"""
+    """すべての日記エントリの一覧を取得する（一部だけ必要なら iter_all_diary_entries を使う）"""
     try:
-        # リポジトリの取得
-        repo = github_client.get_repo(BOT_CONFIG["GITHUB_REPO"])
-        
         # diaryフォルダが存在するか確認
         try:
-            diary_contents = repo.get_contents("diary")
-            
-            # 日付フォルダのリスト
-            date_folders = []
-            for item in diary_contents:
-                if item.type == "dir":
-                    date_folders.append(item.path)
-            
-            # 全てのエントリをまとめて取得
-            all_entries = []
-            
-            for folder in sorted(date_folders, reverse=True):  # 新しい日付順
-                date = folder.split('/')[-1]
-                try:
-                    folder_contents = repo.get_contents(folder)
-                    
-                    for content_file in folder_contents:
-                        if content_file.name.endswith('.md'):
-                            file_content = base64.b64decode(content_file.content).decode('utf-8')
-                            all_entries.append({
-                                'date': date,
-                                'filename': content_file.name,
-                                'content': file_content,
-                                'path': content_file.path
-                            })
-                except GithubException:
-                    continue
+            all_entries = [entry async for entry in iter_all_diary_entries()]
             
             return True, all_entries
         except GithubException:
@@ -210,57 +905,153 @@ async def get_all_diary_entries():
         print(f"Error fetching all diary entries: {e}")
         return False, str(e)
 
+# 読み取り用のデータベースから一度に読むエントリ数
+READ_MODEL_PAGE_SIZE = 50
+
+async def iter_all_diary_entries():
+    """すべての日記エントリを新しい日付順に1件ずつ返す（非同期ジェネレータ）
+
+    ミラー全体の同期は待たず、一覧だけ取得してから少しずつ先読みして読み込む。
+    必要な件数を受け取ったところで止めれば、残りのエントリは取得しない。
+    読み取り用のデータベースが同期済みなら、そこからページ単位で読む。
+    """
+    if _read_model.ready:
+        entry = None
+        while True:
+            page = await asyncio.to_thread(_read_model.entries_page, entry, READ_MODEL_PAGE_SIZE)
+            for entry in page:
+                yield entry
+            if len(page) < READ_MODEL_PAGE_SIZE:
+                return
+    
+    listing = await _current_listing()
+    
+    # 1件ずつ読み込むので、最初のエントリは1回の取得で返せる
+    async with contextlib.aclosing(_stream_listing([[item] for item in listing])) as stream:
+        async for _, entries in stream:
+            yield entries[0]
+
+async def _current_listing():
+    """最新のコミットのエントリ一覧を返す（新しい日付順、内容は取得しない）
+
+    ミラーが最新ならその一覧を使い、古い場合はツリーの一覧だけ取得する
+    （内容は読むときにミラーに保存される）。ミラー全体の同期は待たない。
+    """
+    head_sha = await _single_flight.do(("head",), _run, _get_head_sha, priority=BACKGROUND)
+    if head_sha == _mirror.head_sha:
+        return _mirror.list_entries()
+    return await _single_flight.do(
+        ("tree", head_sha), _run, _list_diary_tree, head_sha, priority=BACKGROUND, cost=2
+    )
+
+def _get_head_sha():
+    repo = _get_repo()
+    return repo.get_git_ref(f"heads/{repo.default_branch}").object.sha
+
+def _list_diary_tree(ref=None):
+    """Git Trees APIでdiaryフォルダ配下のマークダウンファイル一覧を取得する（新しい日付順）"""
+    repo = _get_repo()
+    
+    # ルートツリーからdiaryフォルダのツリーSHAを探す
+    root_tree = repo.get_git_tree(ref or repo.default_branch)
+    diary_sha = None
+    for element in root_tree.tree:
+        if element.path == "diary" and element.type == "tree":
+            diary_sha = element.sha
+            break
+    
+    if diary_sha is None:
+        raise GithubException(404, {"message": "diary folder not found"}, None)
+    
+    # diaryフォルダに変更がなければ前回の一覧をそのまま使う
+    if _diary_listing_cache["sha"] == diary_sha:
+        return _diary_listing_cache["entries"]
+    
+    # diaryフォルダ配下を再帰的に1回で取得
+    diary_tree = repo.get_git_tree(diary_sha, recursive=True)
+    
+    if diary_tree.raw_data.get("truncated"):
+        # 件数が多すぎて切り詰められた場合は日付フォルダ単位で取得する
+        subtrees = {}
+        for element in repo.get_git_tree(diary_sha).tree:
+            if element.type == "tree":
+                subtrees[element.path] = element.sha
+        
+        files_by_date = {}
+        for date, subtree_sha in subtrees.items():
+            if subtree_sha in _subtree_listing_cache:
+                files_by_date[date] = _subtree_listing_cache[subtree_sha]
+            else:
+                files_by_date[date] = [
+                    (element.path, element.sha)
+                    for element in repo.get_git_tree(subtree_sha).tree
+                    if element.type == "blob"
+                ]
+    else:
+        subtrees = {}
+        files_by_date = {}
+        for element in diary_tree.tree:
+            if element.type == "tree" and '/' not in element.path:
+                subtrees[element.path] = element.sha
+                files_by_date.setdefault(element.path, [])
+            elif element.type == "blob" and element.path.count('/') == 1:
+                date, name = element.path.split('/')
+                files_by_date.setdefault(date, []).append((name, element.sha))
+    
+    # 現在のサブツリーだけをキャッシュに残す
+    _subtree_listing_cache.clear()
+    for date, subtree_sha in subtrees.items():
+        _subtree_listing_cache[subtree_sha] = files_by_date.get(date, [])
+    
+    entries = []
+    for date in sorted(subtrees, reverse=True):  # 新しい日付順
+        for name, sha in files_by_date.get(date, []):
+            if name.endswith('.md'):
+                entries.append({
+                    'date': date,
+                    'filename': name,
+                    'path': f"diary/{date}/{name}",
+                    'sha': sha
+                })
+    
+    _diary_listing_cache["sha"] = diary_sha
+    _diary_listing_cache["entries"] = entries
+    return entries
+
+# 1回の許可でまとめて取得するblobの数（スケジューラのバケットより大きくはしない）
+BLOB_BATCH_SIZE = 10
+
+async def _fetch_missing_blobs(shas):
+    """ミラーにないblobをバックグラウンドで並列に取得する
+
+    バックグラウンドの処理はトークンを前借りできないので、小さなまとまりごとに許可を得る。
+    まとまりの間に対話的な処理が来れば、そちらが先に通る。
+    """
+    batch_size = max(1, min(BLOB_BATCH_SIZE, BOT_CONFIG["GITHUB_RATE_BURST"]))
+    batches = [shas[i:i + batch_size] for i in range(0, len(shas), batch_size)]
+    await asyncio.gather(*[
+        _run(_fetch_blobs, batch, priority=BACKGROUND, cost=len(batch)) for batch in batches
+    ])
+
+def _fetch_blobs(shas):
+    """複数のblobを1つのワーカーでまとめて取得し、ミラーに保存する"""
+    repo = _get_repo()
+    
+    for sha in shas:
+        blob = repo.get_git_blob(sha)
+        _mirror.write_blob(sha, base64.b64decode(blob.content).decode('utf-8'))
+
 async def update_diary_entry(file_path, new_content):
     """日記エントリを更新する"""
     try:
-        # リポジトリの取得
-        repo = github_client.get_repo(BOT_CONFIG["GITHUB_REPO"])
-        
-        # ファイルの取得
-        file = repo.get_contents(file_path)
-        old_content = base64.b64decode(file.content).decode('utf-8')
+        # 直前に読み込んだ内容（またはコミット待ちの内容）を元に更新する
+        old_content = await _load_file(file_path)
         
         # 内容セクションを更新
-        lines = old_content.split('\n')
-        new_lines = []
-        content_section = False
-        content_replaced = False
-        
-        for line in lines:
-            if line.startswith('## 内容'):
-                content_section = True
-                new_lines.append(line)
-                new_lines.append(new_content)
-                content_replaced = True
-            elif content_section and (line.startswith('##') or not line and lines.index(line)+1 < len(lines) and not lines[lines.index(line)+1]):
-                content_section = False
-                new_lines.append(line)
-            elif not content_section:
-                new_lines.append(line)
-        
-        # ヘッダーセクションのみの更新なら全体を更新
-        if not content_replaced:
-            # 現在のヘッダー情報を保持
-            header_lines = []
-            for line in lines:
-                if line.startswith('# ') or line.startswith('## 日時') or line.startswith('## チャンネル'):
-                    header_lines.append(line)
-                elif line.startswith('## 内容'):
-                    break
-            
-            # 新しい内容と結合
-            new_lines = header_lines + ['## 内容', new_content]
-                
-        # 更新されたコンテンツ
-        updated_content = '\n'.join(new_lines)
+        updated_content = _replace_content_section(old_content, new_content)
         
-        # ファイルの更新
-        result = repo.update_file(
-            file_path,
-            f"Update diary entry",
-            updated_content,
-            file.sha
-        )
+        await _write_queue.enqueue(file_path, updated_content, f"Update diary entry")
+        await _record_write(file_path, updated_content, blob_sha(updated_content))
         
         return True, file_path
     except GithubException as e:
@@ -270,21 +1061,27 @@ async def update_diary_entry(file_path, new_content):
         print(f"Error updating diary entry: {e}")
         return False, str(e)
 
+# 「## 内容」がないエントリ（テンプレート）を更新するときに残すセクション
+HEADER_SECTIONS = ('日時', 'チャンネル')
+
+def _replace_content_section(old_content, new_content):
+    """エントリの「## 内容」セクションを新しい内容に置き換える"""
+    entry = parse_entry(old_content)
+    if entry.section_span('内容') is not None:
+        return entry.replace_section('内容', new_content)
+    
+    # テンプレートのエントリはヘッダー情報と記録した会話だけ残して内容に置き換える
+    header = parse_entry(entry.keep_sections(HEADER_SECTIONS + (CONVERSATION_SECTION,)))
+    return header.insert_section('内容', new_content, after=HEADER_SECTIONS[-1])
+
 async def delete_diary_entry(file_path):
     """日記エントリを削除する"""
     try:
-        # リポジトリの取得
-        repo = github_client.get_repo(BOT_CONFIG["GITHUB_REPO"])
-        
-        # ファイルの取得
-        file = repo.get_contents(file_path)
+        # 存在しないファイルの削除はコミット全体を失敗させるので先に確認する
+        await _load_file(file_path)
         
-        # ファイルの削除
-        result = repo.delete_file(
-            file_path,
-            f"Delete diary entry",
-            file.sha
-        )
+        await _write_queue.enqueue(file_path, None, f"Delete diary entry")
+        await _record_write(file_path)
         
         return True, "削除しました"
     except GithubException as e:
@@ -297,25 +1094,9 @@ async def delete_diary_entry(file_path):
 async def get_diary_by_date_range(start_date, end_date):
     """指定した日付範囲の日記エントリを取得する"""
     try:
-        # 日付の処理
-        start = datetime.datetime.strptime(start_date, '%Y-%m-%d')
-        end = datetime.datetime.strptime(end_date, '%Y-%m-%d')
-        
-        # 日付の範囲内のすべての日を生成
-        date_range = []
-        current = start
-        while current <= end:
-            date_range.append(current.strftime('%Y-%m-%d'))
-            current += datetime.timedelta(days=1)
-        
-        # 各日付の日記を取得
         all_entries = []
-        for date in date_range:
-            success, entries = await get_diary_entries(date)
-            if success and entries:
-                for entry in entries:
-                    entry['date'] = date
-                    all_entries.append(entry)
+        async for date, entries in iter_diary_by_date_range(start_date, end_date):
+            all_entries.extend(entries)
         
         if all_entries:
             return True, all_entries
@@ -325,20 +1106,63 @@ async def get_diary_by_date_range(start_date, end_date):
         print(f"Error fetching diary entries by date range: {e}")
         return False, str(e)
 
+async def iter_diary_by_date_range(start_date, end_date):
+    """指定した日付範囲の日記エントリを1日分ずつ古い日付順に返す（非同期ジェネレータ）
+
+    エントリのある日だけを先読みしながら並列に読み込むので、呼び出し側は
+    最後の日を待たずに最初の日から表示を始められる。
+    """
+    # 日付の処理
+    start = datetime.datetime.strptime(start_date, '%Y-%m-%d').strftime('%Y-%m-%d')
+    end = datetime.datetime.strptime(end_date, '%Y-%m-%d').strftime('%Y-%m-%d')
+    
+    if _read_model.ready:
+        entries = await asyncio.to_thread(_read_model.entries_between, start, end)
+        for date, day_entries in itertools.groupby(entries, key=lambda entry: entry['date']):
+            yield date, list(day_entries)
+        return
+    
+    # 一覧と範囲を突き合わせ、エントリのある日の分だけ取得する（ミラー全体の同期はバックグラウンドに任せる）
+    listing_by_date = {}
+    for item in await _current_listing():
+        if start <= item['date'] <= end:
+            listing_by_date.setdefault(item['date'], []).append(item)
+    dates = sorted(listing_by_date)
+    
+    async with contextlib.aclosing(_stream_listing([listing_by_date[date] for date in dates])) as stream:
+        async for index, entries in stream:
+            yield dates[index], entries
+
+async def _stream_listing(chunks):
+    """エントリの一覧のまとまりを順に読み込み、(番号, エントリ) を返す（非同期ジェネレータ）
+
+    同時に読み込むまとまりの数をワーカー数までに制限するので、手元に持つエントリの数は
+    一覧全体の大きさではなく先読みの幅で決まる。
+    """
+    window = BOT_CONFIG["GITHUB_MAX_WORKERS"]
+    tasks = collections.deque()
+    next_index = 0
+    try:
+        for index in range(len(chunks)):
+            while next_index < len(chunks) and len(tasks) < window:
+                tasks.append(asyncio.create_task(_read_listed_entries(chunks[next_index])))
+                next_index += 1
+            yield index, await tasks.popleft()
+    finally:
+        for task in tasks:
+            task.cancel()
+
+async def _read_listed_entries(listing):
+    """一覧のエントリを読み込む（ミラーにないblobはGitHubから取得する）"""
+    missing = [item['sha'] for item in listing if not _mirror.has_blob(item['sha'])]
+    if missing:
+        await _fetch_missing_blobs(missing)
+    return await _read_mirror_entries(listing)
+
 async def search_diary_entries(keyword):
-    """日記エントリをキーワードで検索する"""
+    """日記エントリをキーワードで検索する（スペース区切りでAND、ORでOR検索）"""
     try:
-        # すべての日記エントリを取得
-        success, all_entries = await get_all_diary_entries()
-        
-        if not success:
-            return False, all_entries
-        
-        # キーワードでフィルタリング
-        matched_entries = []
-        for entry in all_entries:
-            if keyword.lower() in entry['content'].lower():
-                matched_entries.append(entry)
+        matched_entries = [entry async for _, entry in iter_search_diary_entries(keyword)]
         
         if matched_entries:
             return True, matched_entries
@@ -346,4 +1170,108 @@ async def search_diary_entries(keyword):
             return False, f"キーワード '{keyword}' を含む日記エントリは見つかりませんでした。"
     except Exception as e:
         print(f"Error searching diary entries: {e}")
-        return False, str(e)
\ No newline at end of file
+        return False, str(e)
+
+# 検索で最初に順位を取り出す件数（!search はこの中の上位だけ表示する）
+SEARCH_PAGE_SIZE = 20
+
+async def iter_search_diary_entries(keyword):
+    """キーワードに一致するエントリをスコアの高い順に (一致した件数, エントリ) で返す（非同期ジェネレータ）
+
+    順位付けは読み取り用のデータベースだけで行い、エントリの内容は取り出された分だけ読み込む。
+    """
+    try:
+        await sync_read_model()
+    except Exception as e:
+        # GitHubに接続できなくても、同期済みのデータがあればそれで検索する
+        if not _read_model.ready:
+            raise
+        print(f"Error syncing read model before search: {e}")
+    
+    # 最初は上位の1ページ分だけ順位を取り出し、それより先が必要になったら残りをまとめて取り出す
+    total, results = await asyncio.to_thread(_read_model.search, keyword, SEARCH_PAGE_SIZE)
+    offset = 0
+    while results:
+        for result in results:
+            entry = await asyncio.to_thread(_read_model.get_entry, result['path'])
+            if entry is None:
+                continue
+            entry['score'] = result['score']
+            entry['matches'] = result['matches']
+            entry['snippet'] = result['snippet']
+            yield total, entry
+        offset += len(results)
+        if offset >= total:
+            return
+        total, results = await asyncio.to_thread(_read_model.search, keyword, None, offset)
+
+async def sync_read_model():
+    """ミラーを最新にして、読み取り用のデータベースに差分を反映する（同時に呼ばれた同期は1回にまとめる）"""
+    await _single_flight.do(("read_model",), _sync_read_model, timeout=None)
+
+async def _sync_read_model():
+    async with _read_model_lock:
+        await _sync_read_model_locked()
+
+async def _sync_read_model_locked():
+    """読み取り用のデータベースを同期する（_read_model_lock を持って呼ぶ）"""
+    # 同期中にコミットされた書き込みや新しく来た書き込みを消さないよう、コミット待ちの内容を前後で控える
+    # （実行中のミラーの同期に相乗りすると、控えた後の書き込みを含まない古い状態になりうる）
+    pending = _write_queue.pending_items()
+    await _sync_mirror()
+    pending.update(_write_queue.pending_items())
+    if _read_model.head_sha == _mirror.head_sha:
+        return
+    head_sha = _mirror.head_sha
+    changes = await asyncio.to_thread(_collect_read_model_changes, _mirror.list_entries(), pending)
+    
+    # 少しずつ反映して、その間に来た書き込みや読み込みを長く待たせない
+    paths = list(changes)
+    for start in range(0, len(paths), READ_MODEL_CHUNK_SIZE):
+        chunk = {path: changes[path] for path in paths[start:start + READ_MODEL_CHUNK_SIZE]}
+        # 同期を始めた後に来た書き込みは、その内容を優先する
+        current = _write_queue.pending_items()
+        for path in chunk.keys() & current.keys():
+            content = current[path]
+            chunk[path] = None if content is None else (blob_sha(content), content)
+        await _apply_read_model(chunk)
+    # 同期済みのコミットは最後に記録する（途中で失敗したら次の同期でやり直す）
+    await _apply_read_model({}, head_sha)
+
+def _collect_read_model_changes(listing, pending):
+    """ミラーと読み取り用のデータベースの差分を集める（コミット待ちの書き込みはその内容を優先する）"""
+    mirrored = {item['path']: item['sha'] for item in listing}
+    indexed = _read_model.indexed_shas()
+    
+    changes = {}
+    for path in indexed.keys() - mirrored.keys():
+        changes[path] = None
+    for path, sha in mirrored.items():
+        if indexed.get(path) != sha:
+            content = _mirror.read_blob(sha)
+            if content is not None:
+                changes[path] = (sha, content)
+    for path, content in pending.items():
+        if content is None:
+            changes[path] = None
+        else:
+            changes[path] = (blob_sha(content), content)
+    return changes
+
+async def start_read_model_sync():
+    """読み取り用のデータベースを定期的にリポジトリと同期する"""
+    global _read_model_task
+    if _read_model_task is None:
+        _read_model_task = asyncio.create_task(_sync_read_model_periodically())
+
+async def _sync_read_model_periodically():
+    while True:
+        try:
+            await sync_read_model()
+        except Exception as e:
+            print(f"Error syncing read model: {e}")
+        await asyncio.sleep(BOT_CONFIG["READ_MODEL_SYNC_INTERVAL"])
+
+def get_read_model_stats():
+    """読み取り用のデータベースのエントリ数と同期済みのコミットを返す"""
+    return _read_model.stats()
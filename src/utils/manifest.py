@@ -0,0 +1,122 @@
+import json
+import datetime
+from src.utils.diary_entry import blob_sha, parse_entry
+
+# エントリの一覧（日付 -> エントリのメタデータ）を保存するファイル
+MANIFEST_PATH = "diary/index.json"
+MANIFEST_VERSION = 1
+
+def is_entry_path(path):
+    """diary/日付/ファイル名.md 形式のパスか判定する"""
+    parts = path.split('/')
+    return len(parts) == 3 and parts[0] == "diary" and parts[2].endswith('.md')
+
+def empty():
+    return {"version": MANIFEST_VERSION, "dates": {}}
+
+def loads(text):
+    manifest = json.loads(text)
+    if manifest.get("version") != MANIFEST_VERSION:
+        raise ValueError(f"Unsupported manifest version: {manifest.get('version')}")
+    return manifest
+
+def dumps(manifest):
+    # 日付ごとに1行にして、コミットの差分を読みやすくする
+    lines = [
+        f"    {json.dumps(date)}: {json.dumps(items, ensure_ascii=False, separators=(',', ':'))}"
+        for date, items in sorted(manifest["dates"].items(), reverse=True)
+    ]
+    body = ',\n'.join(lines)
+    return f'{{\n  "version": {MANIFEST_VERSION},\n  "dates": {{\n{body}\n  }}\n}}\n'
+
+def _author_of(path, content, sha):
+    author = parse_entry(content, sha).author
+    if author is None:
+        # タイトルがない場合はファイル名（投稿者名_タイムスタンプ.md）から推測する
+        author = path.rsplit('/', 1)[-1].rsplit('_', 1)[0]
+    return author
+
+def make_item(path, content, sha=None, created_at=None, updated_at=None):
+    """エントリ1件分のメタデータを作る"""
+    if sha is None:
+        sha = blob_sha(content)
+    return {
+        "author": _author_of(path, content, sha),
+        "author_id": parse_entry(content, sha).author_id,
+        "path": path,
+        "sha": sha,
+        "size": len(content.encode('utf-8')),
+        "created_at": created_at,
+        "updated_at": updated_at
+    }
+
+def apply_changes(manifest, changes, now=None):
+    """変更（パス -> 内容、Noneなら削除）を反映した新しいマニフェストを返す
+
+    元のマニフェストは変更しないので、キャッシュしているものをそのまま渡してよい。
+    """
+    if now is None:
+        now = datetime.datetime.now().isoformat(timespec='seconds')
+
+    dates = dict(manifest["dates"])
+    for path, content in changes.items():
+        if not is_entry_path(path):
+            continue
+        date = path.split('/')[1]
+        items = [item for item in dates.get(date, []) if item["path"] != path]
+        previous = next((item for item in dates.get(date, []) if item["path"] == path), None)
+
+        if content is not None:
+            created_at = previous["created_at"] if previous else now
+            items.append(make_item(path, content, created_at=created_at, updated_at=now))
+            items.sort(key=lambda item: item["path"])
+
+        if items:
+            dates[date] = items
+        else:
+            dates.pop(date, None)
+
+    return {"version": MANIFEST_VERSION, "dates": dates}
+
+def _written_at(content, sha):
+    """エントリの「## 日時」からISO形式の日時を返す（読み取れなければNone）"""
+    written = parse_entry(content, sha).section('日時')
+    try:
+        return datetime.datetime.strptime(written, '%Y年%m月%d日 %H:%M:%S').isoformat()
+    except (TypeError, ValueError):
+        return None
+
+def build(entries):
+    """エントリの一覧（path / content / sha を持つ）からマニフェストを作り直す"""
+    manifest = empty()
+    for entry in entries:
+        if not is_entry_path(entry['path']) or entry['content'] is None:
+            continue
+        written_at = _written_at(entry['content'], entry.get('sha'))
+        item = make_item(entry['path'], entry['content'], entry.get('sha'), written_at, written_at)
+        manifest["dates"].setdefault(entry['path'].split('/')[1], []).append(item)
+
+    for items in manifest["dates"].values():
+        items.sort(key=lambda item: item["path"])
+    return manifest
+
+def items_for_date(manifest, date):
+    """指定した日付のエントリのメタデータをファイル名順で返す"""
+    return list(manifest["dates"].get(date, []))
+
+def find_entry(manifest, date, author_id=None, author_name=None):
+    """指定した日付の投稿者のエントリのメタデータを返す（なければNone）
+
+    DiscordユーザーIDで探し、IDを持たない古いエントリは投稿者名の完全一致で探す。
+    """
+    for item in manifest["dates"].get(date, []):
+        if author_id is not None and item.get("author_id") == author_id:
+            return item
+    for item in manifest["dates"].get(date, []):
+        if item.get("author_id") is None and item["author"] == author_name:
+            return item
+    return None
+
+def date_items(manifest):
+    """(日付, その日のエントリのメタデータ) を新しい日付順で返す"""
+    return sorted(manifest["dates"].items(), reverse=True)
@@ -0,0 +1,179 @@
+import time
+import asyncio
+import threading
+from aiohttp import web
+
+# レイテンシのヒストグラムの区切り（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# イベントループの遅れを測る間隔（秒）
+LOOP_LAG_INTERVAL = 1.0
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+def _format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    """単調増加するカウンター（ラベルごと）"""
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for label_values, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}")
+        return lines
+
+class Histogram:
+    """値の分布（ラベルごとに区切りごとの累積数・合計・件数を持つ）"""
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = tuple(buckets) + (float('inf'),)
+        self._values = {}  # ラベル -> [区切りごとの件数, 合計, 件数]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        with self._lock:
+            item = self._values.get(label_values)
+            if item is None:
+                item = self._values[label_values] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    item[0][i] += 1
+                    break
+            item[1] += value
+            item[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for label_values, (counts, total, count) in sorted(self._values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    labels = _format_labels(self.labels, label_values, ("le", _format_value(bound)))
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _format_labels(self.labels, label_values)
+                lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+                lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+class Gauge:
+    """読み出し時に関数を呼んで値を得るゲージ
+
+    関数は数値か、ラベルの値のタプル -> 数値 の辞書を返す。
+    """
+
+    def __init__(self, name, help_text, func, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.func = func
+        self.labels = labels
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge"]
+        try:
+            values = self.func()
+        except Exception as e:
+            print(f"Error reading metric {self.name}: {e}")
+            return lines
+        if not isinstance(values, dict):
+            values = {(): values}
+        for label_values, value in sorted(values.items()):
+            if value is None:
+                continue
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}")
+        return lines
+
+_metrics = []
+_metrics_lock = threading.Lock()
+
+def _register(metric):
+    with _metrics_lock:
+        _metrics.append(metric)
+    return metric
+
+def counter(name, help_text, labels=()):
+    return _register(Counter(name, help_text, labels))
+
+def histogram(name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+    return _register(Histogram(name, help_text, labels, buckets))
+
+def gauge(name, help_text, func, labels=()):
+    return _register(Gauge(name, help_text, func, labels))
+
+def render():
+    """Prometheusのテキスト形式で全メトリクスを返す"""
+    with _metrics_lock:
+        metrics = list(_metrics)
+    lines = []
+    for metric in metrics:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+# ボット全体で共通のメトリクス
+command_duration = histogram(
+    "diary_command_duration_seconds",
+    "Time spent handling a bot command.",
+    ("command", "status")
+)
+loop_lag = histogram(
+    "diary_event_loop_lag_seconds",
+    "How late the event loop woke up a periodic timer.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5)
+)
+_last_loop_lag = [0.0]
+gauge("diary_event_loop_lag_last_seconds", "Most recent event loop lag measurement.", lambda: _last_loop_lag[0])
+
+async def _monitor_loop_lag():
+    """一定間隔で眠り、予定より遅れて起きた時間をイベントループの遅れとして記録する"""
+    while True:
+        started = time.monotonic()
+        await asyncio.sleep(LOOP_LAG_INTERVAL)
+        lag = max(0.0, time.monotonic() - started - LOOP_LAG_INTERVAL)
+        _last_loop_lag[0] = lag
+        loop_lag.observe(lag)
+
+async def _handle_metrics(request):
+    return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+
+_server = None
+
+async def start_server(host, port):
+    """/metrics を返すHTTPサーバーをボットと同じイベントループで起動する（2回目以降は何もしない）"""
+    global _server
+    if _server is not None:
+        return
+    app = web.Application()
+    app.router.add_get("/metrics", _handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    _server = (runner, asyncio.create_task(_monitor_loop_lag()))
+    print(f"Metrics available at http://{host}:{port}/metrics")
@@ -0,0 +1,107 @@
+import os
+import json
+import threading
+
+class DiaryMirror:
+    """diaryフォルダのローカルミラー
+
+    ファイル内容はblob SHAをキーにしてディスクに保存し（内容アドレス方式）、
+    パスとblob SHAの対応表は最後に同期したコミットSHAと一緒に保存する。
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.blob_dir = os.path.join(root, "blobs")
+        self.state_path = os.path.join(root, "state.json")
+        self.head_sha = None
+        self.files = {}  # パス -> blob SHA
+        self._lock = threading.Lock()
+
+        os.makedirs(self.blob_dir, exist_ok=True)
+        self._load_state()
+
+    def _load_state(self):
+        """保存済みの同期状態を読み込む"""
+        try:
+            with open(self.state_path, encoding='utf-8') as f:
+                state = json.load(f)
+            self.head_sha = state.get("head_sha")
+            self.files = state.get("files", {})
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            # 壊れている場合は次回の同期で作り直す
+            print(f"Error loading mirror state: {e}")
+            self.head_sha = None
+            self.files = {}
+
+    def _save_state(self):
+        """同期状態をアトミックに書き出す"""
+        tmp_path = self.state_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({"head_sha": self.head_sha, "files": self.files}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.state_path)
+
+    def _blob_path(self, sha):
+        return os.path.join(self.blob_dir, sha[:2], sha[2:])
+
+    def has_blob(self, sha):
+        return os.path.exists(self._blob_path(sha))
+
+    def read_blob(self, sha):
+        """blobの内容を返す（未取得ならNone）"""
+        # 改行を変換すると内容がblob SHAと合わなくなるので、\r\nなどもそのまま読み書きする
+        try:
+            with open(self._blob_path(sha), encoding='utf-8', newline='') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def write_blob(self, sha, content):
+        """blobの内容を保存する"""
+        path = self._blob_path(sha)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8', newline='') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    def missing_blobs(self, files):
+        """ローカルにないblob SHAの一覧を返す"""
+        return list({sha for sha in files.values() if sha and not self.has_blob(sha)})
+
+    def replace_all(self, head_sha, files):
+        """ツリー全体の一覧で置き換える"""
+        with self._lock:
+            self.files = dict(files)
+            self.head_sha = head_sha
+            self._save_state()
+
+    def apply_changes(self, head_sha, changes):
+        """変更のあったパスだけ反映する（SHAがNoneのパスは削除）"""
+        with self._lock:
+            for path, sha in changes.items():
+                if sha is None:
+                    self.files.pop(path, None)
+                else:
+                    self.files[path] = sha
+            self.head_sha = head_sha
+            self._save_state()
+
+    def list_entries(self):
+        """日記エントリの一覧を新しい日付順で返す"""
+        entries = []
+        for path, sha in self.files.items():
+            parts = path.split('/')
+            if len(parts) != 3 or not parts[2].endswith('.md'):
+                continue
+            entries.append({
+                'date': parts[1],
+                'filename': parts[2],
+                'path': path,
+                'sha': sha
+            })
+
+        entries.sort(key=lambda entry: (entry['date'], entry['filename']))
+        entries.sort(key=lambda entry: entry['date'], reverse=True)
+        return entries
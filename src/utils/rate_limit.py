@@ -0,0 +1,136 @@
+import time
+import asyncio
+import threading
+
+# 優先度（対話的なコマンドを一括処理より先に通す）
+INTERACTIVE = "interactive"
+BACKGROUND = "background"
+
+# 対話的な処理がセカンダリレート制限の解除を待つ最大時間（秒）
+MAX_INTERACTIVE_WAIT = 30
+
+class QuotaExhausted(Exception):
+    """APIの利用上限のため処理を実行できない"""
+
+class RateLimitScheduler:
+    """GitHub APIの呼び出しを割り当てるスケジューラ
+
+    トークンバケットで呼び出しの勢いを抑えつつ、応答ヘッダーの
+    X-RateLimit-Remaining / Retry-After から残りの利用枠を追跡する。
+    残りが少なくなったらバックグラウンドの処理（一括取得や索引の作り直し）から断り、
+    ユーザーの書き込みや表示のための枠を残す。
+    """
+
+    def __init__(self, rate, burst, reserve):
+        self.rate = rate          # 1秒あたりに補充するトークン数
+        self.burst = burst        # バケットの大きさ
+        self.reserve = reserve    # これを下回ったらバックグラウンドの処理を断る残り枠
+
+        self.remaining = None     # 直近の応答のX-RateLimit-Remaining
+        self.limit = None
+        self.reset_at = None      # 利用枠が回復する時刻（UNIX時間）
+        self.blocked_until = 0.0  # Retry-Afterなどで待つべき時刻（UNIX時間）
+
+        self._tokens = float(burst)
+        self._refilled_at = time.monotonic()
+        self._interactive_waiting = 0
+        self._lock = threading.Lock()  # 応答ヘッダーはワーカースレッドから届く
+
+        # 統計
+        self.granted = {INTERACTIVE: 0, BACKGROUND: 0}
+        self.shed = 0
+        self.throttled = 0
+        self.wait_seconds = 0.0
+
+    def observe(self, status, headers):
+        """応答ヘッダーから利用枠とレート制限の状態を更新する（どのスレッドからでも呼べる）"""
+        now = time.time()
+        with self._lock:
+            remaining = headers.get("X-RateLimit-Remaining")
+            if remaining is not None:
+                self.remaining = int(remaining)
+            if headers.get("X-RateLimit-Limit") is not None:
+                self.limit = int(headers["X-RateLimit-Limit"])
+            if headers.get("X-RateLimit-Reset") is not None:
+                self.reset_at = float(headers["X-RateLimit-Reset"])
+
+            if status in (403, 429):
+                retry_after = headers.get("Retry-After")
+                if retry_after is not None:
+                    # セカンダリレート制限
+                    self.blocked_until = max(self.blocked_until, now + float(retry_after))
+                    self.throttled += 1
+                elif self.remaining == 0 and self.reset_at is not None:
+                    self.blocked_until = max(self.blocked_until, self.reset_at)
+                    self.throttled += 1
+
+    def _quota_low(self, now):
+        with self._lock:
+            if self.remaining is None:
+                return False
+            if self.reset_at is not None and self.reset_at <= now:
+                # 利用枠は回復済み（次の応答で更新される）
+                return False
+            return self.remaining <= self.reserve
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+        self._refilled_at = now
+
+    async def acquire(self, priority=INTERACTIVE, cost=1):
+        """呼び出しの許可を待つ（costは呼び出し数の見込み）
+
+        バックグラウンドの処理は、利用枠が少ないときや対話的な処理が待っているときは後回しにされ、
+        利用枠が予備分を下回るとQuotaExhaustedで断られる。トークンを前借りすることもない。
+        """
+        started = time.monotonic()
+        if priority == INTERACTIVE:
+            self._interactive_waiting += 1
+        try:
+            while True:
+                now = time.time()
+                if priority == BACKGROUND and self._quota_low(now):
+                    self.shed += 1
+                    raise QuotaExhausted("GitHub APIの利用上限が近いため、この処理は後でもう一度実行してください。")
+
+                blocked = self.blocked_until - now
+                if blocked > 0:
+                    if priority == INTERACTIVE and blocked > MAX_INTERACTIVE_WAIT:
+                        raise QuotaExhausted("GitHub APIの利用上限に達しました。しばらくしてからもう一度実行してください。")
+                    await asyncio.sleep(blocked)
+                    continue
+
+                self._refill()
+                # 対話的な大きな処理はバケット以上のトークンを前借りしてよい（その分あとの呼び出しが待つ）。
+                # バックグラウンドの処理は前借りしない（一括取得の借りを対話的な処理に払わせない）ので、
+                # 呼び出し側でバケット以下の大きさに分けて呼ぶ
+                needed = min(cost, self.burst)
+                if self._tokens >= needed and (priority == INTERACTIVE or self._interactive_waiting == 0):
+                    if priority == INTERACTIVE:
+                        self._tokens -= cost
+                    else:
+                        self._tokens = max(0.0, self._tokens - cost)
+                    self.granted[priority] += 1
+                    self.wait_seconds += time.monotonic() - started
+                    return
+
+                await asyncio.sleep(max(needed - self._tokens, 1) / self.rate)
+        finally:
+            if priority == INTERACTIVE:
+                self._interactive_waiting -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "remaining": self.remaining,
+                "limit": self.limit,
+                "reset_at": self.reset_at,
+                "blocked_until": self.blocked_until,
+                "tokens": self._tokens,
+                "granted_interactive": self.granted[INTERACTIVE],
+                "granted_background": self.granted[BACKGROUND],
+                "shed": self.shed,
+                "throttled": self.throttled,
+                "wait_seconds": self.wait_seconds
+            }
@@ -0,0 +1,467 @@
+import os
+import re
+import json
+import math
+import sqlite3
+import threading
+import unicodedata
+from collections import Counter
+from src.utils.diary_entry import parse_entry
+from src.utils.manifest import is_entry_path
+
+# スキーマを変えたら上げる（古いデータベースは作り直す）
+SCHEMA_VERSION = 3
+
+# trigramのFTS5で検索できる語の最小の長さ（これより短い語はentry_grams表で探す）
+TRIGRAM_MIN_LENGTH = 3
+
+# BM25のパラメータ
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# 1回の検索で使う語の最大数（語ごとの一致を64ビット整数のビットで表す）
+MAX_QUERY_TERMS = 62
+
+# スニペットとして前後に表示する文字数
+SNIPPET_MARGIN = 50
+
+# OR区切り（「A OR B」または「A | B」）
+_OR_PATTERN = re.compile(r'\s+OR\s+|\s*\|\s*')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    date TEXT NOT NULL,
+    filename TEXT NOT NULL,
+    author TEXT,
+    author_id INTEGER,
+    sha TEXT NOT NULL,
+    body_length INTEGER NOT NULL,
+    content TEXT NOT NULL,
+    sections TEXT NOT NULL,
+    body TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_by_date ON entries (date, filename);
+CREATE INDEX IF NOT EXISTS entries_by_author ON entries (date, author_id, author);
+CREATE INDEX IF NOT EXISTS entries_by_length ON entries (body_length);
+CREATE TABLE IF NOT EXISTS entry_grams (
+    gram TEXT NOT NULL,
+    entry_id INTEGER NOT NULL,
+    tf INTEGER NOT NULL,
+    body_length INTEGER NOT NULL,
+    PRIMARY KEY (gram, entry_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entry_grams_by_entry ON entry_grams (entry_id);
+"""
+
+# 全文検索表はentriesのbody（正規化した本文）を外部コンテンツとして参照し、トリガーで同期する
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS entries_fts USING fts5(
+    body, content='entries', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS entries_fts_insert AFTER INSERT ON entries BEGIN
+    INSERT INTO entries_fts (rowid, body) VALUES (new.id, new.body);
+END;
+CREATE TRIGGER IF NOT EXISTS entries_fts_delete AFTER DELETE ON entries BEGIN
+    INSERT INTO entries_fts (entries_fts, rowid, body) VALUES ('delete', old.id, old.body);
+END;
+CREATE TRIGGER IF NOT EXISTS entries_fts_update AFTER UPDATE ON entries BEGIN
+    INSERT INTO entries_fts (entries_fts, rowid, body) VALUES ('delete', old.id, old.body);
+    INSERT INTO entries_fts (rowid, body) VALUES (new.id, new.body);
+END;
+"""
+
+# 検索の途中結果（接続ごとの一時表）。語ごとの一致とスコア、いずれかの節に一致したエントリとスコアを持つ
+_SEARCH_SCHEMA = """
+CREATE TEMP TABLE IF NOT EXISTS search_terms (
+    id INTEGER NOT NULL, term INTEGER NOT NULL, score REAL NOT NULL,
+    PRIMARY KEY (id, term)
+) WITHOUT ROWID;
+CREATE TEMP TABLE IF NOT EXISTS search_matches (id INTEGER PRIMARY KEY, score REAL NOT NULL);
+"""
+
+_ENTRY_COLUMNS = "date, filename, content, path, sha"
+
+def _normalize_char(char):
+    """1文字ずつ正規化する（全角英数→半角、大文字→小文字）
+
+    文字数を変えない変換だけを行うので、正規化後の位置がそのまま元の文章の位置になる。
+    """
+    normalized = unicodedata.normalize('NFKC', char)
+    if len(normalized) != 1:
+        normalized = char
+    lowered = normalized.lower()
+    return lowered if len(lowered) == 1 else normalized
+
+def normalize(text):
+    """検索用に文章を正規化する"""
+    return ''.join(_normalize_char(char) for char in text)
+
+def parse_query(query):
+    """クエリをOR区切りの節（各節はAND条件の語のリスト）に分解する"""
+    clauses = []
+    for clause in _OR_PATTERN.split(query.strip()):
+        terms = [normalize(term) for term in clause.split()]
+        if terms:
+            clauses.append(terms)
+    return clauses
+
+def _grams(body):
+    """本文に含まれる1文字と2文字の語（空白を含まないもの）と出現回数
+
+    trigramの全文検索では探せない短い語はこの表から探す。語は空白で区切られるので、
+    空白を含む組み合わせは登録しない。
+    """
+    grams = Counter()
+    previous = None
+    for char in body:
+        if char.isspace():
+            previous = None
+            continue
+        grams[char] += 1
+        if previous is not None:
+            grams[previous + char] += 1
+        previous = char
+    return grams
+
+def _idf(doc_count, df):
+    """FTS5のbm25()と同じidf（半数以上のエントリに出る語は小さな正の値にする）"""
+    idf = math.log((doc_count - df + 0.5) / (df + 0.5))
+    return idf if idf > 0 else 1e-6
+
+def _highlight(body, clauses):
+    """一致した節の語の位置と、スニペットとして表示する範囲を返す"""
+    matched_terms = set()
+    for clause in clauses:
+        if all(term in body for term in clause):
+            matched_terms.update(clause)
+
+    matches = []
+    for term in matched_terms:
+        matches.extend((position, position + len(term)) for position in _positions(body, term))
+    matches.sort()
+    first_start, first_end = matches[0] if matches else (0, 0)
+    return matches, (max(0, first_start - SNIPPET_MARGIN), first_end + SNIPPET_MARGIN)
+
+def _entry(row):
+    return {'date': row[0], 'filename': row[1], 'content': row[2], 'path': row[3], 'sha': row[4]}
+
+def _positions(body, term):
+    """本文の中で語が現れる位置をすべて返す（重なりも含む）"""
+    positions = []
+    position = body.find(term)
+    while position != -1:
+        positions.append(position)
+        position = body.find(term, position + 1)
+    return positions
+
+class ReadModel:
+    """日記エントリの読み取り用データベース（SQLite）
+
+    GitHubのリポジトリから作る派生データで、いつでも作り直せる。entries表にエントリの
+    メタデータ・本文・セクションを持つ。検索はSQLiteの中で語ごとにBM25のスコアを付けて順位を決め、
+    本文は返すページの分だけ読む。3文字以上の語はFTS5（trigram）の全文検索表とbm25()で、
+    trigramでは探せない2文字以下の語は本文の1文字・2文字の語と出現回数を登録したentry_grams表で
+    スコアを付ける（trigramが使えないSQLiteでは長い語もこの表で候補を絞る）。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        # 接続はワーカースレッドと共有し、ロックで1つずつ使う
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self.fts = False
+        # イベントループから待たずに読めるよう、同期済みのコミットとエントリ数はメモリにも持つ
+        self._head_sha = None
+        self._count = 0
+        self._total_length = 0
+        self._open()
+
+    def _open(self):
+        with self._lock:
+            db = self._db
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+            row = db.execute("SELECT value FROM meta WHERE key = 'schema_version'").fetchone()
+            if row is None or int(row[0]) != SCHEMA_VERSION:
+                # 派生データなので古い形式は捨てて次回の同期で作り直す
+                db.executescript(
+                    "DROP TABLE IF EXISTS entries_fts; DROP TABLE IF EXISTS entry_grams; "
+                    "DROP TABLE IF EXISTS entries; DELETE FROM meta;"
+                )
+                db.execute("INSERT INTO meta (key, value) VALUES ('schema_version', ?)", (str(SCHEMA_VERSION),))
+            db.executescript(_SCHEMA)
+            try:
+                db.executescript(_FTS_SCHEMA)
+                self.fts = True
+            except sqlite3.OperationalError as e:
+                print(f"Full-text search is not available, falling back to the n-gram table: {e}")
+            db.executescript(_SEARCH_SCHEMA)
+            db.commit()
+            self._head_sha = self._get_meta('head_sha')
+            self._load_totals()
+
+    def _load_totals(self):
+        # 本文の長さの索引だけで数えられる
+        count, total_length = self._db.execute("SELECT count(*), total(body_length) FROM entries").fetchone()
+        self._count = count
+        self._total_length = total_length
+
+    def _get_meta(self, key):
+        row = self._db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    @property
+    def head_sha(self):
+        """最後に同期したコミットSHA（まだ同期していなければNone）。データベースにはアクセスしない"""
+        return self._head_sha
+
+    @property
+    def ready(self):
+        return self.head_sha is not None
+
+    # --- 書き込み ---
+
+    def apply(self, changes, head_sha=None):
+        """変更（パス -> (blob SHA, 内容)、Noneなら削除）を1つのトランザクションで反映する"""
+        rows = []
+        deleted = []
+        grams = {}  # パス -> 本文の短い語
+        for path, change in changes.items():
+            if not is_entry_path(path):
+                continue
+            if change is None:
+                deleted.append((path,))
+                continue
+            sha, content = change
+            entry = parse_entry(content, sha)
+            _, date, filename = path.split('/')
+            body = normalize(content)
+            rows.append((
+                path, date, filename,
+                entry.author or filename.rsplit('_', 1)[0],
+                entry.author_id,
+                sha, len(body), content,
+                json.dumps(list(entry.sections()), ensure_ascii=False),
+                body
+            ))
+            grams[path] = _grams(body)
+
+        with self._lock:
+            with self._db:
+                self._apply_rows(rows, deleted, grams, head_sha)
+            # コミットできてからメモリ上の値を更新する
+            self._load_totals()
+            if head_sha is not None:
+                self._head_sha = head_sha
+
+    def _apply_rows(self, rows, deleted, grams, head_sha):
+        self._db.executemany(
+            "DELETE FROM entry_grams WHERE entry_id IN (SELECT id FROM entries WHERE path = ?)",
+            deleted + [(path,) for path in grams]
+        )
+        self._db.executemany("DELETE FROM entries WHERE path = ?", deleted)
+        self._db.executemany(
+            """INSERT INTO entries (path, date, filename, author, author_id, sha, body_length, content, sections, body)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT (path) DO UPDATE SET
+                   author = excluded.author, author_id = excluded.author_id, sha = excluded.sha,
+                   body_length = excluded.body_length, content = excluded.content,
+                   sections = excluded.sections, body = excluded.body""",
+            rows
+        )
+        for path, path_grams in grams.items():
+            entry_id, body_length = self._db.execute(
+                "SELECT id, body_length FROM entries WHERE path = ?", (path,)
+            ).fetchone()
+            # 検索でentriesを読まずにスコアを計算できるよう、本文の長さも持たせる
+            self._db.executemany(
+                "INSERT INTO entry_grams (gram, entry_id, tf, body_length) VALUES (?, ?, ?, ?)",
+                ((gram, entry_id, tf, body_length) for gram, tf in path_grams.items())
+            )
+        if head_sha is not None:
+            self._db.execute(
+                "INSERT INTO meta (key, value) VALUES ('head_sha', ?) "
+                "ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+                (head_sha,)
+            )
+
+    def clear(self):
+        """すべてのエントリを消す（次の同期で作り直す）"""
+        with self._lock:
+            with self._db:
+                self._db.execute("DELETE FROM entry_grams")
+                self._db.execute("DELETE FROM entries")
+                self._db.execute("DELETE FROM meta WHERE key = 'head_sha'")
+                if self.fts:
+                    self._db.execute("INSERT INTO entries_fts (entries_fts) VALUES ('rebuild')")
+            self._count = 0
+            self._total_length = 0
+            self._head_sha = None
+
+    # --- 読み込み ---
+
+    def indexed_shas(self):
+        """登録済みのパスとblob SHAの対応を返す"""
+        with self._lock:
+            return dict(self._db.execute("SELECT path, sha FROM entries"))
+
+    def count(self):
+        """エントリ数（データベースにはアクセスしない）"""
+        return self._count
+
+    def get_entry(self, path):
+        with self._lock:
+            row = self._db.execute(f"SELECT {_ENTRY_COLUMNS} FROM entries WHERE path = ?", (path,)).fetchone()
+        return _entry(row) if row else None
+
+    def entries_for_date(self, date):
+        """指定した日付のエントリをファイル名順で返す"""
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {_ENTRY_COLUMNS} FROM entries WHERE date = ? ORDER BY filename", (date,)
+            ).fetchall()
+        return [_entry(row) for row in rows]
+
+    def find_entry(self, date, author_id=None, author_name=None):
+        """指定した日付の投稿者のエントリを返す（IDを持たない古いエントリは名前の完全一致で探す）"""
+        with self._lock:
+            row = None
+            if author_id is not None:
+                row = self._db.execute(
+                    f"SELECT {_ENTRY_COLUMNS} FROM entries WHERE date = ? AND author_id = ? ORDER BY filename LIMIT 1",
+                    (date, author_id)
+                ).fetchone()
+            if row is None:
+                row = self._db.execute(
+                    f"SELECT {_ENTRY_COLUMNS} FROM entries WHERE date = ? AND author_id IS NULL AND author = ? "
+                    "ORDER BY filename LIMIT 1",
+                    (date, author_name)
+                ).fetchone()
+        return _entry(row) if row else None
+
+    def entries_between(self, start_date, end_date):
+        """日付範囲のエントリを古い日付順で返す"""
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {_ENTRY_COLUMNS} FROM entries WHERE date BETWEEN ? AND ? ORDER BY date, filename",
+                (start_date, end_date)
+            ).fetchall()
+        return [_entry(row) for row in rows]
+
+    def entries_page(self, after=None, limit=50):
+        """エントリを新しい日付順に limit 件返す（afterは前のページの最後のエントリ）"""
+        with self._lock:
+            if after is None:
+                rows = self._db.execute(
+                    f"SELECT {_ENTRY_COLUMNS} FROM entries ORDER BY date DESC, filename LIMIT ?", (limit,)
+                ).fetchall()
+            else:
+                rows = self._db.execute(
+                    f"SELECT {_ENTRY_COLUMNS} FROM entries WHERE date < ? OR (date = ? AND filename > ?) "
+                    "ORDER BY date DESC, filename LIMIT ?",
+                    (after['date'], after['date'], after['filename'], limit)
+                ).fetchall()
+        return [_entry(row) for row in rows]
+
+    def _score_term(self, number, term, avg_length):
+        """語を含むエントリとそのBM25のスコアをsearch_termsに入れる"""
+        db = self._db
+        if self.fts and len(term) >= TRIGRAM_MIN_LENGTH:
+            # bm25()は一致度が高いほど小さい値を返すので符号を反転する
+            phrase = '"' + term.replace('"', '""') + '"'
+            db.execute(
+                "INSERT INTO search_terms (id, term, score) "
+                "SELECT rowid, ?, -bm25(entries_fts) FROM entries_fts WHERE entries_fts MATCH ?",
+                (number, phrase)
+            )
+            return
+
+        if len(term) < TRIGRAM_MIN_LENGTH:
+            df = db.execute("SELECT count(*) FROM entry_grams WHERE gram = ?", (term,)).fetchone()[0]
+            matches = "SELECT entry_id AS id, tf, body_length FROM entry_grams WHERE gram = ?"
+            args = [term]
+        else:
+            # 語に含まれる2文字の語をすべて持つエントリに絞ってから本文で数える
+            bigrams = sorted({term[i:i + 2] for i in range(len(term) - 1)})
+            candidates = " INTERSECT ".join(["SELECT entry_id FROM entry_grams WHERE gram = ?"] * len(bigrams))
+            matches = (
+                "SELECT id, (length(body) - length(replace(body, ?, ''))) / ? AS tf, body_length "
+                f"FROM entries WHERE id IN ({candidates}) AND instr(body, ?) > 0"
+            )
+            args = [term, len(term)] + bigrams + [term]
+            df = db.execute(f"SELECT count(*) FROM ({matches})", args).fetchone()[0]
+
+        db.execute(
+            "INSERT INTO search_terms (id, term, score) "
+            f"SELECT id, ?, ? * tf * ? / (tf + ? * (1 - ? + ? * body_length / ?)) FROM ({matches})",
+            [number, _idf(self._count, df), BM25_K1 + 1, BM25_K1, BM25_B, BM25_B, avg_length] + args
+        )
+
+    def search(self, query, limit=None, offset=0):
+        """クエリに一致するエントリをスコアの高い順に返す（戻り値は (一致した件数, 結果のリスト)）
+
+        順位付けはSQLiteの中で行い、本文は offset から limit 件分だけ読む。結果の各要素は
+        path / score / matches（一致した範囲のリスト）/ snippet（表示用の範囲）を持つ。
+        エントリの内容は含まないので、必要な分だけ get_entry で読み込む。
+        """
+        clauses = parse_query(query)
+        # 語ごとの一致をビットで表すので、語が多すぎるクエリは先頭の語だけで探す
+        terms = list(dict.fromkeys(term for clause in clauses for term in clause))[:MAX_QUERY_TERMS]
+        numbers = {term: number for number, term in enumerate(terms)}
+        clauses = [clause for clause in clauses if all(term in numbers for term in clause)]
+        if not clauses:
+            return 0, []
+
+        with self._lock:
+            if self._count == 0:
+                return 0, []
+            avg_length = self._total_length / self._count or 1
+
+            with self._db:
+                db = self._db
+                db.execute("DELETE FROM search_terms")
+                db.execute("DELETE FROM search_matches")
+                for term, number in numbers.items():
+                    self._score_term(number, term, avg_length)
+
+                # 節のすべての語を含むエントリが一致。スコアは含まれる語のスコアの合計
+                masks = [sum(1 << numbers[term] for term in set(clause)) for clause in clauses]
+                condition = " OR ".join(["(sum(1 << term) & ?) = ?"] * len(masks))
+                db.execute(
+                    "INSERT INTO search_matches (id, score) SELECT id, sum(score) FROM search_terms "
+                    f"GROUP BY id HAVING {condition}",
+                    [mask for mask in masks for _ in range(2)]
+                )
+                total = db.execute("SELECT count(*) FROM search_matches").fetchone()[0]
+
+                # 同点なら新しい日付順に並べるので、パスはページの最後と同点以上のエントリの分だけ読む
+                lowest = None
+                if limit is not None:
+                    row = db.execute(
+                        "SELECT score FROM search_matches ORDER BY score DESC LIMIT 1 OFFSET ?",
+                        (offset + limit - 1,)
+                    ).fetchone()
+                    lowest = row[0] if row else None
+                rows = db.execute(
+                    """SELECT e.path, ranked.score, e.body FROM (
+                           SELECT m.id, m.score FROM search_matches m JOIN entries e ON e.id = m.id
+                           WHERE ? IS NULL OR m.score >= ?
+                           ORDER BY m.score DESC, e.path DESC
+                           LIMIT ? OFFSET ?
+                       ) ranked JOIN entries e ON e.id = ranked.id
+                       ORDER BY ranked.score DESC, e.path DESC""",
+                    (lowest, lowest, -1 if limit is None else limit, offset)
+                ).fetchall()
+
+        results = []
+        for path, score, body in rows:
+            matches, snippet = _highlight(body, clauses)
+            results.append({'path': path, 'score': score, 'matches': matches, 'snippet': snippet})
+        return total, results
+
+    def stats(self):
+        return {"entries": self.count(), "head_sha": self.head_sha, "full_text_search": self.fts}
@@ -0,0 +1,67 @@
+import asyncio
+
+# timeoutを省略したことを表す（Noneはタイムアウトなし）
+_DEFAULT_TIMEOUT = object()
+
+class SingleFlight:
+    """同じキーの同時の読み込みを1回の呼び出しにまとめる
+
+    最初の呼び出しだけが実際に処理を実行し、実行中に同じキーで来た呼び出しはその結果を待つ。
+    例外もすべての呼び出し元にそのまま伝わる。処理がタイムアウトしたら待っている全員に
+    TimeoutErrorを返し、キーを解放して次の呼び出しでやり直す。
+    """
+
+    def __init__(self, timeout=None, on_coalesce=None):
+        self.timeout = timeout
+        # on_coalesce(キー) はまとめられた呼び出しごとに呼ばれる（メトリクス用）
+        self._on_coalesce = on_coalesce
+        self._inflight = {}  # キー -> 実行中のタスク
+
+        # 統計
+        self.calls = 0
+        self.coalesced = 0
+        self.timeouts = 0
+
+    async def do(self, key, func, *args, timeout=_DEFAULT_TIMEOUT, **kwargs):
+        """キーに対して func(*args, **kwargs) を実行するか、実行中の結果を待つ
+
+        timeoutを省略するとインスタンスの既定値を使い、Noneならタイムアウトしない
+        （実行中の処理には最初の呼び出しの値が適用される）。
+        """
+        task = self._inflight.get(key)
+        if task is None:
+            self.calls += 1
+            if timeout is _DEFAULT_TIMEOUT:
+                timeout = self.timeout
+            task = asyncio.create_task(self._call(func(*args, **kwargs), timeout))
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._release(key, done))
+        else:
+            self.coalesced += 1
+            if self._on_coalesce is not None:
+                self._on_coalesce(key)
+
+        # 呼び出し元の1人がキャンセルされても、共有している処理は止めない
+        return await asyncio.shield(task)
+
+    async def _call(self, coro, timeout):
+        try:
+            return await asyncio.wait_for(coro, timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+
+    def _release(self, key, task):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # 待っている呼び出し元がいなくなっていても、例外が未処理として警告されないようにする
+        if not task.cancelled():
+            task.exception()
+
+    def stats(self):
+        return {
+            "calls": self.calls,
+            "coalesced": self.coalesced,
+            "timeouts": self.timeouts,
+            "in_flight": len(self._inflight)
+        }
@@ -0,0 +1,238 @@
+import os
+import json
+import time
+import asyncio
+
+class WriteQueue:
+    """書き込みを短い時間まとめて1つのコミットにするwrite-behindキュー
+
+    書き込みはまずディスク上のWAL（先行書き込みログ）に追記されるので、
+    enqueueが返った時点でプロセスが落ちても次回起動時に再送される。
+    同じパスへの書き込みは最後のものだけがコミットされ、まだコミットしていない
+    新規ファイルを削除した場合は作成ごと取り消される。
+    """
+
+    def __init__(self, wal_path, window, commit_func, retry_delay=5.0, max_attempts=3):
+        self.wal_path = wal_path
+        self.window = window
+        self.retry_delay = retry_delay
+        self.max_attempts = max_attempts
+        # commit_func(changes, message) はパス -> 内容（Noneなら削除）をまとめてコミットする
+        self._commit = commit_func
+        # 新規ファイルかは、コミット中の書き込みが反映された後にリモートにそのパスがないかを表す
+        self._pending = {}    # パス -> (内容, コミットメッセージ, 新規ファイルか)
+        self._inflight = {}   # コミット中のパス -> (内容, コミットメッセージ, 新規ファイルか)
+        self._flush_task = None
+        self._started = False
+        self._wal_lock = asyncio.Lock()
+        self._draining = asyncio.Event()  # drain中は待ち時間やバックオフを待たずに送る
+
+        # 統計
+        self.flush_count = 0
+        self.failure_count = 0
+        self.last_flush_latency = 0.0
+        self.total_flush_latency = 0.0
+
+    async def start(self):
+        """WALに残っている書き込みを読み込み、コミットを再開する"""
+        if self._started:
+            return
+        self._started = True
+
+        records = await asyncio.to_thread(self._read_wal)
+        for record in records:
+            self._apply(record)
+        if self._pending:
+            print(f"Replaying {len(self._pending)} queued diary writes")
+            self._schedule_flush()
+
+    def _read_wal(self):
+        records = []
+        try:
+            with open(self.wal_path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        # 書き込み途中で落ちた最後の行は捨てる
+                        continue
+        except FileNotFoundError:
+            pass
+        return records
+
+    def _append_wal(self, record):
+        os.makedirs(os.path.dirname(self.wal_path) or '.', exist_ok=True)
+        with open(self.wal_path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _rewrite_wal(self, items):
+        tmp_path = self.wal_path + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for path, (content, message, new_file) in items.items():
+                record = {"path": path, "content": content, "message": message, "new": new_file}
+                f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.wal_path)
+
+    def _apply(self, record):
+        """書き込みを未コミットの変更にまとめる"""
+        path = record["path"]
+        if path in self._pending:
+            previous_new = self._pending[path][2]
+        elif path in self._inflight:
+            # コミット中の書き込みが反映された後の状態を基準にする（削除ならもうパスはない）
+            previous_new = self._inflight[path][0] is None
+        else:
+            previous_new = False
+        new_file = record.get("new", False) or previous_new
+
+        if record["content"] is None and new_file:
+            # まだコミットしていないファイルの削除は作成ごと取り消す
+            self._pending.pop(path, None)
+        else:
+            self._pending[path] = (record["content"], record["message"], new_file)
+
+    async def enqueue(self, path, content, message, new_file=False):
+        """書き込みをキューに追加する（WALに書き込んだ時点で戻る）
+
+        contentがNoneなら削除。new_fileはまだリポジトリにないファイルの作成を表す。
+        """
+        await self.start()
+
+        async with self._wal_lock:
+            record = {"path": path, "content": content, "message": message, "new": new_file}
+            await asyncio.to_thread(self._append_wal, record)
+            self._apply(record)
+
+        self._schedule_flush()
+
+    def lookup(self, path):
+        """まだコミットされていない書き込みを返す（(見つかったか, 内容)、削除なら内容はNone）"""
+        for items in (self._pending, self._inflight):
+            if path in items:
+                return True, items[path][0]
+        return False, None
+
+    def pending_items(self):
+        """まだコミットされていない書き込みをパス -> 内容で返す"""
+        items = {path: item[0] for path, item in self._inflight.items()}
+        items.update({path: item[0] for path, item in self._pending.items()})
+        return items
+
+    def _schedule_flush(self, delay=None):
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush_later(self.window if delay is None else delay))
+
+    async def _flush_later(self, delay):
+        await self._sleep(delay)
+        await self.flush()
+
+    async def _sleep(self, delay):
+        """delay秒待つ（drainが呼ばれたらすぐ戻る）"""
+        try:
+            await asyncio.wait_for(self._draining.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+
+    async def drain(self):
+        """コミット待ちの書き込みをすべて今すぐコミットする（終了前に呼ぶ）
+
+        WALはローカルのディスクにあるので、再起動でディスクが消える環境では
+        終了前にコミットしておかないと書き込みが失われる。
+        """
+        self._draining.set()
+        try:
+            if self._flush_task is not None and not self._flush_task.done():
+                await self._flush_task
+            await self.flush()
+        finally:
+            # 終わったら以降の書き込みは通常どおり待ち時間の間まとめる
+            self._draining.clear()
+
+    async def flush(self):
+        """たまっている書き込みを1つのコミットにまとめて送る"""
+        attempts = 0
+        while self._pending:
+            batch = self._pending
+            self._pending = {}
+            self._inflight = batch
+
+            started = time.perf_counter()
+            try:
+                await self._commit_batch(batch, attempts)
+            except Exception as e:
+                attempts += 1
+                self.failure_count += 1
+                print(f"Error flushing diary writes (attempt {attempts}): {e}")
+                # 失敗した書き込みを戻す（その間に来た新しい書き込みを優先）
+                self._pending = _merge_failed(batch, self._pending)
+                self._inflight = {}
+                await self._sleep(min(self.retry_delay * attempts, 60))
+                continue
+
+            latency = time.perf_counter() - started
+            self.flush_count += 1
+            self.last_flush_latency = latency
+            self.total_flush_latency += latency
+            attempts = 0
+
+            # コミット済みの分をWALから取り除く
+            async with self._wal_lock:
+                self._inflight = {}
+                await asyncio.to_thread(self._rewrite_wal, dict(self._pending))
+
+    async def _commit_batch(self, batch, attempts):
+        if attempts < self.max_attempts:
+            changes = {path: item[0] for path, item in batch.items()}
+            await self._commit(changes, _batch_message(batch))
+            return
+
+        # 何度も失敗するときは1件ずつコミットし、リクエスト自体が不正なもの（4xx）は諦める
+        for path, (content, message, _) in list(batch.items()):
+            try:
+                await self._commit({path: content}, message)
+            except Exception as e:
+                status = getattr(e, 'status', None)
+                if status is None or not 400 <= status < 500:
+                    raise
+                print(f"Dropping diary write for {path}: {e}")
+            del batch[path]
+
+    def depth(self):
+        """コミット待ちの書き込み数"""
+        return len(self._pending) + len(self._inflight)
+
+    def stats(self):
+        return {
+            "depth": self.depth(),
+            "flushes": self.flush_count,
+            "failures": self.failure_count,
+            "last_flush_latency": self.last_flush_latency,
+            "avg_flush_latency": self.total_flush_latency / self.flush_count if self.flush_count else 0.0
+        }
+
+def _merge_failed(batch, pending):
+    """コミットに失敗した書き込みに、その間に来た書き込みを重ねる
+
+    後から来た書き込みの新規ファイルかは失敗したコミットが反映された後の状態なので、
+    失敗したコミットの前の状態に戻す。コミットできなかった新規ファイルの削除は作成ごと取り消す。
+    """
+    merged = dict(batch)
+    for path, (content, message, new_file) in pending.items():
+        if path in merged:
+            new_file = merged[path][2]
+        if content is None and new_file:
+            merged.pop(path, None)
+        else:
+            merged[path] = (content, message, new_file)
+    return merged
+
+def _batch_message(batch):
+    """まとめたコミットのメッセージを作る"""
+    messages = list(dict.fromkeys(item[1] for item in batch.values()))
+    if len(messages) == 1:
+        return messages[0]
+    return f"Update {len(batch)} diary files\n\n" + '\n'.join(f"- {message}" for message in messages)
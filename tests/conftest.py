@@ -0,0 +1,38 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from benchmarks.fake_github import FakeGitHub, FakeRepository
+from src.utils import manifest as diary_index
+
+@pytest.fixture(scope='session')
+def github(tmp_path_factory):
+    """偽のGitHubサーバーにつないだ github_utils（セッションで1つ）
+
+    github_utils は設定やロックをモジュールに持つので、読み込みもイベントループも1回だけにし、
+    テストは run() で同じイベントループ上で実行する。
+    """
+    repository = FakeRepository()
+    repository.commit_files({diary_index.MANIFEST_PATH: diary_index.dumps(diary_index.build([]))}, "Initial commit")
+    server = FakeGitHub(repository, quota=10 ** 9).start()
+    loop = asyncio.new_event_loop()
+
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        # 設定は読み込み時に環境変数から決まるので、github_utils は偽サーバーを起動してから読み込む
+        monkeypatch.setenv("GITHUB_TOKEN", "test")
+        monkeypatch.setenv("GITHUB_API_URL", server.url)
+        monkeypatch.setenv("ALLOWED_CHANNELS", "1")
+        monkeypatch.setenv("DIARY_MIRROR_DIR", str(tmp_path_factory.mktemp("mirror")))
+        # 書き込みは drain_write_queue でだけコミットする
+        monkeypatch.setenv("WRITE_QUEUE_WINDOW_SECONDS", "600")
+        # レート制限で待たずに取得する
+        monkeypatch.setenv("GITHUB_RATE_PER_SECOND", "100000")
+        monkeypatch.setenv("GITHUB_RATE_BURST", "100000")
+        from src.utils import github_utils
+
+    yield SimpleNamespace(server=server, utils=github_utils, run=loop.run_until_complete)
+
+    loop.run_until_complete(github_utils.drain_write_queue())
+    loop.close()
+    server.stop()
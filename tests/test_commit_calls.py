@@ -0,0 +1,73 @@
+"""1件の保存がGitHub APIを何回呼ぶかのテスト（benchmarks/fake_github.py の偽サーバーを使う）"""
+import time
+from types import SimpleNamespace
+
+from src.utils import cache
+from src.utils import manifest as diary_index
+
+async def save(github_utils, author_name, author_id):
+    success, path = await github_utils.save_message_to_github(
+        None, author_name, "diary", content="今日の日記", author_id=author_id
+    )
+    assert success
+    return path
+
+COMMIT_CALLS = {
+    "get_ref": 1,
+    "get_commit": 1,
+    "create_tree": 1,
+    "create_commit": 1,
+    "update_ref": 1
+}
+
+def test_saving_one_entry_commits_with_five_calls(github):
+    server, github_utils = github.server, github.utils
+
+    async def run():
+        # 1回目はリポジトリやマニフェストの取得を含むので、その後の保存を数える
+        await save(github_utils, "user1", 1)
+        await github_utils.drain_write_queue()
+
+        path = await save(github_utils, "user2", 2)
+        server.reset_stats()
+        await github_utils.drain_write_queue()
+        return path
+
+    path = github.run(run())
+
+    assert server.stats()["calls"] == COMMIT_CALLS
+
+    # エントリとマニフェストの更新が同じコミットに入っている
+    repository = server.repository
+    files = repository.files_at()
+    assert path in files
+    manifest = diary_index.loads(repository.blobs[files[diary_index.MANIFEST_PATH]].decode('utf-8'))
+    assert path in [item["path"] for item in diary_index.items_for_date(manifest, path.split('/')[1])]
+
+def test_saving_after_cache_expires_reuses_committed_manifest(github, monkeypatch):
+    server, github_utils = github.server, github.utils
+
+    async def run():
+        await save(github_utils, "user3", 3)
+        await github_utils.drain_write_queue()
+
+        path = await save(github_utils, "user4", 4)
+        # 読み込みキャッシュの期限が切れた後にコミットする
+        ttl = github_utils._read_cache.ttl
+        monkeypatch.setattr(cache, "time", SimpleNamespace(monotonic=lambda: time.monotonic() + ttl + 1))
+        server.reset_stats()
+        await github_utils.drain_write_queue()
+        return path
+
+    path = github.run(run())
+
+    # マニフェストを取り直さずに前のコミットのものを使う
+    assert server.stats()["calls"] == COMMIT_CALLS
+
+    repository = server.repository
+    files = repository.files_at()
+    manifest = diary_index.loads(repository.blobs[files[diary_index.MANIFEST_PATH]].decode('utf-8'))
+    items = diary_index.items_for_date(manifest, path.split('/')[1])
+    assert path in [item["path"] for item in items]
+    # 前のコミットで追加したエントリも残っている
+    assert any('/user3_' in item["path"] for item in items)
@@ -0,0 +1,26 @@
+"""期間指定の読み込みがGitHubから取得する量のテスト"""
+import datetime
+
+def test_cold_date_range_fetches_only_entries_in_range(github):
+    server, github_utils = github.server, github.utils
+
+    # 200日分（3日に1日は書いていない）の日記を入れる
+    changes = {}
+    start = datetime.date(2020, 1, 1)
+    for day in range(200):
+        date = start + datetime.timedelta(days=day)
+        if day % 3 == 2:
+            continue
+        for author in ("alice", "bob"):
+            changes[f"diary/{date}/{author}_{date:%Y%m%d}120000.md"] = f"# {author}の日記エントリ\n\n## 内容\n{date} {author}\n"
+    server.repository.commit_files(changes, "Seed diary")
+    expected = sorted(path for path in changes if "2020-03-01" <= path.split('/')[1] <= "2020-03-07")
+
+    server.reset_stats()
+    success, entries = github.run(github_utils.get_diary_by_date_range("2020-03-01", "2020-03-07"))
+
+    assert success
+    assert sorted(entry['path'] for entry in entries) == expected
+    assert [entry['content'] for entry in entries] == [changes[entry['path']] for entry in entries]
+    # ミラー全体は同期せず、範囲内のエントリのblobだけ取得する
+    assert server.stats()["calls"].get("get_blob", 0) == len(expected)
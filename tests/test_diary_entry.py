@@ -0,0 +1,162 @@
+"""日記エントリのセクション編集（置き換え・追記・挿入）のテスト
+
+ランダムに作ったエントリを編集し、読み直した結果が期待どおりかを確かめる。
+シードを固定しているので、失敗したときは同じシードで再現できる。
+"""
+import random
+
+import pytest
+
+from src.utils.diary_entry import author_id_line, parse
+
+SEEDS = range(200)
+
+SECTION_NAMES = ['日時', 'チャンネル', '内容', '会話', '感想', 'メモ', 'Todo']
+
+# 本文に使う行（「## 」で始まる行は見出しになるので使わない）
+BODY_LINES = [
+    '', '', '今日は晴れ', 'カレーを食べた', '  字下げした行', '### 小見出し',
+    '# 行頭のシャープ', '- 箇条書き', 'code: x = 1', '##見出しではない', '\t', '最後の行'
+]
+
+def random_body(rng, max_lines=6):
+    return '\n'.join(rng.choice(BODY_LINES) for _ in range(rng.randint(0, max_lines)))
+
+def random_entry(rng):
+    """タイトル・投稿者ID・セクションをランダムに組み合わせたエントリを作る"""
+    parts = []
+    if rng.random() < 0.9:
+        parts.append('# ユーザーの日記エントリ\n')
+    if rng.random() < 0.5:
+        parts.append(author_id_line(rng.randint(1, 10 ** 18)) + '\n')
+    parts.append('\n' * rng.randint(0, 2))
+
+    names = rng.sample(SECTION_NAMES, rng.randint(0, len(SECTION_NAMES)))
+    for name in names:
+        parts.append(f'## {name}\n{random_body(rng)}' + '\n' * rng.randint(1, 3))
+    text = ''.join(parts)
+    if rng.random() < 0.2:
+        # 末尾に改行がないエントリ
+        text = text.rstrip('\n')
+    return text
+
+def snapshot(text):
+    """編集の前後で比べる情報（タイトル・投稿者ID・セクションの順番と本文）"""
+    entry = parse(text)
+    return entry.title, entry.author_id, list(entry.sections())
+
+def without(sections, name):
+    return [section for section in sections if section[0] != name]
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_replace_section_round_trip(seed):
+    rng = random.Random(seed)
+    text = random_entry(rng)
+    name = rng.choice(SECTION_NAMES)
+    body = random_body(rng)
+    title, author_id, before = snapshot(text)
+    existed = parse(text).section_span(name) is not None
+
+    edited = parse(text).replace_section(name, body)
+    entry = parse(edited)
+
+    assert entry.section(name) == body.strip()
+    assert (entry.title, entry.author_id) == (title, author_id)
+    assert without(list(entry.sections()), name) == without(before, name)
+    if existed:
+        assert entry.section_names() == [section[0] for section in before]
+    else:
+        assert entry.section_names() == [section[0] for section in before] + [name]
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_replace_section_is_stable(seed):
+    # 同じ本文で置き換えても、もう一度置き換えても結果は変わらない
+    rng = random.Random(seed)
+    text = random_entry(rng)
+    name = rng.choice(SECTION_NAMES)
+    body = random_body(rng)
+
+    once = parse(text).replace_section(name, body)
+    twice = parse(once).replace_section(name, body)
+
+    assert twice == once
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_append_to_section_round_trip(seed):
+    rng = random.Random(seed)
+    text = random_entry(rng)
+    name = rng.choice(SECTION_NAMES)
+    body = random_body(rng)
+    title, author_id, before = snapshot(text)
+    current = parse(text).section(name)
+
+    edited = parse(text).append_to_section(name, body)
+    entry = parse(edited)
+
+    expected = f"{current}\n{body}" if current else body
+    assert entry.section(name) == expected.strip()
+    assert (entry.title, entry.author_id) == (title, author_id)
+    assert without(list(entry.sections()), name) == without(before, name)
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_insert_section_round_trip(seed):
+    rng = random.Random(seed)
+    text = random_entry(rng)
+    title, author_id, before = snapshot(text)
+    names = [section[0] for section in before]
+    after = rng.choice(names + [None])
+    body = random_body(rng)
+
+    edited = parse(text).insert_section('新しいセクション', body, after=after)
+    entry = parse(edited)
+
+    position = names.index(after) + 1 if after is not None else len(names)
+    assert entry.section_names() == names[:position] + ['新しいセクション'] + names[position:]
+    assert entry.section('新しいセクション') == body.strip()
+    assert (entry.title, entry.author_id) == (title, author_id)
+    assert without(list(entry.sections()), '新しいセクション') == before
+
+@pytest.mark.parametrize('seed', SEEDS)
+def test_keep_sections(seed):
+    rng = random.Random(seed)
+    text = random_entry(rng)
+    title, author_id, before = snapshot(text)
+    keep = set(rng.sample(SECTION_NAMES, rng.randint(0, len(SECTION_NAMES))))
+
+    entry = parse(parse(text).keep_sections(keep))
+
+    assert (entry.title, entry.author_id) == (title, author_id)
+    assert list(entry.sections()) == [section for section in before if section[0] in keep]
+
+def test_replace_content_with_blank_lines_keeps_following_sections():
+    # 以前の実装は空行の位置を lines.index('') で探していたため、最初の空行の位置と取り違えて
+    # 段落のある内容を置き換えると古い段落が残ったり、後ろのセクションが消えたりした
+    text = (
+        "# ユーザーの日記エントリ\n"
+        "\n"
+        "## 日時\n"
+        "2024-01-01 10:00\n"
+        "\n"
+        "## 内容\n"
+        "一段落目\n"
+        "\n"
+        "\n"
+        "二段落目\n"
+        "\n"
+        "三段落目\n"
+        "\n"
+        "## 感想\n"
+        "\n"
+        "楽しかった\n"
+    )
+    new_body = "新しい一段落目\n\n\n新しい二段落目"
+
+    edited = parse(text).replace_section('内容', new_body)
+    entry = parse(edited)
+
+    assert entry.section('内容') == new_body
+    assert entry.section('日時') == '2024-01-01 10:00'
+    assert entry.section('感想') == '楽しかった'
+    assert entry.section_names() == ['日時', '内容', '感想']
+    assert '段落目\n\n三段落目' not in edited
+    assert edited.endswith("新しい二段落目\n\n## 感想\n\n楽しかった\n")
@@ -0,0 +1,39 @@
+"""ETagで再検証するための応答キャッシュのテスト"""
+from types import SimpleNamespace
+
+from src.utils.github_http import ConditionalCache, _is_content_addressed
+
+def response(body, etag='"etag"'):
+    return SimpleNamespace(headers={"ETag": etag}, content=body.encode('utf-8'), text=body)
+
+def test_cache_evicts_by_total_bytes():
+    cache = ConditionalCache(100)
+    cache.store("a", response("a" * 40))
+    cache.store("b", response("b" * 40))
+    # 最近使ったものは残す
+    cache.revalidated("a", SimpleNamespace(headers={}))
+    cache.store("c", response("c" * 40))
+
+    assert cache.conditional_headers("a") == {"If-None-Match": '"etag"'}
+    assert cache.conditional_headers("b") == {}
+    assert cache.stats()["bytes"] == 80
+
+    # 上限より大きい応答は保存せず、同じキーの古い応答も捨てる
+    cache.store("c", response("c" * 101))
+    assert cache.conditional_headers("c") == {}
+    assert cache.stats()["bytes"] == 40
+    assert cache.stats()["size"] == 1
+
+def test_cache_counts_bytes_not_characters():
+    cache = ConditionalCache(100)
+    cache.store("a", response("日" * 30))
+    assert cache.stats()["bytes"] == 90
+
+def test_content_addressed_urls_are_not_cached():
+    sha = "0123456789abcdef0123456789abcdef01234567"
+    base = "https://api.github.com:443/repos/owner/diary"
+    assert _is_content_addressed(f"{base}/git/blobs/{sha}")
+    assert _is_content_addressed(f"{base}/git/trees/{sha}?recursive=1")
+    assert _is_content_addressed(f"{base}/git/commits/{sha}")
+    assert not _is_content_addressed(f"{base}/git/refs/heads/main")
+    assert not _is_content_addressed(f"{base}/contents/diary/index.json?ref={sha}")
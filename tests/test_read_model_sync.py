@@ -0,0 +1,36 @@
+"""読み取り用のデータベースの同期と作り直しのテスト"""
+import asyncio
+
+from src.utils import manifest as diary_index
+
+def test_rebuild_during_sync_leaves_complete_read_model(github, monkeypatch):
+    server, github_utils = github.server, github.utils
+    # 少しずつ反映させて、同期の途中で作り直しが始まるようにする
+    monkeypatch.setattr(github_utils, "READ_MODEL_CHUNK_SIZE", 10)
+    server.repository.commit_files({
+        f"diary/2021-05-{day:02d}/user{user}_202105{day:02d}090000.md":
+            f"# user{user}の日記エントリ\n\n## 内容\n{day}日目\n"
+        for day in range(1, 29) for user in range(4)
+    }, "Seed diary")
+
+    async def run():
+        await github_utils.drain_write_queue()
+        sync = asyncio.create_task(github_utils.sync_read_model())
+        for _ in range(10000):
+            if github_utils._read_model.count() > 0:
+                break
+            await asyncio.sleep(0.001)
+        assert not sync.done()
+
+        success, _ = await github_utils.rebuild_diary_index()
+        assert success
+        await sync
+        # 作り直しの後に同期しても、記録済みのコミットから変わっていなければ何もしない
+        await github_utils.sync_read_model()
+
+    github.run(run())
+
+    paths = {path for path in server.repository.files_at() if diary_index.is_entry_path(path)}
+    read_model = github_utils._read_model
+    assert read_model.head_sha == server.repository.head
+    assert set(read_model.indexed_shas()) == paths
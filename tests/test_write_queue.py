@@ -0,0 +1,72 @@
+"""書き込みキューのテスト（コミットは偽の関数で受ける）"""
+import asyncio
+import os
+
+from src.utils.write_queue import WriteQueue
+
+class FakeCommitter:
+    """コミットされた変更を記録する（fail_next回だけ失敗させ、releaseが来るまで待たせられる）"""
+
+    def __init__(self, fail_next=0):
+        self.fail_next = fail_next
+        self.commits = []
+        self.started = asyncio.Event()
+        self.release = asyncio.Event()
+        self.release.set()
+
+    async def __call__(self, changes, message):
+        self.started.set()
+        await self.release.wait()
+        if self.fail_next:
+            self.fail_next -= 1
+            raise RuntimeError("commit failed")
+        self.commits.append(dict(changes))
+
+async def delete_while_create_in_flight(tmp_path, fail_next):
+    committer = FakeCommitter(fail_next)
+    committer.release.clear()
+    queue = WriteQueue(os.path.join(tmp_path, "write_queue.wal"), 600, committer, retry_delay=0)
+
+    await queue.enqueue("diary/2024-01-01/a.md", "内容", "Add", new_file=True)
+    drain = asyncio.create_task(queue.drain())
+    await committer.started.wait()
+
+    # 作成のコミット中に削除する
+    await queue.enqueue("diary/2024-01-01/a.md", None, "Delete")
+    committer.release.set()
+    await drain
+    return queue, committer
+
+def test_delete_during_failed_create_cancels_both(tmp_path):
+    queue, committer = asyncio.run(delete_while_create_in_flight(tmp_path, fail_next=1))
+
+    # 作成はコミットできなかったので、存在しないパスの削除は送らない
+    assert committer.commits == []
+    assert queue.depth() == 0
+
+def test_delete_during_successful_create_is_committed(tmp_path):
+    queue, committer = asyncio.run(delete_while_create_in_flight(tmp_path, fail_next=0))
+
+    assert committer.commits == [
+        {"diary/2024-01-01/a.md": "内容"},
+        {"diary/2024-01-01/a.md": None}
+    ]
+    assert queue.depth() == 0
+
+def test_replayed_wal_cancels_create_and_delete(tmp_path):
+    async def run():
+        wal_path = os.path.join(tmp_path, "write_queue.wal")
+        first = WriteQueue(wal_path, 600, FakeCommitter())
+        await first.enqueue("diary/2024-01-01/a.md", "内容", "Add", new_file=True)
+        await first.enqueue("diary/2024-01-01/a.md", None, "Delete")
+        first._flush_task.cancel()
+
+        committer = FakeCommitter()
+        replayed = WriteQueue(wal_path, 600, committer)
+        await replayed.start()
+        return replayed, committer
+
+    replayed, committer = asyncio.run(run())
+
+    assert replayed.depth() == 0
+    assert committer.commits == []